@@ -1,5 +1,20 @@
 from django.contrib import admin
-from .models import Profile, UserSettings, Notification, MetalPrice, FxRate
+from .models import Profile, UserSettings, Notification, MetalPrice, FxRate, MetalPriceDaily, FxRateDaily
+from .rates import bump_rates_generation
+
+class RatesInvalidationMixin:
+    """أي تعديل يدوي للأسعار يرفع جيل الأسعار حتى تعيد العمّال تحميل RateBook."""
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_rates_generation()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_rates_generation()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_rates_generation()
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -16,11 +31,21 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ("type", "priority")
 
 @admin.register(MetalPrice)
-class MetalPriceAdmin(admin.ModelAdmin):
-    list_display = ("metal", "price_per_gram", "currency", "source", "fetched_at")
+class MetalPriceAdmin(RatesInvalidationMixin, admin.ModelAdmin):
+    list_display = ("metal", "price_per_gram", "currency", "source", "fetched_at", "last_confirmed_at")
     list_filter = ("metal", "currency", "source")
 
 @admin.register(FxRate)
-class FxRateAdmin(admin.ModelAdmin):
-    list_display = ("base", "quote", "rate", "source", "fetched_at")
+class FxRateAdmin(RatesInvalidationMixin, admin.ModelAdmin):
+    list_display = ("base", "quote", "rate", "source", "fetched_at", "last_confirmed_at")
     list_filter = ("base", "quote", "source")
+
+@admin.register(MetalPriceDaily)
+class MetalPriceDailyAdmin(admin.ModelAdmin):
+    list_display = ("metal", "currency", "day", "open", "high", "low", "close", "samples")
+    list_filter = ("metal", "currency")
+
+@admin.register(FxRateDaily)
+class FxRateDailyAdmin(admin.ModelAdmin):
+    list_display = ("base", "quote", "day", "open", "high", "low", "close", "samples")
+    list_filter = ("base", "quote")
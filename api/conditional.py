@@ -0,0 +1,57 @@
+# api/conditional.py
+"""
+طبقة GET الشرطية: نحسب مُحقِّقًا (ETag) رخيصًا قبل بناء الجسم المكلف،
+وإن طابق If-None-Match نرجع 304 مباشرة دون تشغيل كود التقييم.
+"""
+import hashlib
+from functools import wraps
+
+from rest_framework.response import Response
+
+
+def make_etag(prefix: str, *parts) -> str:
+    src = "|".join(str(p) for p in parts).encode("utf-8")
+    return f"{prefix}-" + hashlib.sha256(src).hexdigest()[:16]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """يدعم القيم المقتبسة/غير المقتبسة، W/ والقوائم المفصولة بفواصل و *."""
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    resp = Response(status=304)
+    resp["ETag"] = f'"{etag}"'
+    return resp
+
+
+def conditional_etag(etag_func):
+    """
+    ديكوريتر لدوال العرض (يوضع تحت @api_view حتى يكون request.user جاهزًا):
+        etag_func(request, *args, **kwargs) -> str | None
+    - إن طابق If-None-Match: 304 بدون استدعاء العرض.
+    - وإلا: نستدعي العرض ونضيف ETag للاستجابات الناجحة.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs)
+            request.etag = etag  # حتى لا يعيد العرض حسابه
+            if etag and etag_matches(request.headers.get("If-None-Match"), etag):
+                return not_modified(etag)
+            response = view(request, *args, **kwargs)
+            if etag and 200 <= response.status_code < 300 and not response.has_header("ETag"):
+                response["ETag"] = f'"{etag}"'
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,94 @@
+# api/hijri.py
+"""
+التقويم الهجري (أم القرى) بجداول في الذاكرة بدل إنشاء كائنات hijri_converter في كل نداء:
+- MONTH_START_ORDINALS: بداية كل شهر هجري كرقم ترتيبي ميلادي (date.toordinal) — من ummalqura.MONTH_STARTS.
+- _DAY_MONTH: لكل يوم ميلادي في النطاق فهرس شهره الهجري (array) => التحويل في الاتجاهين O(1).
+- today_hijri: مخزّن حتى منتصف الليل المحلي التالي (مقارنة طابع زمني واحدة لكل نداء).
+"""
+import time as _time
+from array import array
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.utils import timezone
+from hijri_converter import ummalqura
+
+_RJD_TO_ORDINAL = 2400000 - 1721425  # rjd -> jdn -> ordinal (كما في hijri_converter.helpers)
+
+MONTH_START_ORDINALS = array("l", (rjd + _RJD_TO_ORDINAL for rjd in ummalqura.MONTH_STARTS))
+_FIRST_MONTH = ummalqura.HIJRI_OFFSET          # (year - 1) * 12 + (month - 1) لأول شهر في الجدول
+_FIRST_ORDINAL = MONTH_START_ORDINALS[0]
+_LAST_ORDINAL = MONTH_START_ORDINALS[-1] - 1   # العنصر الأخير حدّ: بداية الشهر الذي يلي النطاق
+_DAY_MONTH = array("H")
+for _i in range(len(MONTH_START_ORDINALS) - 1):
+    _DAY_MONTH.extend([_i] * (MONTH_START_ORDINALS[_i + 1] - MONTH_START_ORDINALS[_i]))
+del _i
+
+HIJRI_RANGE = ummalqura.HIJRI_RANGE
+GREGORIAN_RANGE = (date.fromordinal(_FIRST_ORDINAL), date.fromordinal(_LAST_ORDINAL))
+
+
+class HijriDate(NamedTuple):
+    year: int
+    month: int
+    day: int
+
+    def to_gregorian(self) -> date:
+        return to_gregorian(self.year, self.month, self.day)
+
+
+def _month_index(year: int, month: int) -> int:
+    index = (year - 1) * 12 + (month - 1) - _FIRST_MONTH
+    if not (1 <= month <= 12) or not (0 <= index < len(MONTH_START_ORDINALS) - 1):
+        raise ValueError(f"تاريخ هجري خارج النطاق المدعوم {HIJRI_RANGE}: {year}-{month}")
+    return index
+
+
+def month_length(year: int, month: int) -> int:
+    """29 أو 30."""
+    i = _month_index(year, month)
+    return MONTH_START_ORDINALS[i + 1] - MONTH_START_ORDINALS[i]
+
+
+def to_gregorian(year: int, month: int, day: int) -> date:
+    i = _month_index(year, month)
+    start = MONTH_START_ORDINALS[i]
+    if not (1 <= day <= MONTH_START_ORDINALS[i + 1] - start):
+        raise ValueError(f"يوم هجري غير صالح: {year}-{month}-{day}")
+    return date.fromordinal(start + day - 1)
+
+
+def to_hijri(g: date) -> HijriDate:
+    ordinal = g.toordinal()
+    if not (_FIRST_ORDINAL <= ordinal <= _LAST_ORDINAL):
+        raise ValueError(f"تاريخ ميلادي خارج النطاق المدعوم {GREGORIAN_RANGE}: {g}")
+    i = _DAY_MONTH[ordinal - _FIRST_ORDINAL]
+    months = i + _FIRST_MONTH
+    return HijriDate(months // 12 + 1, months % 12 + 1, ordinal - MONTH_START_ORDINALS[i] + 1)
+
+
+def add_one_hijri_year(h) -> HijriDate:
+    """نفس اليوم والشهر في السنة التالية؛ يوم 30 يصبح 29 إن كان الشهر هناك 29 يومًا."""
+    year = h.year + 1
+    return HijriDate(year, h.month, min(h.day, month_length(year, h.month)))
+
+
+@lru_cache(maxsize=4)
+def _hijri_on(day: date) -> HijriDate:
+    return to_hijri(day)
+
+
+_today = (None, 0.0)  # (HijriDate، طابع منتصف الليل المحلي التالي)
+
+
+def today_hijri() -> HijriDate:
+    """اليوم الهجري حسب التاريخ المحلي (TIME_ZONE)؛ يُعاد حسابه بعد منتصف الليل المحلي فقط."""
+    global _today
+    value, expires = _today
+    if value is None or _time.time() >= expires:
+        local = timezone.localtime()
+        midnight = datetime.combine(local.date() + timedelta(days=1), time.min, tzinfo=local.tzinfo)
+        value = _hijri_on(local.date())
+        _today = (value, midnight.timestamp())
+    return value
@@ -0,0 +1,52 @@
+# api/management/commands/bench_fetch_rates.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.providers import fetch_rates, store_rates
+from api.rates_stub import start_stub_server
+
+
+class Command(BaseCommand):
+    help = "قياس fetch_rates (تسلسلي مقابل متوازٍ) على خادم مزوّدين محلي بدون شبكة"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--latency", type=float, default=0.2,
+                            help="زمن استجابة الخادم المحلي لكل طلب (ثواني)")
+        parser.add_argument("--rounds", type=int, default=3, help="عدد مرات الجلب لكل وضع")
+        parser.add_argument("--workers", type=int, default=4, help="عدد الخيوط في الوضع المتوازي")
+        parser.add_argument("--provider", choices=["goldapi", "metalsapi"], default="goldapi")
+        parser.add_argument("--store", action="store_true",
+                            help="حفظ نتيجة آخر جولة في القاعدة (افتراضيًا لا كتابة)")
+
+    def handle(self, *args, **options):
+        server = start_stub_server(latency=options["latency"])
+        stub = dict(
+            ENABLE_FX_PROVIDER=True, ENABLE_METALS_PROVIDER=True,
+            METALS_PROVIDER_NAME=options["provider"],
+            FX_API_URL=server.url, GOLDAPI_URL=server.url, METALSAPI_URL=server.url,
+            RATES_HTTP_RETRIES=0,
+        )
+        self.stdout.write(f"stub={server.url} latency={options['latency']}s rounds={options['rounds']}")
+        fetched = None
+        try:
+            for label, workers in (("serial", 1), ("concurrent", options["workers"])):
+                with override_settings(RATES_FETCH_CONCURRENCY=workers, **stub):
+                    timings = []
+                    for _ in range(options["rounds"]):
+                        t0 = time.perf_counter()
+                        fetched = fetch_rates()
+                        timings.append(time.perf_counter() - t0)
+                best = min(timings)
+                avg = sum(timings) / len(timings)
+                self.stdout.write(f"{label:<10} workers={workers} best={best * 1000:.1f}ms "
+                                  f"avg={avg * 1000:.1f}ms fx={len(fetched['fx'])} "
+                                  f"metals={'yes' if fetched['metals'] else 'no'}")
+        finally:
+            server.shutdown()
+
+        if options["store"] and fetched:
+            with override_settings(**stub):
+                store_rates(fetched)
+            self.stdout.write(self.style.SUCCESS("تم حفظ نتيجة آخر جولة."))
@@ -0,0 +1,75 @@
+# api/management/commands/bench_hijri.py
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from hijri_converter import Gregorian, Hijri
+
+from api import hijri
+
+
+def _best(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "قياس تحويلات التقويم الهجري: api.hijri (جداول) مقابل كائنات hijri_converter"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--n", type=int, default=20000, help="عدد التواريخ في كل جولة")
+        parser.add_argument("--rounds", type=int, default=5, help="عدد الجولات لكل مسار (نأخذ الأفضل)")
+
+    def handle(self, *args, **options):
+        n, rounds = options["n"], options["rounds"]
+        rnd = random.Random(0)
+        start = date(1990, 1, 1)
+        days = [start + timedelta(days=rnd.randrange(0, 30000)) for _ in range(n)]
+        hdays = [hijri.to_hijri(d) for d in days]
+
+        # تحقق سريع من التطابق قبل القياس
+        for d, h in zip(days[:2000], hdays[:2000]):
+            ref = Gregorian(d.year, d.month, d.day).to_hijri()
+            assert tuple(h) == ref.datetuple(), (d, h, ref)
+            assert h.to_gregorian() == d
+
+        def legacy_g2h():
+            for d in days:
+                Gregorian(d.year, d.month, d.day).to_hijri()
+
+        def table_g2h():
+            for d in days:
+                hijri.to_hijri(d)
+
+        def legacy_h2g():
+            for y, m, dd in hdays:
+                Hijri(y, m, dd).to_gregorian()
+
+        def table_h2g():
+            for y, m, dd in hdays:
+                hijri.to_gregorian(y, m, dd)
+
+        def legacy_today():
+            for _ in range(n):
+                t = timezone.now().date()  # كما كان today_hijri في utils
+                Gregorian(t.year, t.month, t.day).to_hijri()
+
+        def table_today():
+            for _ in range(n):
+                hijri.today_hijri()
+
+        self.stdout.write(f"n={n} rounds={rounds}")
+        for label, legacy, table in (
+            ("gregorian->hijri", legacy_g2h, table_g2h),
+            ("hijri->gregorian", legacy_h2g, table_h2g),
+            ("today_hijri", legacy_today, table_today),
+        ):
+            a, b = _best(legacy, rounds), _best(table, rounds)
+            self.stdout.write(f"{label:<17} hijri_converter={a * 1e9 / n:8.0f}ns/op "
+                              f"api.hijri={b * 1e9 / n:8.0f}ns/op x{a / b:.1f}")
@@ -0,0 +1,40 @@
+# api/management/commands/build_portfolio_history.py
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from api.portfolio_history import materialize_portfolio_daily
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = "حساب قيمة المحفظة اليومية (PortfolioDaily) مع اللحاق من آخر يوم محسوب"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="معرّف مستخدم محدد (يمكن تكراره)")
+        parser.add_argument("--full", action="store_true", help="إعادة الحساب من أول معاملة")
+        parser.add_argument("--until", type=str, default=None, help="YYYY-MM-DD (افتراضيًا اليوم)")
+
+    def handle(self, *args, **options):
+        try:
+            until = date.fromisoformat(options["until"]) if options["until"] else None
+        except ValueError:
+            raise CommandError("صيغة --until غير صحيحة. استخدم YYYY-MM-DD.")
+
+        users = User.objects.filter(transactions__isnull=False).distinct().order_by("id")
+        if options["users"]:
+            users = User.objects.filter(id__in=options["users"]).order_by("id")
+
+        started = time.monotonic()
+        n_users = n_days = 0
+        for user in users.iterator():
+            try:
+                n_days += materialize_portfolio_daily(user, until=until, full=options["full"])
+                n_users += 1
+            except Exception as e:
+                self.stderr.write(f"Failed for user {user.id}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"تم تحديث سجل المحفظة: {n_users} مستخدم، {n_days} يوم خلال {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,31 @@
+# api/management/commands/prune_rates.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.rate_history import prune_rate_history
+
+class Command(BaseCommand):
+    help = "دمج أسعار الصرف/المعادن الخام القديمة في ملخصات يومية (OHLC) ثم حذفها على دفعات"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=None,
+                            help="عدد أيام الخام المحتفظ بها (افتراضيًا RATES_RAW_RETENTION_DAYS)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="عدد الصفوف في كل دفعة")
+        parser.add_argument("--dry-run", action="store_true", help="عدّ الصفوف المؤهلة فقط دون تعديل")
+
+    def handle(self, *args, **options):
+        keep_days = options["keep_days"]
+        if keep_days is None:
+            keep_days = settings.RATES_RAW_RETENTION_DAYS
+        if keep_days < 1:
+            raise CommandError("--keep-days يجب أن يكون 1 على الأقل")
+        try:
+            result = prune_rate_history(keep_days, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        for kind, stats in result.items():
+            self.stdout.write(f"{kind}: rows={stats['rows']} batches={stats['batches']}")
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("فحص فقط: لم يُحذف شيء."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"تم دمج وتقليم الأسعار الأقدم من {keep_days} يومًا."))
@@ -0,0 +1,26 @@
+# api/management/commands/rebuild_holdings.py
+from django.core.management.base import BaseCommand
+from api.utils import rebuild_holdings_for
+
+class Command(BaseCommand):
+    help = "إعادة بناء دفتر الأرصدة (HoldingBalance) من المعاملات وفحص الانحراف"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="فحص الانحراف فقط دون إعادة الكتابة")
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="معرّف مستخدم محدد (يمكن تكراره)")
+
+    def handle(self, *args, **options):
+        drift = rebuild_holdings_for(options["users"], dry_run=options["check"])
+        for user_id, asset, karat, cc, stored, expected in drift:
+            self.stdout.write(f"drift user={user_id} {asset} karat={karat} cc={cc or '-'}: "
+                              f"stored={stored} expected={expected}")
+
+        if options["check"]:
+            if drift:
+                self.stderr.write(self.style.ERROR(f"تم العثور على {len(drift)} انحراف في الدفتر."))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS("الدفتر مطابق للمعاملات."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"تمت إعادة بناء الدفتر (صُحِّح {len(drift)} انحراف)."))
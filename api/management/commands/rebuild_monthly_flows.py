@@ -0,0 +1,14 @@
+# api/management/commands/rebuild_monthly_flows.py
+from django.core.management.base import BaseCommand
+from api.utils import rebuild_monthly_flows_for
+
+class Command(BaseCommand):
+    help = "إعادة بناء الملخص الشهري (UserMonthlyFlow) من المعاملات"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="معرّف مستخدم محدد (يمكن تكراره)")
+
+    def handle(self, *args, **options):
+        rows = rebuild_monthly_flows_for(options["users"])
+        self.stdout.write(self.style.SUCCESS(f"تمت إعادة بناء الملخص الشهري ({rows} صف)."))
@@ -1,17 +1,116 @@
 # api/management/commands/sync_zakat.py
-from django.core.management.base import BaseCommand
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from api.utils import update_zakat_anchors_and_reminders
+from django.db import connections
+from django.db.models.functions import Mod
+from django.utils import timezone
+from api.models import ZakatSyncRun, ZakatDirtyUser
+from api.utils import dispatch_due_reminders
+from api.zakat_sync import init_worker, sync_users
 
 User = get_user_model()
 
 class Command(BaseCommand):
-    help = "تحديث نقاط الحَول وتوليد تذكيرات الزكاة لجميع المستخدمين"
+    help = ("تحديث نقاط الحَول (افتراضيًا لمن في طابور ZakatDirtyUser فقط، أو للجميع مع --all) "
+            "ثم إرسال كل التذكيرات المستحقة من ReminderSchedule")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="مسح كل المستخدمين بدل طابور ZakatDirtyUser")
+        parser.add_argument("--workers", type=int, default=1, help="عدد العمليات المتوازية (1 = داخل العملية)")
+        parser.add_argument("--shard", type=str, default="0/1",
+                            help="i/n: معالجة المستخدمين الذين id %% n == i فقط (للتوزيع على عدة أجهزة)")
+        parser.add_argument("--chunk-size", type=int, default=500, help="عدد المستخدمين في كل دفعة")
+        parser.add_argument("--restart", action="store_true",
+                            help="تجاهل نقطة الاستئناف لتشغيل سابق لم يكتمل والبدء من جديد")
+
+    def _parse_shard(self, value):
+        try:
+            i, n = (int(x) for x in value.split("/"))
+        except ValueError:
+            raise CommandError("--shard يجب أن يكون بالشكل i/n مثل 0/4")
+        if n < 1 or not (0 <= i < n):
+            raise CommandError("--shard: يجب أن يكون 0 <= i < n")
+        return i, n
+
+    def _chunks(self, ids, size):
+        chunk = []
+        for uid in ids:
+            chunk.append(uid)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
     def handle(self, *args, **options):
-        for user in User.objects.all():
-            try:
-                update_zakat_anchors_and_reminders(user)
-            except Exception as e:
-                self.stderr.write(f"Failed for user {user.id}: {e}")
+        shard_i, shard_n = self._parse_shard(options["shard"])
+        workers = max(1, options["workers"])
+        mode = "all" if options["all"] else "dirty"
+
+        # استئناف آخر تشغيل غير مكتمل لنفس الـ shard والوضع (إن وجد)
+        run = None
+        if not options["restart"]:
+            run = (ZakatSyncRun.objects.filter(mode=mode, shard_index=shard_i, shard_count=shard_n,
+                                               finished_at__isnull=True)
+                   .order_by("-started_at").first())
+        if run is None:
+            run = ZakatSyncRun.objects.create(mode=mode, shard_index=shard_i, shard_count=shard_n)
+        else:
+            self.stdout.write(f"استئناف التشغيل #{run.pk} بعد المستخدم {run.last_user_id}")
+        resumed_from = run.processed + run.failed
+
+        # الطابور يُقرأ كما كان عند بدء التشغيل؛ ومن عولج يُحذف منه (في الوضعين)
+        dirty_before = run.started_at
+        ids = User.objects.filter(id__gt=run.last_user_id).order_by("id")
+        if mode == "dirty":
+            ids = ids.filter(id__in=ZakatDirtyUser.objects.filter(marked_at__lte=dirty_before).values("user_id"))
+        if shard_n > 1:
+            ids = ids.annotate(shard=Mod("id", shard_n)).filter(shard=shard_i)
+        chunks = self._chunks(ids.values_list("id", flat=True).iterator(chunk_size=options["chunk_size"]),
+                              options["chunk_size"])
+
+        started = time.monotonic()
+
+        def record(result):
+            # نقطة الاستئناف تتقدم بترتيب الدفعات فقط (FIFO) فتبقى متصلة
+            for user_id, message in result["errors"]:
+                self.stderr.write(f"Failed for user {user_id}: {message}")
+            run.last_user_id = result["last_id"]
+            run.processed += result["processed"]
+            run.failed += result["failed"]
+            run.save(update_fields=["last_user_id", "processed", "failed", "updated_at"])
+
+        if workers == 1:
+            for chunk in chunks:
+                record(sync_users(chunk, dirty_before))
+        else:
+            # spawn: كل عملية تفتح اتصالاتها بنفسها (لا نرث مقابس القاعدة من الأب)
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.submit(sync_users, chunk, dirty_before))
+                    while len(in_flight) >= workers * 2:
+                        record(in_flight.popleft().result())
+                while in_flight:
+                    record(in_flight.popleft().result())
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=["finished_at", "updated_at"])
+        connections.close_all()
+        # استعلام نطاق واحد على fire_at (آمن مع عدة shards متزامنة: skip_locked)
+        sent = dispatch_due_reminders(batch_size=options["chunk_size"])
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        done = run.processed + run.failed - resumed_from
+        self.stdout.write(
+            f"run=#{run.pk} mode={mode} shard={shard_i}/{shard_n} workers={workers} users={done} "
+            f"failed={run.failed} elapsed={elapsed:.1f}s throughput={done / elapsed:.1f} users/s reminders={sent}"
+        )
         self.stdout.write(self.style.SUCCESS("تم تحديث تذكيرات الزكاة."))
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:59
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_holdings(apps, schema_editor):
+    """تعبئة الدفتر من المعاملات الفعالة الحالية."""
+    Transaction = apps.get_model("api", "Transaction")
+    HoldingBalance = apps.get_model("api", "HoldingBalance")
+    balances = {}
+    for tx in Transaction.objects.filter(soft_deleted_at__isnull=True).iterator():
+        if tx.asset_type == "CASH":
+            key = (tx.user_id, "CASH", 0, (tx.currency_code or "").upper())
+            qty = tx.amount
+        elif tx.asset_type == "GOLD":
+            key = (tx.user_id, "GOLD", int(tx.karat or 0), "")
+            qty = tx.weight_g
+        else:
+            key = (tx.user_id, tx.asset_type, 0, "")
+            qty = tx.weight_g
+        if qty is None:
+            continue
+        sign = Decimal("1") if tx.operation_type == "ADD" else Decimal("-1")
+        balances[key] = balances.get(key, Decimal("0")) + sign * qty
+    HoldingBalance.objects.bulk_create([
+        HoldingBalance(user_id=k[0], asset_type=k[1], karat=k[2], currency_code=k[3], balance=v)
+        for k, v in balances.items() if v
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_notification_meta_key_zakatanchor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HoldingBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_type', models.CharField(choices=[('GOLD', 'GOLD'), ('SILVER', 'SILVER'), ('CASH', 'CASH')], max_length=6)),
+                ('karat', models.PositiveSmallIntegerField(default=0)),
+                ('currency_code', models.CharField(blank=True, default='', max_length=3)),
+                ('balance', models.DecimalField(decimal_places=10, default=Decimal('0'), max_digits=24)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holding_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='holdingbalance',
+            constraint=models.UniqueConstraint(fields=('user', 'asset_type', 'karat', 'currency_code'), name='uniq_holding_balance_key'),
+        ),
+        migrations.RunPython(populate_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def init_section_versions(apps, schema_editor):
+    """كل الأقسام تُعتبر متغيرة عند النسخة الحالية لكل مستخدم."""
+    Profile = apps.get_model("api", "Profile")
+    v = models.F("snapshot_version")
+    Profile.objects.update(profile_version=v, settings_version=v, assets_version=v,
+                           transactions_version=v, notifications_version=v)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0005_holdingbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='assets_version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='notifications_version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='profile_version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='settings_version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='transactions_version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('transactions', 'transactions'), ('notifications', 'notifications')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_tombstones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'version'], name='api_synctom_user_id_c413ac_idx')],
+            },
+        ),
+        migrations.RunPython(init_section_versions, migrations.RunPython.noop),
+    ]
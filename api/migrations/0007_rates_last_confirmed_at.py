@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_profile_section_versions_synctombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fxrate',
+            name='last_confirmed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='metalprice',
+            name='last_confirmed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
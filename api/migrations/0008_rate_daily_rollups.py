@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_rates_last_confirmed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRateDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=3)),
+                ('quote', models.CharField(max_length=3)),
+                ('day', models.DateField()),
+                ('open', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('high', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('low', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('close', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('open_at', models.DateTimeField()),
+                ('close_at', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetalPriceDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metal', models.CharField(choices=[('GOLD', 'GOLD'), ('SILVER', 'SILVER')], max_length=10)),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('day', models.DateField()),
+                ('open', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('high', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('low', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('close', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('open_at', models.DateTimeField()),
+                ('close_at', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metalpricedaily',
+            constraint=models.UniqueConstraint(fields=('metal', 'currency', 'day'), name='uniq_metalprice_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='fxratedaily',
+            constraint=models.UniqueConstraint(fields=('base', 'quote', 'day'), name='uniq_fxrate_daily'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:12
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_monthly_flows(apps, schema_editor):
+    """تعبئة الملخص الشهري من المعاملات الفعالة الحالية."""
+    Transaction = apps.get_model("api", "Transaction")
+    UserMonthlyFlow = apps.get_model("api", "UserMonthlyFlow")
+    flows = {}
+    for tx in Transaction.objects.filter(soft_deleted_at__isnull=True).iterator():
+        qty = tx.amount if tx.asset_type == "CASH" else tx.weight_g
+        if qty is None:
+            continue
+        karat = int(tx.karat or 0) if tx.asset_type == "GOLD" else 0
+        cc = (tx.currency_code or "").upper() if tx.asset_type == "CASH" else ""
+        key = (tx.user_id, tx.date.replace(day=1), tx.asset_type, tx.operation_type, karat, cc)
+        q, n = flows.get(key, (Decimal("0"), 0))
+        flows[key] = (q + qty, n + 1)
+    UserMonthlyFlow.objects.bulk_create([
+        UserMonthlyFlow(user_id=k[0], month=k[1], asset_type=k[2], operation_type=k[3],
+                        karat=k[4], currency_code=k[5], quantity=q, tx_count=n)
+        for k, (q, n) in flows.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0008_rate_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMonthlyFlow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('asset_type', models.CharField(choices=[('GOLD', 'GOLD'), ('SILVER', 'SILVER'), ('CASH', 'CASH')], max_length=6)),
+                ('operation_type', models.CharField(choices=[('ADD', 'ADD'), ('WITHDRAW', 'WITHDRAW'), ('ZAKAT', 'ZAKAT')], max_length=8)),
+                ('karat', models.PositiveSmallIntegerField(default=0)),
+                ('currency_code', models.CharField(blank=True, default='', max_length=3)),
+                ('quantity', models.DecimalField(decimal_places=10, default=Decimal('0'), max_digits=24)),
+                ('tx_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_flows', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'month'], name='api_usermon_user_id_872255_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usermonthlyflow',
+            constraint=models.UniqueConstraint(fields=('user', 'month', 'asset_type', 'operation_type', 'karat', 'currency_code'), name='uniq_user_monthly_flow'),
+        ),
+        migrations.RunPython(populate_monthly_flows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:14
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_usermonthlyflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('gold_pure_g', models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=24)),
+                ('silver_g', models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=24)),
+                ('gold_value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('silver_value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('cash_value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('total_value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='portfoliodaily',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='uniq_portfolio_daily'),
+        ),
+    ]
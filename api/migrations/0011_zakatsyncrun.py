@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_portfoliodaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZakatSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_index', models.PositiveIntegerField(default=0)),
+                ('shard_count', models.PositiveIntegerField(default=1)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shard_index', 'shard_count', '-started_at'], name='api_zakatsy_shard_i_d2aacc_idx')],
+            },
+        ),
+    ]
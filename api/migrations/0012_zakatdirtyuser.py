@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0011_zakatsyncrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zakatsyncrun',
+            name='mode',
+            field=models.CharField(choices=[('dirty', 'dirty'), ('all', 'all')], default='all', max_length=8),
+            preserve_default=False,  # التشغيلات السابقة كانت تمسح كل المستخدمين
+        ),
+        migrations.AlterField(
+            model_name='zakatsyncrun',
+            name='mode',
+            field=models.CharField(choices=[('dirty', 'dirty'), ('all', 'all')], default='dirty', max_length=8),
+        ),
+        migrations.CreateModel(
+            name='ZakatDirtyUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(default='holdings', max_length=20)),
+                ('marked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='zakat_dirty', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['marked_at'], name='api_zakatdi_marked__dd5c36_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def enqueue_active_anchors(apps, schema_editor):
+    # الأحوال المثبتة قبل due_date: يكملها sync_zakat (_ensure_anchor) ويولّد جدول تذكيراتها
+    ZakatAnchor = apps.get_model("api", "ZakatAnchor")
+    ZakatDirtyUser = apps.get_model("api", "ZakatDirtyUser")
+    user_ids = (ZakatAnchor.objects.filter(status="ACTIVE", start_hijri_year__isnull=False)
+                .order_by().values_list("user_id", flat=True).distinct())
+    now = django.utils.timezone.now()
+    ZakatDirtyUser.objects.bulk_create(
+        [ZakatDirtyUser(user_id=uid, reason="reminders", marked_at=now) for uid in user_ids],
+        ignore_conflicts=True, batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0012_zakatdirtyuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zakatanchor',
+            name='due_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReminderSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=8)),
+                ('fire_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('title', models.CharField(max_length=120)),
+                ('body', models.CharField(blank=True, default='', max_length=280)),
+                ('priority', models.CharField(default='important', max_length=10)),
+                ('meta_key', models.CharField(max_length=120)),
+                ('anchor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='api.zakatanchor')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zakat_reminders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['fire_at'], name='reminder_pending_fire_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reminderschedule',
+            constraint=models.UniqueConstraint(fields=('anchor', 'meta_key'), name='uniq_reminder_anchor_meta'),
+        ),
+        migrations.RunPython(enqueue_active_anchors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:26
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_meta_keys(apps, schema_editor):
+    # قبل القيد: نُبقي أقدم إشعار لكل (user, meta_key) مكرّر (من سباقات _notify_once السابقة)
+    Notification = apps.get_model("api", "Notification")
+    dupes = (Notification.objects.exclude(meta_key="").values("user_id", "meta_key")
+             .annotate(n=Count("id"), keep=Min("id")).filter(n__gt=1).order_by())
+    for row in dupes.iterator():
+        (Notification.objects.filter(user_id=row["user_id"], meta_key=row["meta_key"])
+         .exclude(id=row["keep"]).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_reminderschedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_meta_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('meta_key', ''), _negated=True), fields=('user', 'meta_key'), name='uniq_notification_user_meta'),
+        ),
+    ]
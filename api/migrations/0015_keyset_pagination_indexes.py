@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_notification_unique_meta_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'id'], name='api_notific_user_id_fa9ca0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_notific_user_id_1e0a51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_transac_user_id_5e6e33_idx'),
+        ),
+        # الفهرس الأوسع أولًا ثم حذف (user, -created_at) الذي صار بادئة له
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='api_transac_user_id_893f16_idx',
+        ),
+    ]
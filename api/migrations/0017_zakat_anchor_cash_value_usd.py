@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_rates_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zakatanchor',
+            name='cash_value_usd',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=24, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_zakat_anchor_cash_value_usd'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='zakat_eval_stamp',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
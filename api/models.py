@@ -17,6 +17,14 @@ class Profile(models.Model):
 
     # عدّاد نسخة اللقطة (للتزامن)
     snapshot_version = models.PositiveBigIntegerField(default=1)
+    # آخر snapshot_version تغيّر فيها كل قسم (لإرسال الأقسام المتغيرة فقط)
+    profile_version = models.PositiveBigIntegerField(default=1)
+    settings_version = models.PositiveBigIntegerField(default=1)
+    assets_version = models.PositiveBigIntegerField(default=1)
+    transactions_version = models.PositiveBigIntegerField(default=1)
+    notifications_version = models.PositiveBigIntegerField(default=1)
+    # ختم آخر تقييم للزكاة (zakat_refresh): مشترك بين كل العمليات، ويُكتب بـ update() فلا يمس updated_at
+    zakat_eval_stamp = models.CharField(max_length=64, blank=True, default="")
     updated_at = models.DateTimeField(auto_now=True)
 
     def is_complete(self):
@@ -72,6 +80,15 @@ class Notification(models.Model):
     meta_key = models.CharField(max_length=120, blank=True, default="")
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "id"]),                   # notifications/delta (after_id)
+            models.Index(fields=["user", "-created_at", "-id"]),   # ترقيم السجل بالمؤشر
+        ]
+        constraints = [
+            # إشعار واحد لكل (مستخدم، meta_key) — يحمي من سباق heartbeat متزامنين، ويفهرس meta_key
+            models.UniqueConstraint(fields=["user", "meta_key"], condition=~models.Q(meta_key=""),
+                                    name="uniq_notification_user_meta"),
+        ]
 
     def mark_read(self):
         if not self.read_at:
@@ -88,6 +105,8 @@ class MetalPrice(models.Model):
     currency = models.CharField(max_length=3, default="USD")
     source = models.CharField(max_length=50, default="manual")  # manual/provider-name
     fetched_at = models.DateTimeField(default=timezone.now)
+    # آخر جلب أكّد نفس السعر (لا نُدرج صفًا جديدًا إن لم تتغير القيمة)
+    last_confirmed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [models.Index(fields=["metal", "-fetched_at"])]
@@ -100,11 +119,55 @@ class FxRate(models.Model):
     rate = models.DecimalField(max_digits=24, decimal_places=10)
     source = models.CharField(max_length=50, default="manual")
     fetched_at = models.DateTimeField(default=timezone.now)
+    last_confirmed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [models.Index(fields=["base", "quote", "-fetched_at"])]
         ordering = ["-fetched_at"]
 
+# === جيل الأسعار المشترك بين العمليات (cron fetch_rates وعمّال gunicorn) ===
+class RatesGeneration(models.Model):
+    """صف واحد (pk=1) يُرفع بعد أي تخزين/تعديل للأسعار فتعيد كل العمليات تحميل RateBook."""
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+# === ملخصات يومية (OHLC) للأسعار الخام القديمة بعد تقليمها ===
+class FxRateDaily(models.Model):
+    base = models.CharField(max_length=3)
+    quote = models.CharField(max_length=3)
+    day = models.DateField()
+    open = models.DecimalField(max_digits=24, decimal_places=10)
+    high = models.DecimalField(max_digits=24, decimal_places=10)
+    low = models.DecimalField(max_digits=24, decimal_places=10)
+    close = models.DecimalField(max_digits=24, decimal_places=10)
+    open_at = models.DateTimeField()   # fetched_at لأول عيّنة (لدمج الدفعات بالترتيب الصحيح)
+    close_at = models.DateTimeField()  # fetched_at لآخر عيّنة
+    samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["base", "quote", "day"], name="uniq_fxrate_daily"),
+        ]
+        ordering = ["-day"]
+
+class MetalPriceDaily(models.Model):
+    metal = models.CharField(max_length=10, choices=MetalPrice.METAL_CHOICES)
+    currency = models.CharField(max_length=3, default="USD")
+    day = models.DateField()
+    open = models.DecimalField(max_digits=18, decimal_places=6)
+    high = models.DecimalField(max_digits=18, decimal_places=6)
+    low = models.DecimalField(max_digits=18, decimal_places=6)
+    close = models.DecimalField(max_digits=18, decimal_places=6)
+    open_at = models.DateTimeField()
+    close_at = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["metal", "currency", "day"], name="uniq_metalprice_daily"),
+        ]
+        ordering = ["-day"]
+
 from decimal import Decimal
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -155,7 +218,7 @@ class Transaction(models.Model):
             models.Index(fields=["user", "asset_type"]),
             models.Index(fields=["user", "asset_type", "karat"]),
             models.Index(fields=["user", "asset_type", "currency_code"]),
-            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["user", "-created_at", "-id"]),  # recent + ترقيم التقارير بالمؤشر
         ]
 
     def is_active(self):
@@ -181,6 +244,77 @@ class Transaction(models.Model):
     def __str__(self):
         return f"Tx<{self.user_id} {self.asset_type} {self.operation_type}>"
 
+# ========= دفتر الأرصدة المُجمَّعة (يُحدَّث مع كل كتابة) =========
+class HoldingBalance(models.Model):
+    """
+    رصيد مجمّع لكل (مستخدم، نوع أصل، عيار، عملة) من المعاملات الفعالة.
+    karat = 0 لغير الذهب، و currency_code = "" لغير النقد (حتى يعمل القيد الفريد).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="holding_balances")
+    asset_type = models.CharField(max_length=6, choices=ASSET_TYPES)
+    karat = models.PositiveSmallIntegerField(default=0)
+    currency_code = models.CharField(max_length=3, blank=True, default="")
+    balance = models.DecimalField(max_digits=24, decimal_places=10, default=Decimal("0"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "asset_type", "karat", "currency_code"],
+                                    name="uniq_holding_balance_key"),
+        ]
+
+    def __str__(self):
+        return f"Holding<{self.user_id} {self.asset_type} {self.karat} {self.currency_code}={self.balance}>"
+
+# ========= ملخص الحركة الشهرية (للتقارير طويلة المدى) =========
+class UserMonthlyFlow(models.Model):
+    """
+    مجموع المعاملات الفعالة لكل (مستخدم، شهر، نوع أصل، عملية، عيار، عملة).
+    quantity = مبلغ للنقد أو وزن بالغرام (موجب دائمًا). يُحدَّث مع كل كتابة ويمكن إعادة بنائه.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="monthly_flows")
+    month = models.DateField()  # أول يوم في الشهر
+    asset_type = models.CharField(max_length=6, choices=ASSET_TYPES)
+    operation_type = models.CharField(max_length=8, choices=OP_TYPES)
+    karat = models.PositiveSmallIntegerField(default=0)
+    currency_code = models.CharField(max_length=3, blank=True, default="")
+    quantity = models.DecimalField(max_digits=24, decimal_places=10, default=Decimal("0"))
+    tx_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "month", "asset_type", "operation_type", "karat", "currency_code"],
+                                    name="uniq_user_monthly_flow"),
+        ]
+        indexes = [models.Index(fields=["user", "month"])]
+
+    def __str__(self):
+        return f"Flow<{self.user_id} {self.month:%Y-%m} {self.operation_type} {self.asset_type} {self.karat} {self.currency_code}>"
+
+# ========= قيمة المحفظة اليومية (تُملأ بأمر build_portfolio_history) =========
+class PortfolioDaily(models.Model):
+    """
+    قيمة محفظة المستخدم في نهاية كل يوم بعملة الأساس (FX_BASE_CURRENCY) وبالأسعار السارية يومها.
+    تُحذف الأيام >= تاريخ أي معاملة تُكتب/تُؤرشف، فيعيد الأمر حسابها من هناك.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="portfolio_daily")
+    day = models.DateField()
+    currency = models.CharField(max_length=3, default="USD")
+    gold_pure_g = models.DecimalField(max_digits=24, decimal_places=6, default=Decimal("0"))
+    silver_g = models.DecimalField(max_digits=24, decimal_places=6, default=Decimal("0"))
+    gold_value = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal("0"))
+    silver_value = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal("0"))
+    cash_value = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal("0"))
+    total_value = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal("0"))
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day"], name="uniq_portfolio_daily"),
+        ]
+        ordering = ["day"]
+
 class ZakatAnchor(models.Model):
     GROUP_CHOICES = (
         ("GOLD_PURE", "GOLD_PURE"),
@@ -195,10 +329,87 @@ class ZakatAnchor(models.Model):
     due_hijri_year = models.IntegerField(null=True, blank=True)
     due_hijri_month = models.IntegerField(null=True, blank=True)
     due_hijri_day = models.IntegerField(null=True, blank=True)
+    due_date = models.DateField(null=True, blank=True)  # الاستحقاق بالميلادي (يُحسب مرة عند التثبيت)
 
     status = models.CharField(max_length=20, default="ACTIVE")  # ACTIVE / RESET
+    # CASH_POOL فقط: قيمة النقد بالدولار (بأسعار المستخدم) عند آخر تقييم؛
+    # بها نعرف عند تغيّر سعر الذهب من قد ينقلب نصابه دون إعادة تقييم الجميع
+    cash_value_usd = models.DecimalField(max_digits=24, decimal_places=6, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = [("user", "asset_group")]
         indexes = [models.Index(fields=["user", "asset_group"])]
+
+class ReminderSchedule(models.Model):
+    """
+    مراحل تذكير حول مثبت (T-10/T-3/T0/T+3، أو ساعات وضع الاختبار) تُولَّد عند بدء الحول.
+    المُرسِل يلتقط fire_at <= now و sent_at فارغ، فلا يضيع تذكير إن لم يعمل يومًا ما.
+    """
+    anchor = models.ForeignKey(ZakatAnchor, on_delete=models.CASCADE, related_name="reminders")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="zakat_reminders")
+    stage = models.CharField(max_length=8)  # T-10 / T-3 / T0 / T+3 / H+6 ...
+    fire_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    title = models.CharField(max_length=120)
+    body = models.CharField(max_length=280, blank=True, default="")
+    priority = models.CharField(max_length=10, default="important")
+    meta_key = models.CharField(max_length=120)  # نفس meta_key الإشعار الناتج
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["anchor", "meta_key"], name="uniq_reminder_anchor_meta"),
+        ]
+        indexes = [
+            # المعلّقة فقط: فهرس صغير يبقى بحجم ما لم يُرسل بعد
+            models.Index(fields=["fire_at"], condition=models.Q(sent_at__isnull=True), name="reminder_pending_fire_idx"),
+        ]
+
+# ========= شواهد الحذف للتزامن التفاضلي =========
+class SyncTombstone(models.Model):
+    """عنصر أُزيل من قسم في اللقطة (مثل مناقلة محذوفة) عند نسخة معيّنة."""
+    SECTION_CHOICES = (
+        ("transactions", "transactions"),
+        ("notifications", "notifications"),
+    )
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sync_tombstones")
+    section = models.CharField(max_length=20, choices=SECTION_CHOICES)
+    object_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "version"])]
+
+# ========= نقاط استئناف أمر sync_zakat =========
+class ZakatSyncRun(models.Model):
+    """تشغيل لأمر sync_zakat لكل shard؛ last_user_id = كل المستخدمين حتى هذا المعرّف عولجوا."""
+    MODE_CHOICES = (("dirty", "dirty"), ("all", "all"))
+    mode = models.CharField(max_length=8, choices=MODE_CHOICES, default="dirty")
+    shard_index = models.PositiveIntegerField(default=0)
+    shard_count = models.PositiveIntegerField(default=1)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_user_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["shard_index", "shard_count", "-started_at"])]
+
+    def __str__(self):
+        return f"ZakatSyncRun<{self.shard_index}/{self.shard_count} @{self.last_user_id}>"
+
+# ========= طابور المستخدمين الذين يحتاجون إعادة تقييم الزكاة =========
+class ZakatDirtyUser(models.Model):
+    """
+    مستخدم تغيّر ما يؤثر على نصابه (معاملة، أو حركة أسعار تمس نقده) منذ آخر تقييم.
+    يُحذف بعد أن يعالجه sync_zakat (فقط إن لم يُعلَّم مجددًا أثناء التشغيل).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="zakat_dirty")
+    reason = models.CharField(max_length=20, default="holdings")  # holdings / rates
+    marked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["marked_at"])]
@@ -0,0 +1,145 @@
+# api/nisab_batch.py
+"""
+تقييم النصاب لدفعة مستخدمين معًا (لأمر sync_zakat بدل مستخدم-مستخدم):
+- الأرصدة لكل المستخدمين باستعلام مجمّع واحد (دفتر HoldingBalance أو تجميع Transaction)،
+  والإعدادات باستعلام واحد، ودفتر الأسعار (FxMatrix + سعر الذهب) مشترك بين الجميع.
+- معدّلات التحويل تُحسب مرة لكل (عملة، عملة عرض) لمن ليس لديه overrides.
+- تغييرات ZakatAnchor تُكتب بـ bulk_create/bulk_update وجدول التذكيرات بـ bulk_create واحد.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import HoldingBalance, ReminderSchedule, Transaction, UserSettings, ZakatAnchor
+from .utils import (
+    NISAB_GOLD_G, NISAB_SILVER_G, ValuationContext, _anchor_due_date, _get_gold_price_per_gram_in,
+    add_one_hijri_year, cash_value_usd, balances_from_transactions, reminder_schedule_for, today_hijri,
+)
+
+ANCHOR_GROUPS = ("GOLD_PURE", "SILVER", "CASH_POOL")
+ANCHOR_FIELDS = [
+    "start_hijri_year", "start_hijri_month", "start_hijri_day",
+    "due_hijri_year", "due_hijri_month", "due_hijri_day", "due_date", "status", "cash_value_usd", "updated_at",
+]
+
+
+def _load_balances(user_ids, source: str) -> dict:
+    """{user_id: {(asset_type, karat, currency_code): Decimal}} باستعلام واحد."""
+    out = defaultdict(dict)
+    if source == "transactions":
+        for (uid, *key), bal in balances_from_transactions(Transaction.objects.filter(user_id__in=user_ids)).items():
+            out[uid][tuple(key)] = bal
+    else:
+        rows = (HoldingBalance.objects.filter(user_id__in=user_ids)
+                .values_list("user_id", "asset_type", "karat", "currency_code", "balance"))
+        for uid, asset, karat, cc, bal in rows:
+            out[uid][(asset, karat, cc)] = bal
+    return out
+
+
+def evaluate_nisab_batch(user_ids, source: str = "ledger") -> dict:
+    """
+    {user_id: {"GOLD_PURE": bool, "SILVER": bool, "CASH_POOL": bool, "CASH_USD": Decimal | None}}
+    لكل المستخدمين معًا، بنفس قواعد meets_nisab_* و cash_nisab_position
+    (النقد مقابل قيمة 85g ذهب بعملة العرض، وقيمته بالدولار لحول CASH_POOL).
+    """
+    user_ids = list(user_ids)
+    balances = _load_balances(user_ids, source)
+    user_settings = {s.user_id: s for s in UserSettings.objects.filter(user_id__in=user_ids)}
+
+    gold_ppg = {}  # عملة العرض -> سعر غرام الذهب (لمن بلا overrides)
+    rates = {}     # (عملة، عملة العرض) -> معدّل
+
+    def shared(cache, key, compute):
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    results = {}
+    for uid in user_ids:
+        us = user_settings.get(uid) or UserSettings(user_id=uid)  # بلا صف => الإعدادات الافتراضية
+        ctx = ValuationContext(None, user_settings=us, balances=balances.get(uid, {}))
+        h = ctx.holdings
+        dc = ctx.display_currency
+        personal = bool(ctx.overrides)
+
+        cash_total = Decimal("0")
+        for w in h["cash_wallets"]:
+            cc = w["currency_code"]
+            rate = ctx.fx_rate(cc, dc) if personal else shared(rates, (cc, dc), lambda: ctx.fx_rate(cc, dc))
+            if rate:
+                cash_total += Decimal(w["balance"]) * rate
+
+        price = (_get_gold_price_per_gram_in(dc, None, ctx) if personal
+                 else shared(gold_ppg, dc, lambda: _get_gold_price_per_gram_in(dc, None, ctx)))
+        results[uid] = {
+            "GOLD_PURE": Decimal(h["gold_pure_g"]) >= NISAB_GOLD_G,
+            "SILVER": Decimal(h["silver_g"]) >= NISAB_SILVER_G,
+            "CASH_POOL": bool(price) and cash_total >= NISAB_GOLD_G * price,
+            "CASH_USD": cash_value_usd(cash_total, price, ctx) if price else None,
+        }
+    return results
+
+
+def apply_nisab_results(results: dict) -> dict:
+    """
+    يطبّق نتائج evaluate_nisab_batch على ZakatAnchor كما يفعل _ensure_anchor، لكن دفعة واحدة.
+    يرجع عدّادات {"created", "started", "reset"}.
+    """
+    if not results:
+        return {"created": 0, "started": 0, "reset": 0}
+    now = timezone.now()
+    h = today_hijri()
+    due = add_one_hijri_year(h)
+    start_fields = {
+        "start_hijri_year": h.year, "start_hijri_month": h.month, "start_hijri_day": h.day,
+        "due_hijri_year": due.year, "due_hijri_month": due.month, "due_hijri_day": due.day,
+    }
+    due_date = _anchor_due_date(ZakatAnchor(**start_fields))  # كل من يبدأ اليوم يستحق في نفس اليوم
+
+    existing = {(a.user_id, a.asset_group): a for a in ZakatAnchor.objects.filter(user_id__in=list(results))}
+    to_create, to_update, started, reset_ids = [], [], [], []
+    for uid, groups in results.items():
+        for group in ANCHOR_GROUPS:
+            meets = groups[group]
+            anc = existing.get((uid, group))
+            if anc is None:
+                anc = ZakatAnchor(user_id=uid, asset_group=group)
+                to_create.append(anc)
+            changed = False
+            if group == "CASH_POOL" and "CASH_USD" in groups and anc.cash_value_usd != groups["CASH_USD"]:
+                anc.cash_value_usd, changed = groups["CASH_USD"], True
+            if meets:
+                if not (anc.start_hijri_year and anc.start_hijri_month and anc.start_hijri_day):
+                    for name, value in start_fields.items():
+                        setattr(anc, name, value)
+                    anc.due_date, anc.status = due_date, "ACTIVE"
+                    started.append(anc)
+                    changed = True
+                elif anc.due_date is None:
+                    anc.due_date = _anchor_due_date(anc)
+                    started.append(anc)
+                    changed = True
+            elif anc.start_hijri_year:
+                anc.status = "RESET"
+                anc.start_hijri_year = anc.start_hijri_month = anc.start_hijri_day = None
+                anc.due_hijri_year = anc.due_hijri_month = anc.due_hijri_day = None
+                anc.due_date = None
+                reset_ids.append(anc.pk)
+                changed = True
+            if changed and anc.pk is not None:
+                anc.updated_at = now  # bulk_update لا يطبّق auto_now
+                to_update.append(anc)
+
+    with db_transaction.atomic():
+        ZakatAnchor.objects.bulk_create(to_create, batch_size=500)  # يملأ pk (RETURNING)
+        ZakatAnchor.objects.bulk_update(to_update, ANCHOR_FIELDS, batch_size=500)
+        if reset_ids:
+            ReminderSchedule.objects.filter(anchor_id__in=reset_ids, sent_at__isnull=True).delete()
+        ReminderSchedule.objects.bulk_create(
+            [row for anc in started for row in reminder_schedule_for(anc, now)],
+            ignore_conflicts=True, batch_size=1000,
+        )
+    return {"created": len(to_create), "started": len(started), "reset": len(reset_ids)}
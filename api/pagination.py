@@ -0,0 +1,66 @@
+# api/pagination.py
+"""
+ترقيم بالمؤشر (keyset) على (created_at, id) تنازليًا: كل صفحة = بحث نطاق على فهرس
+(user, -created_at, -id) بدل OFFSET، فالصفحة رقم 1000 بتكلفة الأولى.
+- المؤشر نص معتم (base64url لـ JSON) يحمل آخر/أول (created_at, id) والاتجاه.
+- العدد محدود: COUNT على أول PAGINATION_COUNT_CAP صف فقط (تكلفة ثابتة) مع علامة هل هو دقيق.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk, direction: str = "next") -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "i": pk, "d": direction[0]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str):
+    """(created_at, id, "next"|"prev")؛ ValueError إن كان المؤشر تالفًا."""
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), int(data["i"]), ("prev" if data.get("d") == "p" else "next")
+    except Exception:
+        raise ValueError("cursor غير صالح")
+
+
+def capped_count(qs, cap: int | None = None) -> tuple[int, bool]:
+    """(n, exact): يعدّ حتى cap صف فقط؛ exact=False إن بلغه (العدد الحقيقي >= n)."""
+    cap = cap or int(getattr(settings, "PAGINATION_COUNT_CAP", 1000))
+    n = qs.order_by()[:cap].count()
+    return n, n < cap
+
+
+def keyset_page(qs, cursor: str | None, page_size: int) -> dict:
+    """
+    صفحة من qs مرتبة (created_at desc, id desc).
+    يرجع {"items": [...], "next": cursor|None, "previous": cursor|None}.
+    """
+    direction = "next"
+    if cursor:
+        ts, pk, direction = decode_cursor(cursor)
+        if direction == "next":
+            qs = qs.filter(Q(created_at__lt=ts) | Q(created_at=ts, id__lt=pk))
+        else:
+            qs = qs.filter(Q(created_at__gt=ts) | Q(created_at=ts, id__gt=pk))
+
+    if direction == "next":
+        rows = list(qs.order_by("-created_at", "-id")[:page_size + 1])
+        more = len(rows) > page_size
+        items = rows[:page_size]
+        has_next, has_prev = more, bool(cursor)
+    else:
+        rows = list(qs.order_by("created_at", "id")[:page_size + 1])
+        more = len(rows) > page_size
+        items = list(reversed(rows[:page_size]))
+        has_next, has_prev = True, more
+
+    return {
+        "items": items,
+        "next": encode_cursor(items[-1].created_at, items[-1].pk) if items and has_next else None,
+        "previous": encode_cursor(items[0].created_at, items[0].pk, "prev") if items and has_prev else None,
+    }
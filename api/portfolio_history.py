@@ -0,0 +1,145 @@
+# api/portfolio_history.py
+"""
+سجل قيمة المحفظة اليومية (PortfolioDaily):
+- نمرّ على معاملات المستخدم مرة واحدة بترتيب التاريخ مع أرصدة جارية،
+  ونقيّم كل يوم بالأسعار السارية يومها (AsOfPrices: تحميل مسبق + بحث ثنائي).
+- اللحاق التدريجي: نبدأ من آخر يوم محسوب (نعيد حسابه لأنه قد يكون "اليوم" الجزئي).
+  كتابة/أرشفة أي معاملة تحذف الأيام >= تاريخها (انظر invalidate_portfolio_history).
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import PortfolioDaily, Transaction
+from .rate_history import AsOfPrices
+from .utils import ValuationContext, _holding_key, balances_from_transactions
+
+Q2 = Decimal("0.01")
+Q6 = Decimal("0.000001")
+
+
+def _value_day(balances: dict, asof: AsOfPrices, day, base: str) -> PortfolioDaily:
+    """يقيّم الأرصدة الجارية {(asset, karat, cc): qty} في اليوم day بعملة base."""
+    gold_pure = sum((qty * Decimal(karat) / Decimal(24) for (asset, karat, _), qty in balances.items()
+                     if asset == "GOLD" and karat in (18, 21, 24)), Decimal("0"))
+    silver = sum((qty for (asset, _, _), qty in balances.items() if asset == "SILVER"), Decimal("0"))
+
+    def metal_value(metal, grams):
+        point = asof.metal_price(metal, day) if grams else None
+        if point is None:
+            return Decimal("0")
+        rate = asof.fx_rate(point[1], base, day)
+        return grams * point[0] * rate if rate is not None else Decimal("0")
+
+    cash = Decimal("0")
+    for (asset, _, cc), qty in balances.items():
+        if asset == "CASH" and qty:
+            rate = asof.fx_rate(cc, base, day)
+            if rate is not None:
+                cash += qty * rate
+
+    gold_v, silver_v = metal_value("GOLD", gold_pure), metal_value("SILVER", silver)
+    return PortfolioDaily(
+        day=day, currency=base,
+        gold_pure_g=gold_pure.quantize(Q6), silver_g=silver.quantize(Q6),
+        gold_value=gold_v.quantize(Q2), silver_value=silver_v.quantize(Q2), cash_value=cash.quantize(Q2),
+        total_value=(gold_v + silver_v + cash).quantize(Q2),
+    )
+
+
+def materialize_portfolio_daily(user, until=None, full: bool = False, batch_size: int = 500) -> int:
+    """
+    يملأ PortfolioDaily للمستخدم حتى until (افتراضيًا اليوم المحلي). يرجع عدد الأيام المكتوبة.
+    full=True: إعادة حساب من أول معاملة.
+    """
+    until = until or timezone.localdate()
+    base = (getattr(settings, "FX_BASE_CURRENCY", "USD") or "USD").upper()
+    active = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True)
+
+    first_tx = active.aggregate(m=Min("date"))["m"]
+    if first_tx is None:
+        PortfolioDaily.objects.filter(user=user).delete()  # لا معاملات فعّالة => لا سجل
+        return 0
+    if first_tx > until:
+        return 0  # لا شيء قبل until؛ ما بعده (إن وُجد) ليس من شأن هذا التشغيل
+    last_done = None if full else PortfolioDaily.objects.filter(user=user).aggregate(m=Max("day"))["m"]
+    start = max(first_tx, last_done) if last_done else first_tx
+    if start > until:
+        return 0
+
+    # الأرصدة قبل start باستعلام مجمّع واحد، ثم المعاملات من start بالترتيب
+    balances = {
+        key[1:]: qty
+        for key, qty in balances_from_transactions(active.filter(date__lt=start)).items() if qty
+    }
+    rows = (active.filter(date__gte=start, date__lte=until)
+                  .order_by("date", "id")
+                  .values_list("date", "asset_type", "operation_type", "karat", "currency_code", "amount", "weight_g")
+                  .iterator())
+    currencies = set(active.filter(asset_type="CASH").order_by().values_list("currency_code", flat=True).distinct())
+    asof = AsOfPrices(start, until, currencies={c.upper() for c in currencies} | {base})
+
+    out = []
+    pending = next(rows, None)
+    day = start
+    while day <= until:
+        while pending is not None and pending[0] == day:
+            _, asset, op, karat, cc, amount, weight = pending
+            qty = amount if asset == "CASH" else weight
+            if qty is not None:
+                key = _holding_key(asset, karat, cc)
+                balances[key] = balances.get(key, Decimal("0")) + (qty if op == "ADD" else -qty)
+            pending = next(rows, None)
+        point = _value_day(balances, asof, day, base)
+        point.user = user
+        out.append(point)
+        day += timedelta(days=1)
+
+    with db_transaction.atomic():
+        PortfolioDaily.objects.filter(user=user, day__gte=start).delete()
+        PortfolioDaily.objects.bulk_create(out, batch_size=batch_size)
+    return len(out)
+
+
+def portfolio_history_in_display(user, date_from, date_to, display_currency: str | None = None, ctx=None) -> dict:
+    """
+    السلسلة المخزّنة محوّلة لعملة العرض بسعر صرف كل يوم (override المستخدم أولًا،
+    ثم AsOfPrices، ثم سعر اليوم إن لم يوجد سجل لذلك التاريخ).
+    """
+    ctx = ctx or ValuationContext(user)
+    cur = (display_currency or ctx.display_currency).upper()
+    rows = list(PortfolioDaily.objects.filter(user=user, day__gte=date_from, day__lte=date_to).order_by("day"))
+    asof = AsOfPrices(date_from, date_to, currencies={cur} | {r.currency for r in rows}) if rows else None
+
+    points = []
+    for r in rows:
+        rate = Decimal("1") if r.currency == cur else ctx._override(r.currency, cur)
+        if rate is None:
+            rate = asof.fx_rate(r.currency, cur, r.day)
+        if rate is None:
+            rate = ctx.fx_rate(r.currency, cur)
+
+        def conv(v):
+            return f"{(v * rate).quantize(Q2)}" if rate is not None else None
+
+        points.append({
+            "date": r.day.isoformat(),
+            "total_value": conv(r.total_value),
+            "gold_value": conv(r.gold_value),
+            "silver_value": conv(r.silver_value),
+            "cash_value": conv(r.cash_value),
+            "gold_pure_weight_g": f"{r.gold_pure_g}",
+            "silver_weight_g": f"{r.silver_g}",
+        })
+
+    return {
+        "display_currency": cur,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "last_computed_day": rows[-1].day.isoformat() if rows else None,
+        "points": points,
+    }
@@ -2,15 +2,74 @@
 from __future__ import annotations
 import time
 import math
+import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional, Tuple
 from django.conf import settings
+from django.db import transaction as db_transaction
 from django.utils import timezone
 from .models import MetalPrice, FxRate
+from .rates import bump_rates_generation, latest_fx_rows
+from .utils import mark_zakat_dirty_for_rates
+
+logger = logging.getLogger(__name__)
 
 OZ_TO_G = Decimal("31.1034768")  # تحويل الأونصة للغرام
 
+_adapter: Optional[HTTPAdapter] = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+
+def _shared_adapter() -> HTTPAdapter:
+    """مجمّع اتصالات واحد للعملية (مجمّعات urllib3 آمنة بين الخيوط)."""
+    global _adapter
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                size = getattr(settings, "RATES_HTTP_POOL_SIZE", 10)
+                _adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    return _adapter
+
+def http_session() -> requests.Session:
+    """
+    جلسة HTTP للمزوّدين: اتصالات keep-alive مُعاد استخدامها بدل TLS جديد لكل طلب.
+    requests.Session ليست آمنة بين الخيوط (cookies وحالة الطلب)، وfetch_rates يجلب من عدة خيوط:
+    لكل خيط جلسته، وكلها تركّب نفس HTTPAdapter فيبقى مجمّع الاتصالات مشتركًا.
+    """
+    s = getattr(_local, "session", None)
+    if s is None:
+        adapter = _shared_adapter()
+        s = requests.Session()
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        _local.session = s
+    return s
+
+def _call_or_exception(call):
+    try:
+        return call()
+    except Exception as e:
+        return e
+
+def run_concurrently(calls, workers: Optional[int] = None, return_exceptions: bool = False) -> list:
+    """
+    يشغّل دوال بلا معاملات معًا في thread pool ويعيد نتائجها بنفس الترتيب.
+    workers <= 1 => تسلسلي. أي استثناء يُرفع كما هو، إلا مع return_exceptions=True
+    فيُعاد الاستثناء مكان نتيجة دالته (بقية النتائج سليمة).
+    """
+    if return_exceptions:
+        calls = [lambda call=call: _call_or_exception(call) for call in calls]
+    workers = workers or getattr(settings, "RATES_FETCH_CONCURRENCY", 4)
+    if workers <= 1 or len(calls) <= 1:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=min(workers, len(calls)), thread_name_prefix="rates") as ex:
+        futures = [ex.submit(call) for call in calls]
+        return [f.result() for f in futures]
+
 class Http:
     @staticmethod
     def get(url, headers=None, params=None, timeout=None, retries=0):
@@ -18,7 +77,7 @@ class Http:
         last_exc = None
         for i in range(retries + 1):
             try:
-                r = requests.get(url, headers=headers or {}, params=params or {}, timeout=timeout)
+                r = http_session().get(url, headers=headers or {}, params=params or {}, timeout=timeout)
                 r.raise_for_status()
                 return r.json()
             except Exception as e:
@@ -41,7 +100,7 @@ class FxExchangerateHost(FxProviderBase):
     def fetch(self, base: str, targets: List[str]) -> List[Tuple[str, str, Decimal]]:
         if not targets:
             return []
-        url = "https://api.exchangerate.host/latest"
+        url = f"{settings.FX_API_URL.rstrip('/')}/latest"
         data = Http.get(url, params={"base": base, "symbols": ",".join(targets)},
                         retries=settings.RATES_HTTP_RETRIES)
         rates = data.get("rates") or {}
@@ -65,17 +124,17 @@ class MetalsGoldAPI(MetalsProviderBase):
     """
     def fetch_gold_silver_per_gram(self, currency: str) -> Dict[str, Decimal]:
         headers = {"x-access-token": settings.GOLDAPI_API_KEY} if settings.GOLDAPI_API_KEY else {}
+        root = settings.GOLDAPI_URL.rstrip("/")
         out = {"currency": currency}
-        # GOLD
-        gjson = Http.get(f"https://www.goldapi.io/api/XAU/{currency}", headers=headers,
-                         retries=settings.RATES_HTTP_RETRIES)
+        # GOLD + SILVER معًا
+        gjson, sjson = run_concurrently([
+            lambda: Http.get(f"{root}/api/XAU/{currency}", headers=headers, retries=settings.RATES_HTTP_RETRIES),
+            lambda: Http.get(f"{root}/api/XAG/{currency}", headers=headers, retries=settings.RATES_HTTP_RETRIES),
+        ])
         # price per ounce:
         gold_oz = Decimal(str(gjson.get("price", "0")))
         out["gold_g_per"] = (gold_oz / OZ_TO_G).quantize(Decimal("0.000001"))
 
-        # SILVER
-        sjson = Http.get(f"https://www.goldapi.io/api/XAG/{currency}", headers=headers,
-                         retries=settings.RATES_HTTP_RETRIES)
         silver_oz = Decimal(str(sjson.get("price", "0")))
         out["silver_g_per"] = (silver_oz / OZ_TO_G).quantize(Decimal("0.000001"))
         return out
@@ -92,7 +151,7 @@ class MetalsApiCom(MetalsProviderBase):
         key = settings.METALSAPI_ACCESS_KEY
         base = settings.METALSAPI_BASE or "USD"
         params = {"access_key": key, "base": base, "symbols": "XAU,XAG"}
-        data = Http.get("https://metals-api.com/api/latest", params=params,
+        data = Http.get(f"{settings.METALSAPI_URL.rstrip('/')}/api/latest", params=params,
                         retries=settings.RATES_HTTP_RETRIES)
         rates = data.get("rates") or {}
         # التفسير الشائع: 1 XAU = N base (أي "أونصة ذهب تساوي N من العملة الأساسية")
@@ -112,20 +171,74 @@ class MetalsApiCom(MetalsProviderBase):
         return out
 
 # ================= Storing helpers =================
-def store_fx_rates(pairs: List[Tuple[str, str, Decimal]], source: str):
+def _rate_tolerance() -> Decimal:
+    return Decimal(str(getattr(settings, "RATES_CHANGE_TOLERANCE", "0") or "0"))
+
+def _unchanged(old: Decimal, new: Decimal, tol: Decimal) -> bool:
+    """هل القيمة الجديدة مساوية للأحدث المخزّنة ضمن التسامح النسبي؟"""
+    if old == new:
+        return True
+    if tol <= 0 or not old:
+        return False
+    return abs(new - old) / abs(old) <= tol
+
+def store_fx_rates(pairs: List[Tuple[str, str, Decimal]], source: str) -> List[FxRate]:
+    """
+    كتابة دفعية واعية بالتغيير: صف جديد (bulk_create) فقط للأزواج التي تغيّر معدّلها،
+    والباقي نكتفي بتحديث last_confirmed_at لأحدث صف. يرجع الصفوف المُدرجة.
+    """
     now = timezone.now()
-    for base, quote, rate in pairs:
-        FxRate.objects.create(base=base.upper(), quote=quote.upper(), rate=rate, source=source, fetched_at=now)
+    tol = _rate_tolerance()
+    q = Decimal("0.0000000001")
+    incoming = {(b.upper(), qt.upper()): Decimal(str(rate)).quantize(q) for b, qt, rate in pairs}
+    if not incoming:
+        return []
+    latest = {(r.base, r.quote): r for r in latest_fx_rows(incoming.keys())}
+
+    new_rows, confirmed = [], []
+    for (base, quote), rate in incoming.items():
+        cur = latest.get((base, quote))
+        if cur is not None and _unchanged(cur.rate, rate, tol):
+            confirmed.append(cur.pk)
+        else:
+            new_rows.append(FxRate(base=base, quote=quote, rate=rate, source=source, fetched_at=now))
+
+    with db_transaction.atomic():
+        if new_rows:
+            FxRate.objects.bulk_create(new_rows)
+        if confirmed:
+            FxRate.objects.filter(pk__in=confirmed).update(last_confirmed_at=now)
+    if new_rows:
+        bump_rates_generation()
+    return new_rows
 
 def store_metal_prices_from_per_gram(gold_g: Optional[Decimal], silver_g: Optional[Decimal],
-                                     currency: str, source: str):
+                                     currency: str, source: str) -> List[MetalPrice]:
+    """مثل store_fx_rates: لا صف جديد إن لم يتغير سعر المعدن (ولا العملة)."""
     now = timezone.now()
-    if gold_g:
-        MetalPrice.objects.create(metal="GOLD", price_per_gram=gold_g, currency=currency.upper(),
-                                  source=source, fetched_at=now)
-    if silver_g:
-        MetalPrice.objects.create(metal="SILVER", price_per_gram=silver_g, currency=currency.upper(),
-                                  source=source, fetched_at=now)
+    tol = _rate_tolerance()
+    currency = currency.upper()
+    incoming = {metal: Decimal(str(price)) for metal, price in (("GOLD", gold_g), ("SILVER", silver_g)) if price}
+    if not incoming:
+        return []
+
+    new_rows, confirmed = [], []
+    for metal, price in incoming.items():
+        cur = MetalPrice.objects.filter(metal=metal).order_by("-fetched_at").first()
+        if cur is not None and cur.currency == currency and _unchanged(cur.price_per_gram, price, tol):
+            confirmed.append(cur.pk)
+        else:
+            new_rows.append(MetalPrice(metal=metal, price_per_gram=price, currency=currency,
+                                       source=source, fetched_at=now))
+
+    with db_transaction.atomic():
+        if new_rows:
+            MetalPrice.objects.bulk_create(new_rows)
+        if confirmed:
+            MetalPrice.objects.filter(pk__in=confirmed).update(last_confirmed_at=now)
+    if new_rows:
+        bump_rates_generation()
+    return new_rows
 
 def pick_fx_provider() -> Optional[FxProviderBase]:
     if not settings.ENABLE_FX_PROVIDER:
@@ -145,13 +258,49 @@ def pick_metals_provider() -> Optional[MetalsProviderBase]:
         return MetalsApiCom()
     return None
 
-def fetch_and_store_rates():
+def _metals_per_gram(mp: MetalsProviderBase, res: dict, fx_pairs) -> dict:
     """
-    الدالة الرئيسية يُناديها أمر الإدارة:
-    - FX: يجلب BASE -> TARGETS ويحفظ في FxRate
-    - Metals: يجلب ذهب/فضة لكل غرام بعملة معينة
-      - إن كانت نتيجة metals-api تعطي base مختلفة عن العملة المطلوبة، نحاول تحويلها عبر FX.
+    يوحّد نتيجة مزوّد المعادن إلى {'gold_g_per', 'silver_g_per', 'currency'}.
+    metals-api قد تعود بأونصة بالعملة الأساسية: نحوّلها (نعيد استخدام FX المجلوب إن توفر الزوج).
+    """
+    if "gold_g_per" in res:
+        return res
+    # لدينا gold_oz_in_base, silver_oz_in_base, base, currency المطلوب النهائي
+    base = res["base"].upper()
+    target = res["currency"].upper()
+    gold_oz_in_base = Decimal(str(res["gold_oz_in_base"]))
+    silver_oz_in_base = Decimal(str(res["silver_oz_in_base"]))
+    if target != base:
+        # نحتاج معدل base->target
+        pair = [p for p in (fx_pairs or []) if p[0].upper() == base and p[1].upper() == target]
+        if not pair:
+            fxp2 = pick_fx_provider()
+            if not fxp2:
+                raise ValueError("Need FX provider to convert metals base to target currency")
+            pair = fxp2.fetch(base, [target])
+        if not pair:
+            raise ValueError(f"FX {base}->{target} not available")
+        rate = pair[0][2]
+        gold_oz_in_target = (gold_oz_in_base * rate)
+        silver_oz_in_target = (silver_oz_in_base * rate)
+    else:
+        gold_oz_in_target = gold_oz_in_base
+        silver_oz_in_target = silver_oz_in_base
+
+    return {
+        "gold_g_per": (gold_oz_in_target / OZ_TO_G).quantize(Decimal("0.000001")),
+        "silver_g_per": (silver_oz_in_target / OZ_TO_G).quantize(Decimal("0.000001")),
+        "currency": target,
+    }
+
+def fetch_rates() -> dict:
     """
+    يجلب من كل المزوّدين المفعّلين معًا (FX + المعادن) دون أي كتابة في القاعدة.
+    يرجع {"fx": [(base, quote, rate)], "metals": {...} | None, "errors": {kind: exc}}.
+    فشل مزوّد لا يُسقط نتيجة الآخر: يُسجَّل في errors ويبقى ما نجح قابلًا للحفظ.
+    """
+    calls, kinds = [], []
+
     # FX
     fxp = pick_fx_provider()
     if fxp:
@@ -159,42 +308,61 @@ def fetch_and_store_rates():
         targets = [t.strip().upper() for t in settings.FX_TARGETS if t.strip()]
         targets = [t for t in targets if t != base]
         if targets:
-            pairs = fxp.fetch(base, targets)
-            store_fx_rates(pairs, source=getattr(settings, "FX_PROVIDER_NAME", "fx"))
+            calls.append(lambda: fxp.fetch(base, targets))
+            kinds.append("fx")
 
     # Metals
     mp = pick_metals_provider()
     if mp:
         currency = (getattr(settings, "METALSAPI_BASE", "USD") if isinstance(mp, MetalsApiCom)
                     else (settings.FX_BASE_CURRENCY or "USD")).upper()
-        res = mp.fetch_gold_silver_per_gram(currency=currency)
-        # معالجة MetalsApiCom: قد تعود بأونصة بالعملة الأساسية
-        if "gold_g_per" in res:
-            store_metal_prices_from_per_gram(res.get("gold_g_per"), res.get("silver_g_per"),
-                                             res.get("currency", currency), source=getattr(settings, "METALS_PROVIDER_NAME", "metals"))
-        else:
-            # لدينا gold_oz_in_base, silver_oz_in_base, base, currency المطلوب النهائي
-            base = res["base"].upper()
-            target = res["currency"].upper()
-            gold_oz_in_base = Decimal(str(res["gold_oz_in_base"]))
-            silver_oz_in_base = Decimal(str(res["silver_oz_in_base"]))
-            if target != base:
-                # نحتاج معدل base->target
-                fxp2 = pick_fx_provider()
-                if not fxp2:
-                    raise ValueError("Need FX provider to convert metals base to target currency")
-                pair = fxp2.fetch(base, [target])
-                if not pair:
-                    raise ValueError(f"FX {base}->{target} not available")
-                rate = pair[0][2]
-                gold_oz_in_target = (gold_oz_in_base * rate)
-                silver_oz_in_target = (silver_oz_in_base * rate)
-            else:
-                gold_oz_in_target = gold_oz_in_base
-                silver_oz_in_target = silver_oz_in_base
-
-            gold_g = (gold_oz_in_target / OZ_TO_G).quantize(Decimal("0.000001"))
-            silver_g = (silver_oz_in_target / OZ_TO_G).quantize(Decimal("0.000001"))
-            store_metal_prices_from_per_gram(gold_g, silver_g, target,
-                                             source=getattr(settings, "METALS_PROVIDER_NAME", "metals"))
+        calls.append(lambda: mp.fetch_gold_silver_per_gram(currency=currency))
+        kinds.append("metals")
 
+    results = dict(zip(kinds, run_concurrently(calls, return_exceptions=True)))
+    errors = {kind: res for kind, res in results.items() if isinstance(res, Exception)}
+    fetched = {"fx": [] if "fx" in errors else results.get("fx") or [], "metals": None, "errors": errors}
+    if "metals" in results and "metals" not in errors:
+        try:
+            fetched["metals"] = _metals_per_gram(mp, results["metals"], fetched["fx"])
+        except Exception as e:
+            errors["metals"] = e
+    for kind, exc in errors.items():
+        logger.error("rates provider %s failed: %s", kind, exc, exc_info=exc)
+    return fetched
+
+def store_rates(fetched: dict):
+    """
+    يحفظ نتيجة fetch_rates (في خيط الطلب/الأمر، لا في خيوط الجلب)،
+    ثم يضع في طابور الزكاة من قد يتغير نصاب نقده بسبب الأسعار التي تغيّرت فعلًا.
+    """
+    fx_rows, metal_rows = [], []
+    if fetched.get("fx"):
+        fx_rows = store_fx_rates(fetched["fx"], source=getattr(settings, "FX_PROVIDER_NAME", "fx"))
+    metals = fetched.get("metals")
+    if metals:
+        metal_rows = store_metal_prices_from_per_gram(metals.get("gold_g_per"), metals.get("silver_g_per"),
+                                                      metals.get("currency", "USD"),
+                                                      source=getattr(settings, "METALS_PROVIDER_NAME", "metals"))
+
+    # عملة الأساس (pivot) نفسها لا تتغير قيمتها بتغيّر أزواجها؛ يكفي الطرف الآخر
+    pivot = (getattr(settings, "FX_BASE_CURRENCY", "USD") or "USD").upper()
+    changed_currencies = {c for row in fx_rows for c in (row.base, row.quote)} - {pivot}
+    gold_changed = any(row.metal == "GOLD" for row in metal_rows)
+    if changed_currencies or gold_changed:
+        mark_zakat_dirty_for_rates(changed_currencies, gold_changed)
+
+def fetch_and_store_rates():
+    """
+    الدالة الرئيسية يُناديها أمر الإدارة:
+    - FX: يجلب BASE -> TARGETS ويحفظ في FxRate
+    - Metals: يجلب ذهب/فضة لكل غرام بعملة معينة
+      - إن كانت نتيجة metals-api تعطي base مختلفة عن العملة المطلوبة، نحاول تحويلها عبر FX.
+    كل طلبات HTTP تجري معًا عبر جلسة مشتركة (RATES_FETCH_CONCURRENCY)، ثم الحفظ دفعة واحدة.
+    يُحفظ ما نجح أولًا ثم يُرفع أول خطأ (إن وُجد) حتى يُبلغ الأمر عن الفشل كما كان.
+    """
+    fetched = fetch_rates()
+    store_rates(fetched)
+    errors = fetched.get("errors")
+    if errors:
+        raise next(iter(errors.values()))
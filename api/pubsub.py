@@ -0,0 +1,104 @@
+# api/pubsub.py
+"""
+نشر/اشتراك داخل العملية لتغيّر نسخة لقطة المستخدم (إشعار جديد = نسخة جديدة).
+- المشترك coroutine ينتظر asyncio.Event: الاتصال الخامل لا يحجز خيطًا ولا استعلامًا.
+- publish آمن من أي خيط (طلبات WSGI/المنفّذ الخلفي) عبر call_soon_threadsafe.
+- الكتابات من عمليات أخرى (sync_zakat، عمّال آخرون) لا تمر من هنا: مستطلع واحد لكل حلقة أحداث
+  يقرأ snapshot_version لكل المشتركين باستعلام واحد كل STREAM_POLL_SECONDS (يعمل مع SQLite).
+"""
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class Subscription:
+    def __init__(self, user_id: int, version: int, loop):
+        self.user_id = user_id
+        self.version = version
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        """True إن وصلت نسخة أحدث قبل المهلة."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}     # user_id -> set[Subscription]
+        self._pollers = {}  # loop -> asyncio.Task
+
+    def subscribe(self, user_id: int, version: int) -> Subscription:
+        loop = asyncio.get_running_loop()
+        sub = Subscription(user_id, version, loop)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+            if loop not in self._pollers:
+                self._pollers[loop] = loop.create_task(self._poll(loop))
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def publish(self, user_id: int, version: int):
+        with self._lock:
+            subs = [s for s in self._subs.get(user_id, ()) if version > s.version]
+            for s in subs:
+                s.version = version
+        for s in subs:
+            s.loop.call_soon_threadsafe(s.event.set)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+    def _user_ids_or_stop(self, loop) -> list:
+        """معرّفات مشتركي هذه الحلقة؛ إن لم يبقَ أحد نُزيل المستطلع تحت نفس القفل (لا سباق مع subscribe)."""
+        with self._lock:
+            user_ids = [uid for uid, subs in self._subs.items() if any(s.loop is loop for s in subs)]
+            if not user_ids:
+                self._pollers.pop(loop, None)
+            return user_ids
+
+    async def _poll(self, loop):
+        from django.db import close_old_connections
+        from .models import Profile
+
+        def versions(user_ids):
+            close_old_connections()  # خيط المنفّذ يعيش أطول من أي طلب
+            return list(Profile.objects.filter(user_id__in=user_ids).values_list("user_id", "snapshot_version"))
+
+        try:
+            while True:
+                await asyncio.sleep(float(getattr(settings, "STREAM_POLL_SECONDS", 5)))
+                user_ids = self._user_ids_or_stop(loop)
+                if not user_ids:
+                    return
+                # thread_sensitive=False: المهمة تعيش بعد انتهاء الطلب الذي أنشأها (ومنفّذه)
+                for user_id, version in await sync_to_async(versions, thread_sensitive=False)(user_ids):
+                    self.publish(user_id, version)
+        except BaseException:
+            with self._lock:
+                if self._pollers.get(loop) is asyncio.current_task():
+                    del self._pollers[loop]
+            raise
+
+
+hub = Hub()
+
+
+def publish_snapshot_version(user_id: int, version: int):
+    hub.publish(user_id, version)
@@ -0,0 +1,257 @@
+# api/rate_history.py
+"""
+تاريخ الأسعار: دمج صفوف FxRate/MetalPrice الخام القديمة في ملخصات يومية (OHLC) ثم حذفها على دفعات.
+- لا نلمس أبدًا أحدث صف لكل زوج/معدن: مع الكتابة الواعية بالتغيير قد يكون قديمًا لكنه ما زال السعر الحالي.
+- كل دفعة في معاملة مستقلة (دمج الملخص + حذف الخام معًا)، و fetch_rates يكتب صفوفًا جديدة فقط
+  (أو يحدّث last_confirmed_at لأحدث صف المحمي)، فالتشغيل المتزامن آمن.
+"""
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import FxRate, FxRateDaily, MetalPrice, MetalPriceDaily
+
+PRUNE_LOCK_KEY = "rates:prune:lock"
+
+# (النموذج الخام، نموذج الملخص، حقول المفتاح، حقل القيمة)
+ROLLUP_SPECS = {
+    "fx": (FxRate, FxRateDaily, ("base", "quote"), "rate"),
+    "metals": (MetalPrice, MetalPriceDaily, ("metal", "currency"), "price_per_gram"),
+}
+
+
+def _latest_ids(raw_model, key_fields) -> set:
+    """معرّفات أحدث صف لكل مفتاح (محمية من التقليم)."""
+    ranked = raw_model.objects.annotate(
+        rn=Window(RowNumber(), partition_by=[F(f) for f in key_fields],
+                  order_by=[F("fetched_at").desc(), F("id").desc()])
+    )
+    return set(ranked.filter(rn=1).values_list("id", flat=True))
+
+
+def _bucket_rows(rows, key_fields, value_field) -> dict:
+    """{(key..., day): {"open","high","low","close","open_at","close_at","samples"}}"""
+    buckets = {}
+    for row in sorted(rows, key=lambda r: (r["fetched_at"], r["id"])):
+        ts, value = row["fetched_at"], row[value_field]
+        key = tuple(row[f] for f in key_fields) + (timezone.localdate(ts),)
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = {"open": value, "high": value, "low": value, "close": value,
+                            "open_at": ts, "close_at": ts, "samples": 1}
+            continue
+        b["high"] = max(b["high"], value)
+        b["low"] = min(b["low"], value)
+        b["close"], b["close_at"] = value, ts
+        b["samples"] += 1
+    return buckets
+
+
+def _merge_daily(daily_model, key_fields, buckets: dict):
+    """يدمج الدلاء مع الملخصات الموجودة (قد تكون من تشغيل سابق لنفس اليوم)."""
+    names = key_fields + ("day",)
+    cond = Q()
+    for key in buckets:
+        cond |= Q(**dict(zip(names, key)))
+    existing = {
+        tuple(getattr(d, n) for n in names): d
+        for d in daily_model.objects.select_for_update().filter(cond)
+    }
+
+    to_create, to_update = [], []
+    for key, b in buckets.items():
+        d = existing.get(key)
+        if d is None:
+            to_create.append(daily_model(**dict(zip(names, key)), **b))
+            continue
+        if b["open_at"] < d.open_at:
+            d.open, d.open_at = b["open"], b["open_at"]
+        if b["close_at"] >= d.close_at:
+            d.close, d.close_at = b["close"], b["close_at"]
+        d.high = max(d.high, b["high"])
+        d.low = min(d.low, b["low"])
+        d.samples += b["samples"]
+        to_update.append(d)
+
+    if to_create:
+        daily_model.objects.bulk_create(to_create)
+    if to_update:
+        daily_model.objects.bulk_update(to_update, ["open", "open_at", "close", "close_at", "high", "low", "samples"])
+
+
+def rollup_and_prune(kind: str, cutoff, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    يدمج ثم يحذف كل صفوف kind ("fx" | "metals") الأقدم من cutoff (عدا أحدث صف لكل مفتاح).
+    يرجع {"rows": عدد الصفوف المُعالجة, "batches": عدد الدفعات}.
+    """
+    raw_model, daily_model, key_fields, value_field = ROLLUP_SPECS[kind]
+    protected = _latest_ids(raw_model, key_fields)
+    qs = raw_model.objects.filter(fetched_at__lt=cutoff).exclude(id__in=protected).order_by("id")
+    if dry_run:
+        return {"rows": qs.count(), "batches": 0}
+
+    rows_done = batches = 0
+    last_id = 0
+    while True:
+        with db_transaction.atomic():
+            batch = list(qs.filter(id__gt=last_id).values("id", "fetched_at", value_field, *key_fields)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]["id"]
+            _merge_daily(daily_model, key_fields, _bucket_rows(batch, key_fields, value_field))
+            raw_model.objects.filter(id__in=[r["id"] for r in batch]).delete()
+        rows_done += len(batch)
+        batches += 1
+    return {"rows": rows_done, "batches": batches}
+
+
+def prune_rate_history(keep_days: int, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    نقطة الدخول لأمر prune_rates. يحتفظ بالخام لآخر keep_days يومًا (بحدود بداية اليوم المحلي).
+    قفل في الكاش يمنع تشغيلين متداخلين للتقليم (وليس fetch_rates).
+    """
+    cutoff_day = timezone.localdate() - timedelta(days=keep_days)
+    cutoff = timezone.make_aware(datetime.combine(cutoff_day, time.min))
+    if not dry_run and not cache.add(PRUNE_LOCK_KEY, 1, timeout=3600):
+        raise RuntimeError("prune_rates يعمل بالفعل")
+    try:
+        return {kind: rollup_and_prune(kind, cutoff, batch_size, dry_run) for kind in ROLLUP_SPECS}
+    finally:
+        if not dry_run:
+            cache.delete(PRUNE_LOCK_KEY)
+
+
+# -----------------------------
+# أسعار "سارية في تاريخ" (as-of) لفترة تقرير
+# -----------------------------
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _end_of(day):
+    return timezone.make_aware(datetime.combine(day, time.max))
+
+
+class _Series:
+    """نقاط (ts, قيمة, عملة) مرتبة زمنيًا؛ at(ts) = آخر نقطة عند ts أو قبله (بحث ثنائي)."""
+
+    def __init__(self):
+        self._points = []
+        self._ts = []
+
+    def add(self, ts, value, currency=None):
+        self._points.append((ts, Decimal(value), currency))
+
+    def freeze(self):
+        self._points.sort(key=lambda p: p[0])
+        self._ts = [p[0] for p in self._points]
+
+    def at(self, ts):
+        i = bisect_right(self._ts, ts) - 1
+        return self._points[i] if i >= 0 else None
+
+
+class AsOfPrices:
+    """
+    أسعار المعادن والصرف السارية في كل يوم من فترة [date_from, date_to].
+    - تحميل مسبق: استعلام واحد لكل جدول (خام + ملخص يومي للمعادن والصرف) يشمل الفترة
+      وآخر نقطة قبل بدايتها لكل مفتاح (استعلام فرعي مترابط على فهرس (key, -fetched_at)).
+    - بعدها كل استعلام عن تاريخ بحث ثنائي في الذاكرة، بلا استعلامات لكل معاملة.
+    - الصرف: مباشر ثم معكوس ثم متقاطع عبر pivot (مثل FxMatrix لكن في تاريخ معيّن).
+    currencies: العملات المعنية (تُضاف pivot تلقائيًا) لتقليل صفوف الصرف المحمّلة؛ None = الكل.
+    """
+
+    def __init__(self, date_from, date_to, currencies=None, pivot: str | None = None):
+        self.date_from, self.date_to = date_from, date_to
+        self.pivot = (pivot or getattr(settings, "FX_BASE_CURRENCY", "USD") or "USD").upper()
+        self.currencies = None if currencies is None else {c.upper() for c in currencies if c} | {self.pivot}
+        self._metals = {}  # metal -> _Series (القيمة بعملة الصف)
+        self._fx = {}      # (base, quote) -> _Series
+        self._load()
+
+    def _series(self, store, key):
+        series = store.get(key)
+        if series is None:
+            series = store[key] = _Series()
+        return series
+
+    def _load(self):
+        start, end = _start_of(self.date_from), _end_of(self.date_to)
+
+        # المفتاح (المعدن، العملة) كما في التقليم: لكل عملة آخر نقطة قبل الفترة
+        prior_metal = (MetalPrice.objects.filter(metal=OuterRef("metal"), currency=OuterRef("currency"),
+                                                 fetched_at__lt=start)
+                       .order_by("-fetched_at").values("fetched_at")[:1])
+        for metal, cur, value, ts in (MetalPrice.objects.filter(fetched_at__lte=end)
+                                      .filter(Q(fetched_at__gte=start) | Q(fetched_at=Subquery(prior_metal)))
+                                      .values_list("metal", "currency", "price_per_gram", "fetched_at")):
+            self._series(self._metals, metal).add(ts, value, cur)
+
+        prior_metal_day = (MetalPriceDaily.objects.filter(metal=OuterRef("metal"), currency=OuterRef("currency"),
+                                                          day__lt=self.date_from)
+                           .order_by("-day").values("day")[:1])
+        for metal, cur, value, ts in (MetalPriceDaily.objects.filter(day__lte=self.date_to)
+                                      .filter(Q(day__gte=self.date_from) | Q(day=Subquery(prior_metal_day)))
+                                      .values_list("metal", "currency", "close", "close_at")):
+            self._series(self._metals, metal).add(ts, value, cur)
+
+        pair_filter = Q()
+        if self.currencies is not None:
+            pair_filter = Q(base__in=self.currencies, quote__in=self.currencies)
+
+        prior_fx = (FxRate.objects.filter(base=OuterRef("base"), quote=OuterRef("quote"), fetched_at__lt=start)
+                    .order_by("-fetched_at").values("fetched_at")[:1])
+        for base, quote, value, ts in (FxRate.objects.filter(pair_filter, fetched_at__lte=end)
+                                       .filter(Q(fetched_at__gte=start) | Q(fetched_at=Subquery(prior_fx)))
+                                       .values_list("base", "quote", "rate", "fetched_at")):
+            self._series(self._fx, (base, quote)).add(ts, value)
+
+        prior_fx_day = (FxRateDaily.objects.filter(base=OuterRef("base"), quote=OuterRef("quote"), day__lt=self.date_from)
+                        .order_by("-day").values("day")[:1])
+        for base, quote, value, ts in (FxRateDaily.objects.filter(pair_filter, day__lte=self.date_to)
+                                       .filter(Q(day__gte=self.date_from) | Q(day=Subquery(prior_fx_day)))
+                                       .values_list("base", "quote", "close", "close_at")):
+            self._series(self._fx, (base, quote)).add(ts, value)
+
+        for series in list(self._metals.values()) + list(self._fx.values()):
+            series.freeze()
+
+    def _direct(self, base: str, quote: str, ts) -> Decimal | None:
+        if base == quote:
+            return Decimal("1")
+        series = self._fx.get((base, quote))
+        point = series.at(ts) if series else None
+        if point and point[1] > 0:
+            return point[1]
+        series = self._fx.get((quote, base))
+        point = series.at(ts) if series else None
+        if point and point[1] > 0:
+            return Decimal("1") / point[1]
+        return None
+
+    def fx_rate(self, base: str, quote: str, day) -> Decimal | None:
+        """معدّل base->quote الساري في نهاية اليوم day (أو None إن لم يوجد سجل حتى ذلك اليوم)."""
+        base, quote = base.upper(), quote.upper()
+        ts = _end_of(day)
+        rate = self._direct(base, quote, ts)
+        if rate is not None:
+            return rate
+        to_pivot, from_pivot = self._direct(base, self.pivot, ts), self._direct(self.pivot, quote, ts)
+        if to_pivot is not None and from_pivot is not None:
+            return to_pivot * from_pivot
+        return None
+
+    def metal_price(self, metal: str, day) -> tuple[Decimal, str] | None:
+        """(سعر الغرام، عملته) الساري في نهاية اليوم day."""
+        series = self._metals.get(metal.upper())
+        point = series.at(_end_of(day)) if series else None
+        if point is None:
+            return None
+        return point[1], (point[2] or "USD").upper()
@@ -0,0 +1,199 @@
+# api/rates.py
+"""
+دفتر الأسعار (RateBook): نسخة في ذاكرة كل عامل من أحدث أسعار المعادن وكل أزواج الصرف.
+- يُعاد تحميله عند تغيّر "جيل الأسعار" (صف RatesGeneration يُرفع بعد كل تخزين للأسعار) أو بعد انتهاء TTL.
+- بهذا يعيد كل عامل gunicorn التحميل مرة واحدة لكل جلب، لا مرة لكل استدعاء.
+"""
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import MetalPrice, FxRate, RatesGeneration
+
+_generation = (0, float("-inf"))  # (آخر جيل مقروء، وقت القراءة monotonic)
+
+
+def rates_generation() -> int:
+    """
+    جيل الأسعار من قاعدة البيانات لا من الكاش: locmem (الافتراضي) لا يُشارك بين العمليات،
+    فرفعٌ من cron fetch_rates لن يصل عمّال gunicorn. يُقرأ مرة كل RATES_GENERATION_POLL_SECONDS لكل عامل.
+    """
+    global _generation
+    value, checked_at = _generation
+    now = time.monotonic()
+    if now - checked_at < getattr(settings, "RATES_GENERATION_POLL_SECONDS", 5):
+        return value
+    value = RatesGeneration.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+    _generation = (value, now)
+    return value
+
+
+def bump_rates_generation():
+    """يُستدعى بعد أي تخزين/تعديل للأسعار حتى تعيد كل العمّال تحميل الدفتر."""
+    global _generation
+    bump = {"value": F("value") + 1, "updated_at": timezone.now()}
+    if not RatesGeneration.objects.filter(pk=1).update(**bump):
+        _, created = RatesGeneration.objects.get_or_create(pk=1, defaults={"value": 1})
+        if not created:  # أنشأته عملية أخرى بيننا
+            RatesGeneration.objects.filter(pk=1).update(**bump)
+    _generation = (0, float("-inf"))
+    invalidate_local_rate_book()
+
+
+class RateBook:
+    """لقطة ثابتة (للقراءة فقط) من الأسعار عند جيل معيّن."""
+
+    def __init__(self, generation: int, metals: dict, fx: dict):
+        self.generation = generation
+        self.metals = metals  # نفس شكل latest_metal_dict
+        self.fx = fx          # {(base, quote): {"base", "quote", "rate", "fetched_at"}}
+        self.loaded_at = time.monotonic()
+        stamps = [r["fetched_at"] for r in fx.values()]
+        self.fx_fetched_at = max(stamps) if stamps else None
+
+    @property
+    def stamp(self) -> str:
+        """
+        مُحقِّق رخيص: جيل الأسعار + آخر fetched_at للمعادن/الصرف.
+        الجيل ضروري: fetched_at المعادن هو للذهب، وتغيّر الفضة وحدها (الذهب ثابت => بلا صف جديد) لا يغيّره.
+        """
+        return f"{self.generation}:{self.metals['fetched_at'] or '-'}/{self.fx_fetched_at or '-'}"
+
+    @cached_property
+    def matrix(self) -> "FxMatrix":
+        """مصفوفة التحويل (مباشر + معكوس + عبر عملة الأساس) تُبنى مرة واحدة لكل جيل."""
+        return FxMatrix.from_rows(self.fx.values(), getattr(settings, "FX_BASE_CURRENCY", "USD"))
+
+    def is_fresh(self, generation: int) -> bool:
+        ttl = getattr(settings, "RATES_CACHE_TTL", 300)
+        return self.generation == generation and (time.monotonic() - self.loaded_at) < ttl
+
+
+class FxMatrix:
+    """
+    كل معدّلات التحويل المعروفة محسوبة مسبقًا: {(base, quote): Decimal}.
+    الأولوية: صف FxRate مباشر، ثم معكوس صف موجود، ثم معدّل متقاطع عبر pivot
+    (مثلاً MYR->SYP = MYR->USD × USD->SYP). التحويل بعدها بحث في القاموس فقط.
+    """
+
+    def __init__(self, pivot: str, rates: dict, to_pivot: dict):
+        self.pivot = pivot
+        self.rates = rates
+        self.to_pivot = to_pivot  # قيمة وحدة واحدة من العملة بعملة pivot
+
+    @classmethod
+    def from_rows(cls, rows, pivot: str = "USD") -> "FxMatrix":
+        pivot = (pivot or "USD").upper()
+        direct = {}
+        for rec in rows:
+            try:
+                rate = Decimal(str(rec["rate"]))
+            except (InvalidOperation, KeyError, TypeError):
+                continue
+            if rate > 0:
+                direct[(rec["base"].upper(), rec["quote"].upper())] = rate
+
+        to_pivot = {pivot: Decimal("1")}
+        for (base, quote), rate in direct.items():
+            if quote == pivot:
+                to_pivot[base] = rate
+        for (base, quote), rate in direct.items():
+            if base == pivot:
+                to_pivot.setdefault(quote, Decimal("1") / rate)
+
+        rates = dict(direct)
+        for (base, quote), rate in direct.items():
+            rates.setdefault((quote, base), Decimal("1") / rate)
+        for a, a_in_pivot in to_pivot.items():
+            for b, b_in_pivot in to_pivot.items():
+                if a != b:
+                    rates.setdefault((a, b), a_in_pivot / b_in_pivot)
+        return cls(pivot, rates, to_pivot)
+
+    def rate(self, base: str, quote: str) -> Decimal | None:
+        base, quote = base.upper(), quote.upper()
+        if base == quote:
+            return Decimal("1")
+        return self.rates.get((base, quote))
+
+
+def _load_metals() -> dict:
+    result = {"gold_g_per": None, "silver_g_per": None, "currency": "USD", "fetched_at": None}
+    gold = MetalPrice.objects.filter(metal="GOLD").order_by("-fetched_at").first()
+    silver = MetalPrice.objects.filter(metal="SILVER").order_by("-fetched_at").first()
+    if gold:
+        result["gold_g_per"] = str(gold.price_per_gram)
+        result["currency"] = gold.currency
+        result["fetched_at"] = gold.fetched_at.isoformat()
+    if silver:
+        result["silver_g_per"] = str(silver.price_per_gram)
+        if not result["fetched_at"]:
+            result["fetched_at"] = silver.fetched_at.isoformat()
+    return result
+
+
+def latest_fx_rows(pairs=None) -> list:
+    """
+    أحدث صف FxRate لكل زوج باستعلام واحد (pairs=None => كل الأزواج).
+    - PostgreSQL: DISTINCT ON (base, quote) بترتيب (base, quote, -fetched_at) يطابق الفهرس الموجود.
+    - غيره (SQLite): ROW_NUMBER() على كل (base, quote) ثم نأخذ الصف الأول.
+    """
+    qs = FxRate.objects.all()
+    if pairs is not None:
+        wanted = {(b.upper(), q.upper()) for b, q in pairs}
+        if not wanted:
+            return []
+        cond = Q()
+        for base, quote in wanted:
+            cond |= Q(base=base, quote=quote)
+        qs = qs.filter(cond)
+
+    if connections[qs.db].vendor == "postgresql":
+        return list(qs.order_by("base", "quote", "-fetched_at").distinct("base", "quote"))
+
+    ranked = qs.annotate(
+        rn=Window(RowNumber(), partition_by=[F("base"), F("quote")], order_by=[F("fetched_at").desc(), F("id").desc()])
+    )
+    return list(ranked.filter(rn=1).order_by("base", "quote"))
+
+
+def _load_fx() -> dict:
+    return {
+        (rec.base, rec.quote): {
+            "base": rec.base,
+            "quote": rec.quote,
+            "rate": str(rec.rate),
+            "fetched_at": rec.fetched_at.isoformat(),
+        }
+        for rec in latest_fx_rows()
+    }
+
+
+_book: RateBook | None = None
+_lock = threading.Lock()
+
+
+def invalidate_local_rate_book():
+    global _book
+    _book = None
+
+
+def get_rate_book() -> RateBook:
+    global _book
+    generation = rates_generation()
+    book = _book
+    if book is not None and book.is_fresh(generation):
+        return book
+    with _lock:
+        book = _book
+        if book is None or not book.is_fresh(generation):
+            book = RateBook(generation, _load_metals(), _load_fx())
+            _book = book
+    return book
@@ -0,0 +1,55 @@
+# api/rates_stub.py
+"""
+خادم HTTP محلي يحاكي مزوّدي الأسعار (exchangerate.host / goldapi.io / metals-api.com)
+بزمن استجابة مصطنع، لقياس fetch_rates دون شبكة (انظر أمر bench_fetch_rates).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STUB_FX = {"USD": 1.0, "SYP": 13000.0, "MYR": 4.7, "EUR": 0.92, "GBP": 0.79, "TRY": 32.5}
+STUB_METALS_OZ = {"XAU": 2400.0, "XAG": 30.0}  # USD لكل أونصة
+
+
+class StubRatesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive حتى تظهر فائدة الجلسة المشتركة
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["latest"]:
+            symbols = (query.get("symbols") or [""])[0].split(",")
+            payload = {"base": (query.get("base") or ["USD"])[0],
+                       "rates": {s: STUB_FX[s] for s in symbols if s in STUB_FX}}
+        elif parts == ["api", "latest"]:
+            payload = {"base": (query.get("base") or ["USD"])[0], "rates": dict(STUB_METALS_OZ)}
+        elif len(parts) == 3 and parts[0] == "api" and parts[1] in STUB_METALS_OZ:
+            payload = {"metal": parts[1], "currency": parts[2], "price": STUB_METALS_OZ[parts[1]]}
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency: float = 0.2, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """يشغّل الخادم في خيط خلفي ويرجعه؛ العنوان في server.url، والإيقاف عبر server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), StubRatesHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="rates-stub", daemon=True).start()
+    return server
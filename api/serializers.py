@@ -93,10 +93,15 @@ class BootstrapSnapshotSerializer(serializers.Serializer):
     version = serializers.IntegerField()
     etag = serializers.CharField()
     generated_at = serializers.DateTimeField()
-    profile = ProfileSerializer()
-    settings = UserSettingsSerializer()
+    # في وضع الدلتا (?since_version=N) تُرسل الأقسام المتغيرة فقط
+    profile = ProfileSerializer(required=False)
+    settings = UserSettingsSerializer(required=False)
     # ستضاف لاحقًا: assets, transactions, rates, zakat_cycles، ... (الآن نتركها فارغة)
-    notifications = NotificationSerializer(many=True)
+    notifications = NotificationSerializer(many=True, required=False)
+    delta = serializers.BooleanField(required=False)
+    since_version = serializers.IntegerField(required=False)
+    changed_sections = serializers.ListField(child=serializers.CharField(), required=False)
+    removed = serializers.DictField(required=False)  # {"transactions": [ids], "notifications": [ids]}
 
 
 from .models import MetalPrice, FxRate
@@ -329,6 +334,7 @@ class ZakatOverviewSerializer(serializers.Serializer):
 class TransactionsReportSerializer(serializers.Serializer):
     # سنرجّع قائمة معاملات مع فلترة، بدون بنية معقّدة
     count = serializers.IntegerField()
+    count_exact = serializers.BooleanField(required=False)  # بالمؤشر فقط: False إن بلغ العدّ PAGINATION_COUNT_CAP
     next = serializers.CharField(allow_null=True)
     previous = serializers.CharField(allow_null=True)
     results = serializers.ListField()
@@ -0,0 +1,137 @@
+# api/stream.py
+"""
+notifications/stream: دفع الإشعارات الجديدة وتغيّر نسخة اللقطة بدل الاستطلاع الدوري لـ heartbeat/delta.
+- SSE (Accept: text/event-stream): أحداث notification و version، وتعليق ping لإبقاء الاتصال،
+  وينتهي بعد STREAM_MAX_SECONDS فيعيد العميل الاتصال بـ Last-Event-ID (آخر id إشعار).
+- long-poll (افتراضي، أو ?mode=poll): ينتظر حتى STREAM_LONGPOLL_SECONDS ثم 200 بالجديد أو 204.
+- view غير متزامن (ASGI): الاتصال الخامل coroutine ينتظر Hub، بلا خيط ولا استعلامات خاصة به.
+  تحت WSGI كل اتصال يحجز عاملًا كاملًا حتى STREAM_MAX_SECONDS => يرجع 501 ويبقى العميل على heartbeat.
+المصادقة: Authorization: Bearer كبقية الـ API، أو ?ticket= (EventSource في المتصفح لا يرسل ترويسات):
+تذكرة StreamTicket من notifications/stream/ticket قصيرة العمر ولا تصلح لغير هذا المسار،
+بدل access token في الرابط (الروابط تُسجَّل في سجلات الوكلاء والوصول).
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import Token
+
+from .models import Notification, Profile
+from .pubsub import hub
+from .serializers import NotificationSerializer
+
+BATCH = 50
+
+
+class StreamTicket(Token):
+    """JWT لغرض واحد: token_type مختلف فلا يقبله JWTAuthentication في بقية الـ API، ولا يُقبل access هنا."""
+    token_type = "stream"
+    lifetime = timedelta(seconds=getattr(settings, "STREAM_TICKET_SECONDS", 60))
+
+
+def _authenticate(request):
+    auth = JWTAuthentication()
+    try:
+        ticket = request.GET.get("ticket")
+        if ticket:
+            return auth.get_user(StreamTicket(ticket))
+        result = auth.authenticate(request)
+        return result[0] if result else None
+    except (TokenError, InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _version(user_id) -> int:
+    return Profile.objects.filter(user_id=user_id).values_list("snapshot_version", flat=True).first() or 0
+
+
+def _new_items(user_id, after_id: int) -> list:
+    qs = Notification.objects.filter(user_id=user_id, id__gt=after_id).order_by("id")[:BATCH]
+    return list(NotificationSerializer(qs, many=True).data)
+
+
+def _int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _sse(event: str, data, event_id=None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _long_poll(user_id, after_id: int, since_version: int, version: int):
+    sub = hub.subscribe(user_id, version)
+    try:
+        if version <= since_version:
+            await sub.wait(float(getattr(settings, "STREAM_LONGPOLL_SECONDS", 25)))
+        items = await sync_to_async(_new_items)(user_id, after_id)
+        if not items and sub.version <= since_version:
+            return HttpResponse(status=204)
+        return JsonResponse({
+            "version": sub.version,
+            "items": items,
+            "last_id": items[-1]["id"] if items else after_id or None,
+        })
+    finally:
+        hub.unsubscribe(sub)
+
+
+async def _events(user_id, after_id: int, since_version: int, version: int):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + float(getattr(settings, "STREAM_MAX_SECONDS", 300))
+    ping = float(getattr(settings, "STREAM_PING_SECONDS", 15))
+    sub = hub.subscribe(user_id, version)
+    try:
+        yield "retry: 3000\n\n"
+        changed = version > since_version
+        while True:
+            if changed:
+                while True:
+                    items = await sync_to_async(_new_items)(user_id, after_id)
+                    for item in items:
+                        after_id = item["id"]
+                        yield _sse("notification", item, event_id=after_id)
+                    if len(items) < BATCH:
+                        break
+                yield _sse("version", {"version": sub.version})
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            changed = await sub.wait(min(ping, remaining))
+            if not changed:
+                yield ": ping\n\n"
+    finally:
+        hub.unsubscribe(sub)
+
+
+async def notifications_stream(request):
+    if request.method != "GET":  # require_GET لا يدعم views غير المتزامنة في Django 4.2
+        return HttpResponseNotAllowed(["GET"])
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "notifications/stream يتطلب خادم ASGI؛ استخدم sync/heartbeat."}, status=501)
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    after_id = _int(request.GET.get("after_id") or request.headers.get("Last-Event-ID"))
+    since_version = _int(request.GET.get("since_version"), default=-1)
+    version = await sync_to_async(_version)(user.pk)
+
+    wants_sse = "text/event-stream" in request.headers.get("Accept", "") and request.GET.get("mode") != "poll"
+    if not wants_sse:
+        return await _long_poll(user.pk, after_id, since_version, version)
+
+    response = StreamingHttpResponse(_events(user.pk, after_id, since_version, version),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # لا تخزين مؤقت في nginx
+    return response
@@ -0,0 +1,85 @@
+# api/tests/test_conditional.py
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.models import FxRate, MetalPrice
+from api.providers import store_metal_prices_from_per_gram
+from api.rates import bump_rates_generation
+from api.utils import record_transaction
+
+ENDPOINTS = (
+    "/api/snapshot",
+    "/api/rates",
+    "/api/reports/portfolio",
+    "/api/reports/portfolio/history",
+    "/api/reports/zakat",
+    "/api/reports/dashboard",
+)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="etag@x.com", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"))
+        MetalPrice.objects.create(metal="SILVER", price_per_gram=Decimal("1"))
+        FxRate.objects.create(base="USD", quote="SYP", rate=Decimal("13000"))
+        bump_rates_generation()
+        record_transaction(user=self.user, asset_type="CASH", operation_type="ADD",
+                           currency_code="USD", amount=Decimal("100"), date="2025-01-15")
+
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_matching_etag_returns_304_on_each_endpoint(self):
+        for url in ENDPOINTS:
+            with self.subTest(url=url):
+                first = self.get(url)
+                self.assertEqual(first.status_code, 200)
+                etag = first["ETag"]
+                self.assertTrue(etag)
+
+                again = self.get(url, etag)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again["ETag"], etag)
+                self.assertEqual(self.get(url, f"W/{etag}, \"other\"").status_code, 304)
+
+    def test_write_changes_etag(self):
+        for url in ENDPOINTS:
+            if url == "/api/rates":
+                continue  # لا يعتمد على معاملات المستخدم
+            with self.subTest(url=url):
+                etag = self.get(url)["ETag"]
+                self.client.post("/api/assets/cash/add", {"currency_code": "USD", "amount": "5", "date": "2025-02-01"},
+                                 format="json")
+                r = self.get(url, etag)
+                self.assertEqual(r.status_code, 200)
+                self.assertNotEqual(r["ETag"], etag)
+
+    def test_new_rates_change_rates_etag(self):
+        etag = self.get("/api/rates")["ETag"]
+        FxRate.objects.create(base="USD", quote="SYP", rate=Decimal("13100"))
+        bump_rates_generation()
+        r = self.get("/api/rates", etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r["ETag"], etag)
+
+    def test_silver_only_price_change_changes_etags(self):
+        store_metal_prices_from_per_gram(Decimal("80"), Decimal("1.00"), "USD", source="test")
+        etags = {url: self.get(url)["ETag"] for url in ("/api/rates", "/api/reports/portfolio", "/api/reports/zakat")}
+
+        rows = store_metal_prices_from_per_gram(Decimal("80"), Decimal("1.50"), "USD", source="test")
+        self.assertEqual([r.metal for r in rows], ["SILVER"])  # الذهب لم يتغير => بلا صف جديد
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                r = self.get(url, etag)
+                self.assertEqual(r.status_code, 200)
+                self.assertNotEqual(r["ETag"], etag)
+        self.assertEqual(Decimal(self.get("/api/rates").data["metals"]["silver_g_per"]), Decimal("1.5"))
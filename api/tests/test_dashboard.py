@@ -0,0 +1,119 @@
+# api/tests/test_dashboard.py
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.models import FxRate, MetalPrice, Transaction, UserMonthlyFlow
+from api.rates import bump_rates_generation
+from api.utils import (
+    ValuationContext, _convert_money, _dashboard_groups, _get_gold_price_per_gram_in, _get_silver_price_per_gram_in,
+    archive_transaction, build_reports_dashboard, record_transaction,
+)
+
+# 15 يناير → 10 أبريل: شهران كاملان (فبراير، مارس) وطرفان جزئيان
+DATE_FROM, DATE_TO = date(2025, 1, 15), date(2025, 4, 10)
+
+
+class DashboardParityTests(TestCase):
+    """التجميع (UserMonthlyFlow للأشهر الكاملة + Transaction للأطراف) يطابق الحساب معاملة-معاملة."""
+
+    def setUp(self):
+        cache.clear()
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"))
+        MetalPrice.objects.create(metal="SILVER", price_per_gram=Decimal("1.5"))
+        FxRate.objects.create(base="USD", quote="EUR", rate=Decimal("0.5"))
+        FxRate.objects.create(base="MYR", quote="USD", rate=Decimal("0.25"))
+        bump_rates_generation()
+        self.user = User.objects.create_user(username="dash@x.com", password="pw")
+
+        rows = [
+            ("2025-01-10", "ADD", "CASH", {"currency_code": "USD", "amount": "999"}),   # قبل الفترة
+            ("2025-01-15", "ADD", "CASH", {"currency_code": "EUR", "amount": "100"}),
+            ("2025-01-31", "ADD", "GOLD", {"karat": 21, "weight_g": "12"}),
+            ("2025-02-01", "ADD", "CASH", {"currency_code": "MYR", "amount": "400"}),
+            ("2025-02-14", "WITHDRAW", "CASH", {"currency_code": "EUR", "amount": "30"}),
+            ("2025-02-20", "ADD", "GOLD", {"karat": 18, "weight_g": "8"}),
+            ("2025-02-28", "ADD", "GOLD", {"karat": 18, "weight_g": "4"}),
+            ("2025-03-03", "ZAKAT", "CASH", {"currency_code": "USD", "amount": "25"}),
+            ("2025-03-09", "ADD", "SILVER", {"weight_g": "600"}),
+            ("2025-03-31", "WITHDRAW", "GOLD", {"karat": 24, "weight_g": "2"}),
+            ("2025-04-01", "ADD", "CASH", {"currency_code": "USD", "amount": "70"}),
+            ("2025-04-10", "ZAKAT", "SILVER", {"weight_g": "15"}),
+            ("2025-04-11", "ADD", "GOLD", {"karat": 24, "weight_g": "999"}),            # بعد الفترة
+        ]
+        for day, op, asset, extra in rows:
+            record_transaction(user=self.user, date=day, operation_type=op, asset_type=asset,
+                               **{k: (v if k == "currency_code" else Decimal(v)) for k, v in extra.items()})
+        for day in ("2025-01-20", "2025-02-10", "2025-04-05"):  # مؤرشفة في كل جزء من الفترة
+            tx = record_transaction(user=self.user, date=day, operation_type="ADD", asset_type="CASH",
+                                    currency_code="USD", amount=Decimal("5000"))
+            archive_transaction(tx, "مكررة")
+
+    def expected(self, cur):
+        """الحساب المرجعي: تحويل كل معاملة على حدة."""
+        ctx = ValuationContext(self.user)
+        gold, silver = _get_gold_price_per_gram_in(cur, self.user, ctx), _get_silver_price_per_gram_in(cur, self.user, ctx)
+        names = {"ADD": "added", "WITHDRAW": "withdrawn", "ZAKAT": "zakat_paid"}
+        sections = defaultdict(lambda: defaultdict(Decimal))
+        series = defaultdict(lambda: defaultdict(Decimal))
+        for tx in Transaction.objects.filter(user=self.user, soft_deleted_at__isnull=True,
+                                             date__gte=DATE_FROM, date__lte=DATE_TO):
+            name = names[tx.operation_type]
+            if tx.asset_type == "CASH":
+                kind, value = "cash", _convert_money(tx.amount, tx.currency_code, cur, self.user, ctx)
+            elif tx.asset_type == "GOLD":
+                kind, value = "gold", tx.weight_g * Decimal(tx.karat) / Decimal(24) * gold
+            else:
+                kind, value = "silver", tx.weight_g * silver
+            sections[name][kind] += value
+            series[tx.date.strftime("%Y-%m")][name] += value
+        return sections, series
+
+    def assertParity(self, cur):
+        data = build_reports_dashboard(self.user, cur, DATE_FROM, DATE_TO)
+        sections, series = self.expected(cur)
+        q = Decimal("0.01")
+        for name in ("added", "withdrawn", "zakat_paid"):
+            got = data["sections"][name]
+            exp = sections[name]
+            self.assertEqual(
+                (got["cash"]["value"], got["gold"]["value"], got["silver"]["value"], got["total_value"]),
+                (f"{exp['cash'].quantize(q)}", f"{exp['gold'].quantize(q)}", f"{exp['silver'].quantize(q)}",
+                 f"{sum(exp.values(), Decimal('0')).quantize(q)}"),
+                name,
+            )
+        self.assertEqual(
+            data["series"],
+            [{"month": m, **{n: f"{series[m][n].quantize(q)}" for n in ("added", "withdrawn", "zakat_paid")}}
+             for m in ("2025-01", "2025-02", "2025-03", "2025-04")],
+        )
+        return data
+
+    def test_grouped_dashboard_matches_per_transaction_values(self):
+        data = self.assertParity("USD")
+        self.assertEqual(data["sections"]["added"]["cash"]["value"], "370.00")  # 100 EUR + 400 MYR + 70 USD
+        self.assertParity("EUR")
+        self.assertParity("MYR")
+
+    def test_full_months_come_from_monthly_flow(self):
+        months = {g["month"] for g in _dashboard_groups(self.user, DATE_FROM, DATE_TO)}
+        self.assertEqual(months, {date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1), date(2025, 4, 1)})
+
+        # بلا ملخص شهري تختفي الأشهر الكاملة فقط؛ الأطراف تُقرأ من Transaction
+        UserMonthlyFlow.objects.all().delete()
+        months = {g["month"] for g in _dashboard_groups(self.user, DATE_FROM, DATE_TO)}
+        self.assertEqual(months, {date(2025, 1, 1), date(2025, 4, 1)})
+
+        # وإعادة بنائه من الصفر تعيد المطابقة
+        call_command("rebuild_monthly_flows", stdout=open("/dev/null", "w"))
+        self.assertParity("USD")
+
+    def test_range_inside_one_month_reads_transactions_only(self):
+        groups = _dashboard_groups(self.user, date(2025, 2, 10), date(2025, 2, 20))
+        self.assertEqual(sorted((g["operation_type"], g["asset_type"], g["quantity"]) for g in groups),
+                         [("ADD", "GOLD", Decimal("8")), ("WITHDRAW", "CASH", Decimal("30"))])
@@ -0,0 +1,65 @@
+# api/tests/test_hijri.py
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+from hijri_converter import Gregorian, Hijri
+
+from api import hijri
+
+
+class HijriTableTests(SimpleTestCase):
+    """الجداول تطابق hijri_converter على كامل نطاق أم القرى."""
+
+    def test_every_day_matches_hijri_converter(self):
+        first, last = hijri.GREGORIAN_RANGE
+        day = first
+        while day <= last:
+            h = hijri.to_hijri(day)
+            self.assertEqual(tuple(h), Gregorian(day.year, day.month, day.day).to_hijri().datetuple(), day)
+            self.assertEqual(h.to_gregorian(), day)
+            day += timedelta(days=1)
+
+    def test_every_month_length_matches(self):
+        (y0, m0, _), (y1, m1, _) = hijri.HIJRI_RANGE
+        for year in range(y0, y1 + 1):
+            for month in range(1, 13):
+                if (year, month) < (y0, m0) or (year, month) > (y1, m1):
+                    continue
+                self.assertEqual(hijri.month_length(year, month), Hijri(year, month, 1).month_length(), (year, month))
+
+    def test_out_of_range_raises(self):
+        first, last = hijri.GREGORIAN_RANGE
+        with self.assertRaises(ValueError):
+            hijri.to_hijri(first - timedelta(days=1))
+        with self.assertRaises(ValueError):
+            hijri.to_hijri(last + timedelta(days=1))
+        with self.assertRaises(ValueError):
+            hijri.to_gregorian(1445, 13, 1)
+        short = next(m for m in range(1, 13) if hijri.month_length(1445, m) == 29)
+        with self.assertRaises(ValueError):
+            hijri.to_gregorian(1445, short, 30)
+
+    def test_add_one_hijri_year_clamps_day_30(self):
+        long_month = next((y, m) for y in range(1440, 1460) for m in range(1, 13)
+                          if hijri.month_length(y, m) == 30 and hijri.month_length(y + 1, m) == 29)
+        h = hijri.HijriDate(long_month[0], long_month[1], 30)
+        self.assertEqual(hijri.add_one_hijri_year(h), (h.year + 1, h.month, 29))
+        self.assertEqual(hijri.add_one_hijri_year(hijri.HijriDate(1445, 1, 10)), (1446, 1, 10))
+
+    def test_today_is_cached_until_local_midnight(self):
+        evening = hijri.timezone.make_aware(hijri.datetime(2025, 3, 1, 23, 0))
+        midnight = hijri.timezone.make_aware(hijri.datetime(2025, 3, 2))
+        hijri._today = (None, 0.0)
+        try:
+            with mock.patch.object(hijri.timezone, "localtime", return_value=evening) as localtime, \
+                    mock.patch.object(hijri._time, "time", return_value=evening.timestamp()) as now:
+                self.assertEqual(hijri.today_hijri(), hijri.to_hijri(date(2025, 3, 1)))
+                localtime.return_value = midnight  # لا يُقرأ ما دام الطابع قبل منتصف الليل
+                now.return_value = midnight.timestamp() - 1
+                self.assertEqual(hijri.today_hijri(), hijri.to_hijri(date(2025, 3, 1)))
+                self.assertEqual(localtime.call_count, 1)
+                now.return_value = midnight.timestamp()
+                self.assertEqual(hijri.today_hijri(), hijri.to_hijri(date(2025, 3, 2)))
+        finally:
+            hijri._today = (None, 0.0)
@@ -0,0 +1,60 @@
+# api/tests/test_ledger.py
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.models import HoldingBalance, Transaction
+from api.utils import compute_holdings, rebuild_holdings_for
+
+
+class LedgerParityTests(TestCase):
+    """الدفتر (HoldingBalance) يطابق تجميع المعاملات بعد كل كتابة عبر الـ API."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="ledger@x.com", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, data, status=None):
+        r = self.client.post(url, {"date": "2025-01-15", **data}, format="json")
+        self.assertIn(r.status_code, (status,) if status else (200, 201), r.data)
+        return r.data
+
+    def assertParity(self):
+        self.assertEqual(rebuild_holdings_for([self.user.id], dry_run=True), [])
+        call_command("rebuild_holdings", "--check", stdout=open("/dev/null", "w"))  # SystemExit(1) عند الانحراف
+        self.assertEqual(compute_holdings(self.user), compute_holdings(self.user, source="transactions"))
+
+    def test_add_edit_archive_keep_ledger_in_sync(self):
+        cash = self.post("/api/assets/cash/add", {"currency_code": "usd", "amount": "500"})["operation_id"]
+        self.post("/api/assets/cash/withdraw", {"currency_code": "USD", "amount": "120.5"})
+        gold = self.post("/api/assets/gold/add", {"karat": 21, "weight_g": "30"})["operation_id"]
+        self.post("/api/assets/silver/add", {"weight_g": "700"})
+        self.assertParity()
+
+        self.post(f"/api/transactions/{cash}/edit", {"amount": "800", "edit_reason": "تصحيح"})
+        self.post(f"/api/transactions/{gold}/edit", {"karat": 24, "edit_reason": "العيار خطأ"})
+        self.assertParity()
+
+        silver = Transaction.objects.get(user=self.user, asset_type="SILVER", soft_deleted_at__isnull=True)
+        self.post(f"/api/transactions/{silver.id}/delete", {"delete_reason": "مكررة"})
+        self.assertParity()
+
+        balances = {(h.asset_type, h.karat, h.currency_code): h.balance
+                    for h in HoldingBalance.objects.filter(user=self.user)}
+        self.assertEqual(balances[("CASH", 0, "USD")], Decimal("679.5"))
+        self.assertEqual(balances[("GOLD", 24, "")], Decimal("30"))
+        self.assertFalse(balances.get(("GOLD", 21, "")))
+        self.assertFalse(balances.get(("SILVER", 0, "")))
+
+    def test_check_reports_drift_and_rebuild_repairs_it(self):
+        self.post("/api/assets/cash/add", {"currency_code": "USD", "amount": "100"})
+        HoldingBalance.objects.filter(user=self.user).update(balance=Decimal("1"))
+
+        with self.assertRaises(SystemExit):
+            call_command("rebuild_holdings", "--check", stdout=open("/dev/null", "w"), stderr=open("/dev/null", "w"))
+        call_command("rebuild_holdings", stdout=open("/dev/null", "w"))
+        self.assertParity()
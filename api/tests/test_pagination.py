@@ -0,0 +1,80 @@
+# api/tests/test_pagination.py
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Notification
+from api.pagination import decode_cursor, encode_cursor
+from api.utils import notify_bulk, record_transaction
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="pages@x.com", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_transactions(self, n):
+        return [record_transaction(user=self.user, asset_type="CASH", operation_type="ADD", currency_code="USD",
+                                   amount=Decimal(i + 1), date="2025-01-15").id for i in range(n)]
+
+    def page(self, cursor="", page_size=10):
+        r = self.client.get("/api/reports/transactions", {"cursor": cursor, "page_size": page_size})
+        self.assertEqual(r.status_code, 200)
+        return r.data
+
+    def test_pages_stay_stable_when_newer_rows_are_inserted(self):
+        original = self.add_transactions(25)
+
+        seen, page = [], self.page()
+        while True:
+            seen += [t["id"] for t in page["results"]]
+            self.add_transactions(3)  # أحدث من كل ما عُرض: لا تكرار ولا قفز في الصفحات التالية
+            if not page["next"]:
+                break
+            page = self.page(page["next"])
+
+        self.assertEqual(seen, sorted(original, reverse=True))
+
+    def test_previous_cursor_returns_the_same_page(self):
+        self.add_transactions(25)
+        first = self.page()
+        second = self.page(first["next"])
+        self.add_transactions(5)
+        back = self.page(second["previous"])
+        self.assertEqual([t["id"] for t in back["results"]], [t["id"] for t in first["results"]])
+        self.assertIsNone(first["previous"])
+
+    def test_offset_pagination_stays_default(self):
+        self.add_transactions(25)
+        r = self.client.get("/api/reports/transactions").data
+        self.assertEqual((r["count"], r["next"], r["previous"], len(r["results"])), (25, 2, None, 20))
+        self.assertNotIn("count_exact", r)
+
+    @override_settings(PAGINATION_COUNT_CAP=10)
+    def test_cursor_count_is_capped_integer(self):
+        self.add_transactions(12)
+        page = self.page()
+        self.assertEqual((page["count"], page["count_exact"]), (10, False))
+        self.assertEqual(self.client.get("/api/notifications/delta", {"cursor": ""}).data["count_exact"], True)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get("/api/reports/transactions", {"cursor": "not-a-cursor"}).status_code, 400)
+
+    def test_cursor_round_trip(self):
+        tx = Notification.objects.create(user=self.user, type="ANNOUNCEMENT", title="t")
+        self.assertEqual(decode_cursor(encode_cursor(tx.created_at, tx.pk, "prev")), (tx.created_at, tx.pk, "prev"))
+
+    def test_notification_history_pages_under_inserts(self):
+        notify_bulk([Notification(user_id=self.user.id, type="ANNOUNCEMENT", title=f"n{i}") for i in range(15)])
+        original = list(Notification.objects.filter(user=self.user).values_list("id", flat=True))
+
+        first = self.client.get("/api/notifications/delta", {"cursor": "", "page_size": 10}).data
+        notify_bulk([Notification(user_id=self.user.id, type="ANNOUNCEMENT", title="new")])
+        second = self.client.get("/api/notifications/delta", {"cursor": first["next"], "page_size": 10}).data
+
+        ids = [n["id"] for n in first["items"] + second["items"]]
+        self.assertEqual(ids, sorted(original, reverse=True))
+        self.assertIsNone(second["next"])
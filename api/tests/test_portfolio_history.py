@@ -0,0 +1,81 @@
+# api/tests/test_portfolio_history.py
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import FxRate, MetalPrice, PortfolioDaily
+from api.portfolio_history import materialize_portfolio_daily
+from api.rates import bump_rates_generation
+from api.utils import record_transaction
+
+
+class PortfolioHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        since = timezone.make_aware(datetime(2024, 12, 1))
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"), fetched_at=since)
+        FxRate.objects.create(base="USD", quote="EUR", rate=Decimal("0.5"), fetched_at=since)
+        bump_rates_generation()
+        self.user = User.objects.create_user(username="history@x.com", password="pw")
+        self.add("2025-01-01", asset_type="CASH", currency_code="USD", amount=Decimal("100"))
+        self.add("2025-01-02", asset_type="GOLD", karat=24, weight_g=Decimal("10"))
+
+    def add(self, day, **tx):
+        return record_transaction(user=self.user, date=day, operation_type="ADD", **tx)
+
+    def totals(self):
+        return {d.day.day: d.total_value for d in PortfolioDaily.objects.filter(user=self.user)}
+
+    def test_incremental_catch_up_matches_full_rebuild(self):
+        self.assertEqual(materialize_portfolio_daily(self.user, until=date(2025, 1, 5)), 5)
+        self.assertEqual(materialize_portfolio_daily(self.user, until=date(2025, 1, 10)), 6)  # يعيد الخامس
+        incremental = self.totals()
+
+        self.assertEqual(materialize_portfolio_daily(self.user, until=date(2025, 1, 10), full=True), 10)
+        self.assertEqual(self.totals(), incremental)
+        self.assertEqual((incremental[1], incremental[2], incremental[10]),
+                         (Decimal("100.00"), Decimal("900.00"), Decimal("900.00")))
+
+    def test_back_dated_transaction_invalidates_from_its_date(self):
+        materialize_portfolio_daily(self.user, until=date(2025, 1, 10))
+
+        self.add("2025-01-04", asset_type="CASH", currency_code="USD", amount=Decimal("50"))
+        self.assertEqual(sorted(self.totals()), [1, 2, 3])
+
+        self.assertEqual(materialize_portfolio_daily(self.user, until=date(2025, 1, 10)), 8)  # 3..10
+        totals = self.totals()
+        self.assertEqual((totals[3], totals[4], totals[10]), (Decimal("900.00"), Decimal("950.00"), Decimal("950.00")))
+
+    def test_until_before_first_transaction_keeps_history(self):
+        materialize_portfolio_daily(self.user, until=date(2025, 1, 10))
+
+        self.assertEqual(materialize_portfolio_daily(self.user, until=date(2024, 12, 15)), 0)
+        self.assertEqual(PortfolioDaily.objects.filter(user=self.user).count(), 10)
+
+    def test_history_endpoint_converts_to_display_currency(self):
+        materialize_portfolio_daily(self.user, until=date(2025, 1, 3))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = "/api/reports/portfolio/history"
+
+        r = client.get(url, {"date_from": "2025-01-02", "date_to": "2025-01-31", "display_currency": "EUR"})
+        self.assertEqual(r.status_code, 200, r.data)
+        self.assertEqual(r.data["last_computed_day"], "2025-01-03")
+        self.assertEqual([(p["date"], p["total_value"], p["gold_value"]) for p in r.data["points"]],
+                         [("2025-01-02", "450.00", "400.00"), ("2025-01-03", "450.00", "400.00")])
+
+        etag = r["ETag"]
+        self.assertEqual(client.get(url, {"date_from": "2025-01-02", "date_to": "2025-01-31", "display_currency": "EUR"},
+                                    HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        materialize_portfolio_daily(self.user, until=date(2025, 1, 4))
+        r = client.get(url, {"date_from": "2025-01-02", "date_to": "2025-01-31", "display_currency": "EUR"},
+                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, len(r.data["points"])), (200, 3))
+
+        r = client.get(url, {"date_from": "2025-01-05", "date_to": "2025-01-01"})
+        self.assertEqual(r.status_code, 400)
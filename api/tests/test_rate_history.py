@@ -0,0 +1,155 @@
+# api/tests/test_rate_history.py
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import FxRate, FxRateDaily, MetalPrice, MetalPriceDaily
+from api.rate_history import AsOfPrices, rollup_and_prune
+from api.rates import bump_rates_generation
+from api.utils import record_transaction
+
+
+def at(day, hour):
+    return timezone.make_aware(datetime(2025, 1, day, hour))
+
+
+class RollupAndPruneTests(TestCase):
+    CUTOFF = at(20, 0)
+
+    def fx(self, rate, ts, quote="SYP"):
+        return FxRate.objects.create(base="USD", quote=quote, rate=Decimal(rate), fetched_at=ts)
+
+    def test_merges_ohlc_into_existing_daily_row(self):
+        # ملخص من تشغيل سابق لنفس اليوم: 10:00 → 14:00
+        FxRateDaily.objects.create(base="USD", quote="SYP", day=date(2025, 1, 10),
+                                   open=Decimal("100"), high=Decimal("112"), low=Decimal("99"), close=Decimal("110"),
+                                   open_at=at(10, 10), close_at=at(10, 14), samples=3)
+        self.fx("95", at(10, 8))    # قبل open_at => يصبح open
+        self.fx("120", at(10, 12))  # في الوسط => high فقط
+        self.fx("105", at(10, 16))  # بعد close_at => يصبح close
+        self.fx("130", at(11, 9))   # يوم آخر => ملخص جديد
+        latest = self.fx("140", at(25, 9))
+
+        result = rollup_and_prune("fx", self.CUTOFF, batch_size=2)  # الدمج عبر الدفعات أيضًا
+
+        self.assertEqual(result, {"rows": 4, "batches": 2})
+        d = FxRateDaily.objects.get(day=date(2025, 1, 10))
+        self.assertEqual((d.open, d.open_at, d.close, d.close_at), (Decimal("95"), at(10, 8), Decimal("105"), at(10, 16)))
+        self.assertEqual((d.high, d.low, d.samples), (Decimal("120"), Decimal("95"), 6))
+        d = FxRateDaily.objects.get(day=date(2025, 1, 11))
+        self.assertEqual((d.open, d.close, d.samples), (Decimal("130"), Decimal("130"), 1))
+        self.assertEqual(list(FxRate.objects.values_list("id", flat=True)), [latest.id])
+
+    def test_latest_row_per_key_is_never_pruned(self):
+        self.fx("13000", at(5, 9))
+        kept_fx = self.fx("13100", at(6, 9))  # قديم لكنه ما زال السعر الحالي
+        self.fx("4", at(5, 9), quote="MYR")
+        kept_myr = self.fx("4.1", at(6, 9), quote="MYR")
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"), fetched_at=at(5, 9))
+        kept_usd = MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("81"), fetched_at=at(6, 9))
+        kept_eur = MetalPrice.objects.create(metal="GOLD", currency="EUR", price_per_gram=Decimal("75"),
+                                             fetched_at=at(4, 9))  # المفتاح (المعدن، العملة)
+
+        self.assertEqual(rollup_and_prune("fx", self.CUTOFF)["rows"], 2)
+        self.assertEqual(rollup_and_prune("metals", self.CUTOFF)["rows"], 1)
+
+        self.assertEqual(set(FxRate.objects.values_list("id", flat=True)), {kept_fx.id, kept_myr.id})
+        self.assertEqual(set(MetalPrice.objects.values_list("id", flat=True)), {kept_usd.id, kept_eur.id})
+        self.assertEqual(MetalPriceDaily.objects.get().close, Decimal("80"))
+
+    def test_dry_run_counts_without_writing(self):
+        self.fx("13000", at(5, 9))
+        self.fx("13100", at(6, 9))
+        self.fx("13200", at(25, 9))
+
+        self.assertEqual(rollup_and_prune("fx", self.CUTOFF, dry_run=True), {"rows": 2, "batches": 0})
+        self.assertEqual(FxRate.objects.count(), 3)
+        self.assertFalse(FxRateDaily.objects.exists())
+
+
+def daily(model, day, close, **key):
+    ts = at(day, 16)
+    return model.objects.create(day=date(2025, 1, day), open=close, high=close, low=close, close=close,
+                                open_at=ts, close_at=ts, samples=1, **key)
+
+
+class AsOfPricesTests(TestCase):
+    def test_lookup_mixes_daily_summaries_and_raw_rows(self):
+        daily(FxRateDaily, 3, Decimal("12000"), base="USD", quote="SYP")  # خام مُقلَّم
+        FxRate.objects.create(base="USD", quote="SYP", rate=Decimal("13000"), fetched_at=at(10, 9))
+        daily(FxRateDaily, 4, Decimal("0.25"), base="MYR", quote="USD")
+
+        asof = AsOfPrices(date(2025, 1, 1), date(2025, 1, 15))
+        self.assertIsNone(asof.fx_rate("USD", "SYP", date(2025, 1, 2)))
+        self.assertEqual(asof.fx_rate("USD", "SYP", date(2025, 1, 7)), Decimal("12000"))
+        self.assertEqual(asof.fx_rate("USD", "SYP", date(2025, 1, 12)), Decimal("13000"))
+        self.assertEqual(asof.fx_rate("SYP", "USD", date(2025, 1, 7)), Decimal("1") / Decimal("12000"))
+        self.assertEqual(asof.fx_rate("MYR", "SYP", date(2025, 1, 7)), Decimal("3000"))  # عبر pivot
+
+        # ملخص قبل بداية الفترة يبقى ساريًا حتى أول نقطة داخلها
+        asof = AsOfPrices(date(2025, 1, 8), date(2025, 1, 15))
+        self.assertEqual(asof.fx_rate("USD", "SYP", date(2025, 1, 8)), Decimal("12000"))
+        self.assertEqual(asof.fx_rate("USD", "SYP", date(2025, 1, 10)), Decimal("13000"))
+
+    def test_prior_metal_point_is_kept_per_currency(self):
+        MetalPrice.objects.create(metal="GOLD", currency="USD", price_per_gram=Decimal("80"), fetched_at=at(2, 9))
+        MetalPrice.objects.create(metal="GOLD", currency="EUR", price_per_gram=Decimal("70"), fetched_at=at(1, 9))
+        daily(MetalPriceDaily, 3, Decimal("20"), metal="SILVER", currency="EUR")
+        daily(MetalPriceDaily, 2, Decimal("1"), metal="SILVER", currency="USD")
+        MetalPrice.objects.create(metal="GOLD", currency="USD", price_per_gram=Decimal("85"), fetched_at=at(12, 9))
+
+        asof = AsOfPrices(date(2025, 1, 10), date(2025, 1, 15))
+        self.assertEqual(asof.metal_price("GOLD", date(2025, 1, 10)), (Decimal("80"), "USD"))
+        self.assertEqual(asof.metal_price("GOLD", date(2025, 1, 13)), (Decimal("85"), "USD"))
+        self.assertEqual(asof.metal_price("SILVER", date(2025, 1, 10)), (Decimal("20"), "EUR"))
+        self.assertEqual({p[2] for p in asof._metals["GOLD"]._points}, {"USD", "EUR"})
+        self.assertEqual({p[2] for p in asof._metals["SILVER"]._points}, {"USD", "EUR"})
+
+
+class DashboardTransactionDateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # تاريخ مُقلَّم (ملخصات يومية) ثم خام حديث هو السعر الحالي
+        daily(FxRateDaily, 3, Decimal("0.8"), base="USD", quote="EUR")
+        daily(MetalPriceDaily, 3, Decimal("50"), metal="GOLD", currency="USD")
+        FxRate.objects.create(base="USD", quote="EUR", rate=Decimal("0.5"), fetched_at=at(10, 9))
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"), fetched_at=at(10, 9))
+        bump_rates_generation()
+
+        self.user = User.objects.create_user(username="dash@x.com", password="pw")
+        record_transaction(user=self.user, date="2025-01-05", operation_type="ADD", asset_type="CASH",
+                           currency_code="EUR", amount=Decimal("100"))
+        record_transaction(user=self.user, date="2025-01-04", operation_type="ADD", asset_type="GOLD",
+                           karat=24, weight_g=Decimal("5"))
+        record_transaction(user=self.user, date="2025-01-12", operation_type="ADD", asset_type="GOLD",
+                           karat=24, weight_g=Decimal("10"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def dashboard(self, valuation):
+        r = self.client.get("/api/reports/dashboard", {"date_from": "2025-01-02", "date_to": "2025-01-20",
+                                                        "display_currency": "USD", "valuation": valuation})
+        self.assertEqual(r.status_code, 200, r.data)
+        return r.data
+
+    def test_values_use_prices_in_effect_on_each_transaction_date(self):
+        data = self.dashboard("transaction_date")
+        added = data["sections"]["added"]
+        self.assertEqual(data["valuation"], "transaction_date")
+        self.assertEqual(added["cash"]["value"], "125.00")   # 100 / 0.8
+        self.assertEqual(added["gold"]["value"], "1050.00")  # 5×50 + 10×80
+        self.assertEqual(added["total_value"], "1175.00")
+        self.assertEqual(data["series"], [{"month": "2025-01", "added": "1175.00", "withdrawn": "0.00",
+                                           "zakat_paid": "0.00"}])
+
+        added = self.dashboard("current")["sections"]["added"]
+        self.assertEqual((added["cash"]["value"], added["gold"]["value"]), ("200.00", "1200.00"))
+
+    def test_unknown_valuation_is_rejected(self):
+        r = self.client.get("/api/reports/dashboard", {"valuation": "yesterday"})
+        self.assertEqual(r.status_code, 400)
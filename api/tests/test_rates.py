@@ -0,0 +1,164 @@
+# api/tests/test_rates.py
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import providers, rates
+from api.models import FxRate, MetalPrice, RatesGeneration, UserSettings
+from api.utils import ValuationContext
+
+
+class RatesGenerationTests(TestCase):
+    def setUp(self):
+        rates._generation = (0, float("-inf"))
+
+    def test_bump_from_another_process_is_seen_after_poll(self):
+        rates.bump_rates_generation()
+        book = rates.get_rate_book()
+        self.assertEqual(book.generation, 1)
+
+        RatesGeneration.objects.filter(pk=1).update(value=7)  # مثل رفع من cron fetch_rates
+        with override_settings(RATES_GENERATION_POLL_SECONDS=3600):
+            self.assertIs(rates.get_rate_book(), book)
+        with override_settings(RATES_GENERATION_POLL_SECONDS=0):
+            self.assertEqual(rates.get_rate_book().generation, 7)
+
+
+class FxProvider(providers.FxProviderBase):
+    def fetch(self, base, targets):
+        return [(base, t, Decimal("2")) for t in targets]
+
+
+class BrokenMetalsProvider(providers.MetalsProviderBase):
+    def fetch_gold_silver_per_gram(self, currency):
+        raise ConnectionError("metals down")
+
+
+@override_settings(FX_BASE_CURRENCY="USD", FX_TARGETS=["SYP", "MYR"])
+class FetchRatesTests(TestCase):
+    def test_failed_provider_does_not_discard_the_others(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers), override_settings(RATES_FETCH_CONCURRENCY=workers), \
+                    mock.patch.object(providers, "pick_fx_provider", FxProvider), \
+                    mock.patch.object(providers, "pick_metals_provider", BrokenMetalsProvider), \
+                    self.assertLogs("api.providers", "ERROR"):
+                FxRate.objects.all().delete()
+                with self.assertRaises(ConnectionError):
+                    providers.fetch_and_store_rates()
+                self.assertEqual(sorted(FxRate.objects.values_list("quote", flat=True)), ["MYR", "SYP"])
+                self.assertFalse(MetalPrice.objects.exists())
+
+
+class HttpSessionTests(SimpleTestCase):
+    def test_each_thread_gets_its_own_session_over_one_adapter(self):
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(providers.http_session())) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        sessions.append(providers.http_session())
+
+        self.assertEqual(len({id(s) for s in sessions}), 3)
+        self.assertEqual(len({id(s.get_adapter("https://example.com")) for s in sessions}), 1)
+        self.assertIs(providers.http_session(), sessions[-1])  # نفس الخيط => نفس الجلسة
+
+
+class FxMatrixTests(SimpleTestCase):
+    ROWS = [
+        {"base": "USD", "quote": "SYP", "rate": "13000"},
+        {"base": "MYR", "quote": "USD", "rate": "0.25"},
+        {"base": "EUR", "quote": "GBP", "rate": "0.8"},  # لا يمر بـ pivot
+        {"base": "USD", "quote": "XXX", "rate": "0"},    # معدّل غير صالح يُتجاهل
+    ]
+
+    def setUp(self):
+        self.fx = rates.FxMatrix.from_rows(self.ROWS, "usd")
+
+    def test_direct_inverse_and_cross_rates(self):
+        self.assertEqual(self.fx.rate("USD", "SYP"), Decimal("13000"))
+        self.assertEqual(self.fx.rate("syp", "usd"), Decimal("1") / Decimal("13000"))
+        self.assertEqual(self.fx.rate("USD", "MYR"), Decimal("4"))
+        self.assertEqual(self.fx.rate("MYR", "SYP"), Decimal("0.25") * Decimal("13000"))
+        self.assertEqual(self.fx.rate("GBP", "EUR"), Decimal("1") / Decimal("0.8"))
+        self.assertEqual(self.fx.rate("EUR", "EUR"), Decimal("1"))
+
+    def test_direct_row_wins_over_cross_rate(self):
+        fx = rates.FxMatrix.from_rows(self.ROWS + [{"base": "MYR", "quote": "SYP", "rate": "3000"}], "USD")
+        self.assertEqual(fx.rate("MYR", "SYP"), Decimal("3000"))
+        self.assertEqual(fx.rate("SYP", "MYR"), Decimal("1") / Decimal("3000"))
+
+    def test_missing_leg_returns_none(self):
+        self.assertIsNone(self.fx.rate("EUR", "SYP"))  # EUR لا يصل إلى pivot
+        self.assertIsNone(self.fx.rate("USD", "XXX"))
+        self.assertIsNone(self.fx.rate("USD", "JPY"))
+
+
+class ValuationContextFxTests(SimpleTestCase):
+    def ctx(self, overrides=None):
+        ctx = ValuationContext(None, user_settings=UserSettings(display_currency="SYP", user_fx_overrides=overrides or {}))
+        ctx.fx = rates.FxMatrix.from_rows(FxMatrixTests.ROWS, "USD")
+        return ctx
+
+    def test_matrix_without_overrides(self):
+        self.assertEqual(self.ctx().fx_rate("MYR", "SYP"), Decimal("3250"))
+        self.assertIsNone(self.ctx().fx_rate("EUR", "SYP"))
+
+    def test_override_direct_inverse_and_through_pivot(self):
+        ctx = self.ctx({"USD->SYP": 15000})
+        self.assertEqual(ctx.fx_rate("USD", "SYP"), Decimal("15000"))
+        self.assertEqual(ctx.fx_rate("SYP", "USD"), Decimal("1") / Decimal("15000"))
+        self.assertEqual(ctx.fx_rate("MYR", "SYP"), Decimal("0.25") * Decimal("15000"))  # عبر override الـ pivot
+
+    def test_invalid_override_falls_back_to_matrix(self):
+        self.assertEqual(self.ctx({"USD->SYP": "abc"}).fx_rate("USD", "SYP"), Decimal("13000"))
+        self.assertEqual(self.ctx({"USD->SYP": 0}).fx_rate("USD", "SYP"), Decimal("13000"))
+
+
+@override_settings(RATES_CHANGE_TOLERANCE="0.001")
+class StoreRatesTests(TestCase):
+    def generation(self):
+        return RatesGeneration.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+
+    def test_fx_change_within_tolerance_only_confirms(self):
+        first = providers.store_fx_rates([("USD", "SYP", Decimal("13000"))], source="test")
+        generation = self.generation()
+
+        rows = providers.store_fx_rates([("USD", "SYP", Decimal("13010"))], source="test")  # 0.08%
+
+        self.assertEqual(rows, [])
+        self.assertEqual(FxRate.objects.count(), 1)
+        self.assertEqual(self.generation(), generation)
+        confirmed = FxRate.objects.get()
+        self.assertEqual(confirmed.rate, Decimal("13000"))
+        self.assertGreater(confirmed.last_confirmed_at, first[0].fetched_at)
+
+    def test_fx_change_outside_tolerance_inserts_and_bumps(self):
+        providers.store_fx_rates([("USD", "SYP", Decimal("13000")), ("USD", "MYR", Decimal("4"))], source="test")
+        generation = self.generation()
+
+        rows = providers.store_fx_rates([("USD", "SYP", Decimal("13500")), ("USD", "MYR", Decimal("4"))], source="test")
+
+        self.assertEqual([(r.quote, r.rate) for r in rows], [("SYP", Decimal("13500"))])
+        self.assertEqual(FxRate.objects.filter(quote="SYP").count(), 2)
+        self.assertEqual(FxRate.objects.filter(quote="MYR").count(), 1)
+        self.assertEqual(self.generation(), generation + 1)
+
+    def test_metals_only_changed_metal_gets_a_row(self):
+        providers.store_metal_prices_from_per_gram(Decimal("80"), Decimal("1"), "USD", source="test")
+        generation = self.generation()
+
+        self.assertEqual(providers.store_metal_prices_from_per_gram(Decimal("80.05"), Decimal("1"), "USD", "test"), [])
+        self.assertEqual(self.generation(), generation)
+        self.assertTrue(MetalPrice.objects.filter(metal="GOLD", last_confirmed_at__isnull=False).exists())
+
+        rows = providers.store_metal_prices_from_per_gram(Decimal("80"), Decimal("1.2"), "USD", source="test")
+        self.assertEqual([r.metal for r in rows], ["SILVER"])
+        self.assertEqual(self.generation(), generation + 1)
+
+    def test_metal_currency_change_is_a_change(self):
+        providers.store_metal_prices_from_per_gram(Decimal("80"), None, "USD", source="test")
+        rows = providers.store_metal_prices_from_per_gram(Decimal("80"), None, "EUR", source="test")
+        self.assertEqual([(r.metal, r.currency) for r in rows], [("GOLD", "EUR")])
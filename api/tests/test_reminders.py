@@ -0,0 +1,86 @@
+# api/tests/test_reminders.py
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.hijri import to_hijri
+from api.models import Notification, ReminderSchedule, ZakatAnchor
+from api.utils import _anchor_due_at, _anchor_due_date, dispatch_due_reminders, schedule_anchor_reminders
+
+
+@override_settings(ZAKAT_TEST_MODE=False)
+class DispatchDueRemindersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="remind@x.com", password="pw")
+
+    def anchor(self, days_until_due: int, group: str = "GOLD_PURE") -> ZakatAnchor:
+        due = to_hijri(timezone.now().date() + timedelta(days=days_until_due))
+        start = due._replace(year=due.year - 1)
+        anc = ZakatAnchor(user=self.user, asset_group=group, status="ACTIVE",
+                          start_hijri_year=start.year, start_hijri_month=start.month, start_hijri_day=min(start.day, 29),
+                          due_hijri_year=due.year, due_hijri_month=due.month, due_hijri_day=due.day)
+        anc.due_date = _anchor_due_date(anc)
+        anc.save()
+        schedule_anchor_reminders(anc)
+        return anc
+
+    def stages_sent(self):
+        return sorted(ReminderSchedule.objects.filter(sent_at__isnull=False).values_list("stage", flat=True))
+
+    def test_each_stage_is_sent_once(self):
+        anc = self.anchor(days_until_due=5)  # T-10 فات، البقية لاحقًا
+        self.assertEqual(dispatch_due_reminders(), 1)
+        self.assertEqual(dispatch_due_reminders(), 0)
+        self.assertEqual(dispatch_due_reminders(user_ids=[self.user.id]), 0)
+        self.assertEqual(self.stages_sent(), ["T-10"])
+
+        due_at = _anchor_due_at(anc)
+        self.assertEqual(dispatch_due_reminders(now=due_at - timedelta(days=3)), 1)
+        self.assertEqual(dispatch_due_reminders(now=due_at - timedelta(days=3)), 0)
+        self.assertEqual(dispatch_due_reminders(now=due_at), 1)
+        self.assertEqual(dispatch_due_reminders(now=due_at + timedelta(days=30)), 1)
+        self.assertEqual(dispatch_due_reminders(now=due_at + timedelta(days=30)), 0)
+
+        self.assertEqual(self.stages_sent(), ["T+3", "T-10", "T-3", "T0"])
+        keys = list(Notification.objects.filter(user=self.user).values_list("meta_key", flat=True))
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(len(set(keys)), 4)
+
+    def test_missed_stages_send_only_the_latest(self):
+        anc = self.anchor(days_until_due=20)
+        self.assertEqual(dispatch_due_reminders(), 0)
+
+        self.assertEqual(dispatch_due_reminders(now=_anchor_due_at(anc) + timedelta(days=4), batch_size=2), 1)
+        self.assertEqual(self.stages_sent(), ["T+3", "T-10", "T-3", "T0"])
+        self.assertEqual(list(Notification.objects.values_list("meta_key", flat=True)),
+                         [f"ZK:GOLD_PURE:{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}:T+3"])
+
+    def test_rescheduling_the_same_anchor_does_not_resend(self):
+        anc = self.anchor(days_until_due=5)
+        dispatch_due_reminders()
+        schedule_anchor_reminders(anc)  # التكرار يُتجاهل بالقيد الفريد
+        ReminderSchedule.objects.update(sent_at=None)  # حتى لو أعيدت المحاولة: القيد الفريد على الإشعار
+        self.assertEqual(dispatch_due_reminders(), 0)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+
+
+    def test_anchor_locked_elsewhere_is_left_whole_to_its_worker(self):
+        mine, theirs = self.anchor(days_until_due=20), self.anchor(days_until_due=20, group="SILVER")
+        later = _anchor_due_at(mine) + timedelta(days=4)  # كل المراحل فاتت للحولين
+        lock = ZakatAnchor.objects.select_for_update
+
+        # عامل آخر يقفل حول الفضة (skip_locked يتخطاه): لا نلمس أيًا من مراحله
+        with mock.patch.object(ZakatAnchor.objects, "select_for_update",
+                               lambda **kw: lock(**kw).exclude(id=theirs.id)):
+            self.assertEqual(dispatch_due_reminders(now=later, batch_size=1), 1)
+        self.assertFalse(ReminderSchedule.objects.filter(anchor=theirs, sent_at__isnull=False).exists())
+
+        # ثم يرسل ذلك العامل أحدث مراحله فقط
+        self.assertEqual(dispatch_due_reminders(now=later, batch_size=1), 1)
+        self.assertEqual(sorted(Notification.objects.values_list("meta_key", flat=True)),
+                         sorted(f"ZK:{a.asset_group}:{a.due_hijri_year}-{a.due_hijri_month}-{a.due_hijri_day}:T+3"
+                                for a in (mine, theirs)))
+        self.assertFalse(ReminderSchedule.objects.filter(sent_at__isnull=True).exists())
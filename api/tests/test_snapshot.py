@@ -0,0 +1,93 @@
+# api/tests/test_snapshot.py
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Notification, Profile, ReminderSchedule, ZakatAnchor
+from api.utils import snapshot_etag
+
+
+class LoginSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()  # ختم التقييم في الكاش: كل اختبار يبدأ بتقييم جديد
+        self.user = User.objects.create_user(username="login@x.com", password="pw")
+        self.client = APIClient()
+
+    def login(self, since_version=None):
+        url = "/api/auth/login" + (f"?since_version={since_version}" if since_version else "")
+        r = self.client.post(url, {"email": "login@x.com", "password": "pw"}, format="json")
+        self.assertEqual(r.status_code, 200)
+        return r.data["snapshot"]
+
+    def test_delta_includes_reminder_emitted_by_login_evaluation(self):
+        anchor = ZakatAnchor.objects.create(user=self.user, asset_group="SILVER", status="ACTIVE")
+        ReminderSchedule.objects.create(anchor=anchor, user=self.user, stage="T0", title="حان موعد الزكاة",
+                                        fire_at=timezone.now() - timedelta(hours=1), meta_key="zakat:test:T0")
+
+        snap = self.login(since_version=1)
+
+        note = Notification.objects.get(user=self.user)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(snap["version"], profile.snapshot_version)
+        self.assertEqual(snap["etag"], snapshot_etag(profile))
+        self.assertIn("notifications", snap["changed_sections"])
+        self.assertEqual([n["id"] for n in snap["notifications"]], [note.id])
+
+    def test_second_login_skips_evaluation_and_reports_no_changes(self):
+        first = self.login()
+        snap = self.login(since_version=first["version"])
+        self.assertEqual(snap["version"], first["version"])
+        self.assertEqual(snap["changed_sections"], [])
+
+
+class SnapshotDeltaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="delta@x.com", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def full(self):
+        r = self.client.get("/api/snapshot")
+        self.assertEqual(r.status_code, 200)
+        return r.data
+
+    def test_write_returns_only_changed_sections(self):
+        v = self.full()["version"]
+        r = self.client.post(f"/api/assets/cash/add?since_version={v}",
+                             {"currency_code": "USD", "amount": "50", "date": "2025-01-15"}, format="json")
+        snap = r.data["snapshot"]
+        self.assertEqual(snap["version"], v + 1)
+        self.assertEqual(sorted(snap["changed_sections"]), ["assets", "transactions"])
+        self.assertNotIn("profile", snap)
+        self.assertEqual([t["id"] for t in snap["transactions"]], [r.data["operation_id"]])
+
+    def test_delete_sends_tombstone_and_stale_client_gets_all_changes(self):
+        v = self.full()["version"]
+        tx_id = self.client.post("/api/assets/cash/add", {"currency_code": "USD", "amount": "50", "date": "2025-01-15"},
+                                 format="json").data["operation_id"]
+        self.client.patch("/api/profile", {"full_name": "Test"}, format="json")
+        self.client.post(f"/api/transactions/{tx_id}/delete", {"delete_reason": "خطأ"}, format="json")
+
+        delta = self.client.get(f"/api/snapshot?since_version={v}").data
+        self.assertEqual(sorted(delta["changed_sections"]), ["assets", "profile", "transactions"])
+        self.assertEqual(delta["removed"]["transactions"], [tx_id])
+        self.assertEqual(delta["transactions"], [])
+        self.assertEqual(delta["profile"]["full_name"], "Test")
+
+    def test_etag_of_older_version_returns_delta(self):
+        snap = self.full()
+        self.client.patch("/api/profile", {"city": "Damascus"}, format="json")
+        r = self.client.get("/api/snapshot", HTTP_IF_NONE_MATCH=f'"{snap["etag"]}"')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["since_version"], snap["version"])
+        self.assertEqual(r.data["changed_sections"], ["profile"])
+
+    def test_unknown_since_version_returns_full_snapshot(self):
+        r = self.client.get("/api/snapshot?since_version=999")
+        self.assertNotIn("delta", r.data)
+        self.assertIn("profile", r.data)
@@ -0,0 +1,45 @@
+# api/tests/test_stream.py
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+@override_settings(STREAM_LONGPOLL_SECONDS=0.01)
+class StreamAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="stream@x.com", password="pw")
+        self.access = str(AccessToken.for_user(self.user))
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.api = api
+
+    def ticket(self):
+        r = self.api.post("/api/notifications/stream/ticket")
+        self.assertEqual(r.status_code, 200)
+        return r.data["ticket"]
+
+    async def test_ticket_authenticates_the_stream(self):
+        ticket = await sync_to_async(self.ticket)()
+        r = await self.async_client.get("/api/notifications/stream", {"ticket": ticket, "since_version": 1})
+        self.assertEqual(r.status_code, 204)
+
+    async def test_access_token_is_not_accepted_in_the_url(self):
+        for param in ("ticket", "token"):
+            r = await self.async_client.get("/api/notifications/stream", {param: self.access})
+            self.assertEqual(r.status_code, 401, param)
+
+    async def test_bearer_header_still_works(self):
+        r = await self.async_client.get("/api/notifications/stream", {"since_version": 0},
+                                        headers={"Authorization": f"Bearer {self.access}"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["version"], 1)
+
+    def test_ticket_is_not_an_access_token(self):
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f"Bearer {self.ticket()}")
+        self.assertEqual(other.get("/api/snapshot").status_code, 401)
+
+    def test_disabled_under_wsgi(self):
+        self.assertEqual(self.api.get("/api/notifications/stream").status_code, 501)
@@ -0,0 +1,47 @@
+# api/tests/test_zakat_refresh.py
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from api import zakat_refresh
+from api.models import MetalPrice, Profile
+from api.rates import bump_rates_generation
+from api.utils import bump_snapshot_version
+
+
+class EvaluationStampTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"))
+        bump_rates_generation()
+        self.user = User.objects.create_user(username="stamp@x.com", password="pw")
+
+    def fresh_user(self):
+        """كما يحمّله عامل آخر: من القاعدة، بلا ذاكرة من هذه العملية."""
+        return User.objects.select_related("profile").get(pk=self.user.pk)
+
+    def test_stamp_is_stored_on_profile_and_shared_between_processes(self):
+        updated_at = Profile.objects.get(user=self.user).updated_at
+        with mock.patch.object(zakat_refresh, "update_zakat_anchors_and_reminders") as evaluate:
+            self.assertTrue(zakat_refresh.evaluate_now(self.fresh_user()))
+            cache.clear()  # كاش عملية أخرى فارغ
+            self.assertFalse(zakat_refresh.evaluate_now(self.fresh_user()))
+        self.assertEqual(evaluate.call_count, 1)
+
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.zakat_eval_stamp, zakat_refresh.evaluation_stamp(profile))
+        self.assertEqual(profile.updated_at, updated_at)  # الختم لا يغيّر ETag/دلتا الملف الشخصي
+
+    def test_snapshot_or_rates_change_needs_evaluation_again(self):
+        zakat_refresh.evaluate_now(self.fresh_user())
+        self.assertFalse(zakat_refresh.needs_evaluation(self.fresh_user()))
+
+        bump_snapshot_version(self.fresh_user(), sections=("assets",))
+        self.assertTrue(zakat_refresh.needs_evaluation(self.fresh_user()))
+        zakat_refresh.evaluate_now(self.fresh_user())
+
+        bump_rates_generation()
+        self.assertTrue(zakat_refresh.needs_evaluation(self.fresh_user()))
@@ -0,0 +1,197 @@
+# api/tests/test_zakat_sync.py
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import (
+    MetalPrice, Notification, ReminderSchedule, UserSettings, ZakatAnchor, ZakatDirtyUser, ZakatSyncRun,
+)
+from api.nisab_batch import evaluate_nisab_batch
+from api.providers import store_rates
+from api.rates import bump_rates_generation
+from api.utils import (
+    ValuationContext, cash_nisab_position, meets_nisab_gold_pure, meets_nisab_silver, record_transaction,
+    update_zakat_anchors_and_reminders,
+)
+from api.zakat_sync import sync_users
+
+COMMAND = "api.management.commands.sync_zakat.sync_users"
+
+
+class SyncUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"))
+        bump_rates_generation()
+
+    def user(self, name, **tx):
+        u = User.objects.create_user(username=name, password="pw")
+        if tx:
+            record_transaction(user=u, date="2025-01-15", operation_type="ADD", **tx)
+        return u
+
+    def test_batch_matches_per_user_rules(self):
+        users = [
+            self.user("gold@x.com", asset_type="GOLD", karat=24, weight_g=Decimal("90")),
+            self.user("silver@x.com", asset_type="SILVER", weight_g=Decimal("600")),
+            self.user("rich@x.com", asset_type="CASH", currency_code="USD", amount=Decimal("7000")),
+            self.user("poor@x.com", asset_type="CASH", currency_code="USD", amount=Decimal("10")),
+        ]
+        results = evaluate_nisab_batch([u.id for u in users])
+        for u in users:
+            ctx = ValuationContext(u)
+            meets_cash, cash_usd = cash_nisab_position(u, ctx)
+            expected = {"GOLD_PURE": meets_nisab_gold_pure(u, ctx), "SILVER": meets_nisab_silver(u, ctx),
+                        "CASH_POOL": meets_cash, "CASH_USD": cash_usd}
+            self.assertEqual(results[u.id], expected, u.username)
+
+    def test_batch_and_per_user_store_the_same_cash_value(self):
+        a = self.user("a@x.com", asset_type="CASH", currency_code="USD", amount=Decimal("7000"))
+        b = self.user("b@x.com", asset_type="CASH", currency_code="USD", amount=Decimal("7000"))
+        sync_users([a.id])
+        update_zakat_anchors_and_reminders(b)
+        values = ZakatAnchor.objects.filter(asset_group="CASH_POOL").values_list("user_id", "cash_value_usd")
+        self.assertEqual(dict(values), {a.id: Decimal("7000"), b.id: Decimal("7000")})
+
+    def test_user_without_settings_is_evaluated_with_defaults_and_dequeued(self):
+        u = self.user("nosettings@x.com", asset_type="CASH", currency_code="USD", amount=Decimal("7000"))
+        UserSettings.objects.filter(user=u).delete()
+
+        result = sync_users([u.id], dirty_before=timezone.now())
+
+        self.assertEqual((result["processed"], result["failed"]), (1, 0))
+        self.assertFalse(ZakatDirtyUser.objects.filter(user=u).exists())
+        self.assertEqual(ZakatAnchor.objects.get(user=u, asset_group="CASH_POOL").status, "ACTIVE")
+
+
+class DirtyQueueTests(TestCase):
+    """من يُوضع في طابور ZakatDirtyUser، ومن يلمسه sync_zakat في الوضع الافتراضي."""
+
+    def setUp(self):
+        cache.clear()
+        MetalPrice.objects.create(metal="GOLD", price_per_gram=Decimal("80"))  # النصاب 6800$
+        bump_rates_generation()
+
+    def user(self, name, amount=None, currency="USD"):
+        u = User.objects.create_user(username=name, password="pw")
+        if amount is not None:
+            record_transaction(user=u, date="2025-01-15", operation_type="ADD", asset_type="CASH",
+                               currency_code=currency, amount=Decimal(amount))
+        return u
+
+    def dirty(self):
+        return set(ZakatDirtyUser.objects.values_list("user_id", flat=True))
+
+    def test_write_endpoints_mark_user_dirty(self):
+        u = self.user("writer@x.com")
+        client = APIClient()
+        client.force_authenticate(u)
+
+        r = client.post("/api/assets/cash/add", {"date": "2025-01-15", "currency_code": "USD", "amount": "100"},
+                        format="json")
+        self.assertIn(r.status_code, (200, 201), r.data)
+        self.assertEqual(self.dirty(), {u.id})
+
+        ZakatDirtyUser.objects.all().delete()
+        r = client.post(f"/api/transactions/{r.data['operation_id']}/edit", {"amount": "200", "edit_reason": "تصحيح"},
+                        format="json")
+        self.assertIn(r.status_code, (200, 201), r.data)
+        self.assertEqual(self.dirty(), {u.id})
+
+    def test_fx_change_marks_only_holders_of_that_currency(self):
+        syp = self.user("syp@x.com", amount="1000000", currency="SYP")
+        self.user("usd@x.com", amount="100")
+        ZakatDirtyUser.objects.all().delete()
+
+        store_rates({"fx": [("USD", "SYP", Decimal("13000"))], "metals": None})
+
+        self.assertEqual(self.dirty(), {syp.id})
+
+    def test_gold_change_marks_only_users_whose_cash_nisab_can_flip(self):
+        rich = self.user("rich@x.com", amount="20000")     # فوق النصاب قبل وبعد
+        poor = self.user("poor@x.com", amount="10")        # تحته قبل وبعد
+        edge = self.user("edge@x.com", amount="7000")      # فوقه بـ 80 وتحته بـ 90
+        sync_users([rich.id, poor.id, edge.id], dirty_before=timezone.now())
+        fresh = self.user("fresh@x.com", amount="100")     # لم يُقيَّم بعد
+        ZakatDirtyUser.objects.all().delete()
+
+        store_rates({"fx": [], "metals": {"gold_g_per": Decimal("90"), "silver_g_per": None, "currency": "USD"}})
+        self.assertEqual(self.dirty(), {edge.id, fresh.id})
+
+        # الاتجاه المعاكس: غير المثبت يبلغ النصاب إن هبط السعر
+        sync_users([edge.id, fresh.id], dirty_before=timezone.now())
+        ZakatDirtyUser.objects.all().delete()
+        store_rates({"fx": [], "metals": {"gold_g_per": Decimal("70"), "silver_g_per": None, "currency": "USD"}})
+        self.assertEqual(self.dirty(), {edge.id})
+
+    def test_dirty_mode_touches_only_queued_users_and_due_reminders(self):
+        queued = self.user("queued@x.com", amount="7000")
+        idle = self.user("idle@x.com", amount="7000")
+        ZakatDirtyUser.objects.filter(user=idle).delete()
+        reminded = self.user("reminded@x.com")
+        anc = ZakatAnchor.objects.create(user=reminded, asset_group="GOLD_PURE", status="ACTIVE")
+        ReminderSchedule.objects.create(anchor=anc, user=reminded, stage="T0", title="تذكير",
+                                        fire_at=timezone.now() - timedelta(hours=1), meta_key="ZK:GOLD_PURE:x:T0")
+
+        call_command("sync_zakat", stdout=StringIO())
+
+        self.assertEqual(self.dirty(), set())
+        self.assertEqual(ZakatAnchor.objects.get(user=queued, asset_group="CASH_POOL").status, "ACTIVE")
+        self.assertFalse(ZakatAnchor.objects.filter(user=idle).exists())
+        self.assertEqual(list(Notification.objects.values_list("user_id", flat=True)), [reminded.id])
+        self.assertTrue(ReminderSchedule.objects.get(anchor=anc).sent_at)
+
+
+class SyncCommandShardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f"u{i}@x.com", password="pw").id for i in range(10)]
+
+    def run_command(self, *args):
+        """يشغّل sync_zakat ويرجع المعرّفات التي مرّت على sync_users."""
+        seen = []
+
+        def spy(chunk, dirty_before=None):
+            seen.extend(chunk)
+            return sync_users(chunk, dirty_before)
+
+        with mock.patch(COMMAND, side_effect=spy):
+            call_command("sync_zakat", "--all", "--chunk-size", "3", *args, stdout=StringIO())
+        return seen
+
+    def test_mod_shards_are_disjoint_and_cover_every_user(self):
+        shards = [self.run_command("--shard", f"{i}/3") for i in range(3)]
+
+        self.assertEqual(sum(len(s) for s in shards), len(self.users))
+        self.assertEqual(sorted(uid for s in shards for uid in s), self.users)
+        for i, ids in enumerate(shards):
+            self.assertTrue(all(uid % 3 == i for uid in ids), ids)
+        runs = ZakatSyncRun.objects.order_by("shard_index")
+        self.assertEqual([(r.shard_index, r.shard_count, r.processed) for r in runs],
+                         [(i, 3, len(shards[i])) for i in range(3)])
+        self.assertTrue(all(r.finished_at for r in runs))
+
+    def test_unfinished_run_resumes_after_last_user_id(self):
+        run = ZakatSyncRun.objects.create(mode="all", last_user_id=self.users[3], processed=4)
+
+        seen = self.run_command()
+
+        self.assertEqual(seen, self.users[4:])
+        run.refresh_from_db()
+        self.assertEqual((run.processed, run.last_user_id), (len(self.users), self.users[-1]))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(ZakatSyncRun.objects.count(), 1)
+
+        # تشغيل مكتمل لا يُستأنف؛ وكذلك غير المكتمل مع --restart
+        self.assertEqual(self.run_command(), self.users)
+        ZakatSyncRun.objects.create(mode="all", last_user_id=self.users[5])
+        self.assertEqual(self.run_command("--restart"), self.users)
+        self.assertEqual(ZakatSyncRun.objects.filter(mode="all", finished_at__isnull=True).count(), 1)
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .stream import notifications_stream
 
 urlpatterns = [
     path("healthz/", health, name="healthz"),
@@ -13,7 +14,10 @@ urlpatterns = [
 
     # Notifications / Sync
     path("sync/heartbeat", heartbeat, name="heartbeat"),
+    path("snapshot", snapshot, name="snapshot"),
     path("notifications/delta", notifications_delta, name="notifications_delta"),
+    path("notifications/stream", notifications_stream, name="notifications_stream"),
+    path("notifications/stream/ticket", notifications_stream_ticket, name="notifications_stream_ticket"),
     path("notifications/<int:pk>/read", notification_mark_read, name="notification_mark_read"),
     path("rates", get_rates, name="get_rates"),
     path("rates/user", patch_user_rates, name="patch_user_rates"),
@@ -29,6 +33,7 @@ urlpatterns = [
     path("transactions/<int:pk>/edit", transaction_edit, name="transaction_edit"),
     path("transactions/<int:pk>/delete", transaction_delete, name="transaction_delete"),
     path("reports/portfolio", report_portfolio, name="report_portfolio"),
+    path("reports/portfolio/history", report_portfolio_history, name="report_portfolio_history"),
     path("reports/zakat", report_zakat_overview, name="report_zakat_overview"),
     path("reports/transactions", report_transactions, name="report_transactions"),
     # تقارير الواجهة
@@ -2,15 +2,23 @@ import os, uuid, base64, hashlib, json
 from decimal import Decimal
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
+from django.db import transaction as db_transaction
+from django.db.models import Sum, Case, When, F, DecimalField, Count, Q
+from django.db.models.functions import TruncMonth
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from io import BytesIO
 from PIL import Image
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.core.cache import cache
 
+from .rates import get_rate_book, FxMatrix
+from .rate_history import AsOfPrices
+from .pubsub import publish_snapshot_version
 from .models import (
     Profile, UserSettings, Notification,
-    MetalPrice, FxRate, Transaction
+    MetalPrice, FxRate, Transaction, HoldingBalance, SyncTombstone, UserMonthlyFlow, PortfolioDaily,
+    ZakatDirtyUser, ReminderSchedule,
 )
 
 # -----------------------------
@@ -57,22 +65,12 @@ def save_base64_image_to_media(data_uri: str, folder: str = "uploads") -> str:
 # أسعار ومعاملات مساعدة
 # -----------------------------
 def latest_metal_dict():
-    """أحدث أسعار ذهب/فضة لكل غرام (إن وجدت)."""
-    result = {"gold_g_per": None, "silver_g_per": None, "currency": "USD", "fetched_at": None}
-    gold = MetalPrice.objects.filter(metal="GOLD").order_by("-fetched_at").first()
-    silver = MetalPrice.objects.filter(metal="SILVER").order_by("-fetched_at").first()
-    if gold:
-        result["gold_g_per"] = str(gold.price_per_gram)
-        result["currency"] = gold.currency
-        result["fetched_at"] = gold.fetched_at.isoformat()
-    if silver:
-        result["silver_g_per"] = str(silver.price_per_gram)
-        if not result["fetched_at"]:
-            result["fetched_at"] = silver.fetched_at.isoformat()
-    return result
+    """أحدث أسعار ذهب/فضة لكل غرام (إن وجدت) من دفتر الأسعار في الذاكرة."""
+    return dict(get_rate_book().metals)
 
 def latest_fx_for_pairs(pairs):
-    """يرجع أحدث معدل لكل زوج إن وجد."""
+    """يرجع أحدث معدل لكل زوج إن وجد (من دفتر الأسعار في الذاكرة)."""
+    fx = get_rate_book().fx
     out = []
     seen = set()
     for base, quote in pairs:
@@ -80,54 +78,272 @@ def latest_fx_for_pairs(pairs):
         if key in seen:
             continue
         seen.add(key)
-        rec = FxRate.objects.filter(base=key[0], quote=key[1]).order_by("-fetched_at").first()
+        rec = fx.get(key)
         if rec:
-            out.append({
-                "base": rec.base,
-                "quote": rec.quote,
-                "rate": str(rec.rate),
-                "fetched_at": rec.fetched_at.isoformat()
-            })
+            out.append(dict(rec))
     return out
 
+def latest_rates_stamp() -> str:
+    """جيل الأسعار وآخر fetched_at للمعادن والصرف: مُحقِّق رخيص لكل ما يعتمد على الأسعار."""
+    return get_rate_book().stamp
+
 # -----------------------------
 # حساب الأرصدة من المعاملات
 # -----------------------------
-def _sum_sign(expr_add, expr_withdraw, expr_zakat):
-    return (expr_add or Decimal("0")) - (expr_withdraw or Decimal("0")) - (expr_zakat or Decimal("0"))
+# -----------------------------
+# دفتر الأرصدة (HoldingBalance)
+# -----------------------------
+def _holding_key(asset_type, karat, currency_code):
+    """مفتاح موحّد للدفتر: (asset_type, karat|0, currency_code|"")."""
+    if asset_type == "GOLD":
+        return ("GOLD", int(karat or 0), "")
+    if asset_type == "CASH":
+        return ("CASH", 0, (currency_code or "").upper())
+    return (asset_type, 0, "")
+
+def _tx_signed_quantity(tx) -> Decimal:
+    """أثر المناقلة على رصيدها: ADD موجب، WITHDRAW/ZAKAT سالب."""
+    qty = tx.amount if tx.asset_type == "CASH" else tx.weight_g
+    if qty is None:
+        return Decimal("0")
+    sign = Decimal("1") if tx.operation_type == "ADD" else Decimal("-1")
+    return sign * Decimal(qty)
 
-def compute_holdings(user):
+def apply_tx_to_holdings(tx, reverse: bool = False):
+    """
+    يطبّق أثر مناقلة على جدول الأرصدة (reverse=True لإزالة أثرها عند الحذف/الأرشفة).
+    يجب أن يُستدعى داخل نفس transaction.atomic الخاص بالكتابة.
     """
-    يحسب أرصدة الذهب/الفضة/الأموال من معاملات المستخدم الفعالة (غير المحذوفة).
+    delta = _tx_signed_quantity(tx)
+    if reverse:
+        delta = -delta
+    if not delta:
+        return
+    asset, karat, cc = _holding_key(tx.asset_type, tx.karat, tx.currency_code)
+    row, _ = HoldingBalance.objects.get_or_create(
+        user_id=tx.user_id, asset_type=asset, karat=karat, currency_code=cc
+    )
+    HoldingBalance.objects.filter(pk=row.pk).update(balance=F("balance") + delta, updated_at=timezone.now())
+
+def record_transaction(**fields) -> Transaction:
+    """ينشئ مناقلة ويحدّث دفتر الأرصدة في نفس معاملة قاعدة البيانات."""
+    with db_transaction.atomic():
+        tx = Transaction.objects.create(**fields)
+        apply_tx_to_holdings(tx)
+        apply_tx_to_monthly_flow(tx)
+        invalidate_portfolio_history(tx)
+        mark_zakat_dirty([tx.user_id])
+    return tx
+
+def archive_transaction(tx, reason: str):
+    """يؤرشف مناقلة (حذف ناعم أو نسخة قديمة بعد التعديل) ويزيل أثرها من الدفتر."""
+    with db_transaction.atomic():
+        tx.is_edited = True
+        tx.edit_reason = reason
+        tx.soft_deleted_at = timezone.now()
+        tx.save(update_fields=["is_edited", "edit_reason", "soft_deleted_at"])
+        apply_tx_to_holdings(tx, reverse=True)
+        apply_tx_to_monthly_flow(tx, reverse=True)
+        invalidate_portfolio_history(tx)
+        mark_zakat_dirty([tx.user_id])
+
+def balances_from_transactions(qs):
+    """
+    يجمع الأرصدة من المعاملات باستعلام واحد مُجمَّع:
+    {(user_id, asset_type, karat, currency_code): Decimal}
     """
-    active = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True)
+    balance_expr = Sum(
+        Case(
+            When(operation_type="ADD", asset_type="CASH", then=F("amount")),
+            When(operation_type__in=["WITHDRAW", "ZAKAT"], asset_type="CASH", then=-F("amount")),
+            When(operation_type="ADD", then=F("weight_g")),
+            When(operation_type__in=["WITHDRAW", "ZAKAT"], then=-F("weight_g")),
+            default=Decimal("0"),
+            output_field=DecimalField(max_digits=24, decimal_places=10),
+        )
+    )
+    rows = (qs.filter(soft_deleted_at__isnull=True)
+              .values("user_id", "asset_type", "karat", "currency_code")
+              .annotate(balance=balance_expr)
+              .order_by())
+    out = {}
+    for r in rows:
+        key = (r["user_id"],) + _holding_key(r["asset_type"], r["karat"], r["currency_code"])
+        out[key] = out.get(key, Decimal("0")) + (r["balance"] or Decimal("0"))
+    return out
+
+def rebuild_holdings_for(user_ids=None, dry_run: bool = False):
+    """
+    يعيد بناء HoldingBalance من Transaction ويرجع قائمة الانحرافات:
+    [(user_id, asset_type, karat, currency_code, stored, expected), ...]
+    """
+    tx_qs = Transaction.objects.all()
+    hb_qs = HoldingBalance.objects.all()
+    if user_ids is not None:
+        tx_qs = tx_qs.filter(user_id__in=user_ids)
+        hb_qs = hb_qs.filter(user_id__in=user_ids)
+
+    expected = balances_from_transactions(tx_qs)
+    stored = {
+        (r.user_id, r.asset_type, r.karat, r.currency_code): r.balance
+        for r in hb_qs
+    }
+
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        exp = expected.get(key, Decimal("0"))
+        got = stored.get(key, Decimal("0"))
+        if exp != got:
+            drift.append(key + (got, exp))
+
+    if not dry_run:
+        with db_transaction.atomic():
+            hb_qs.delete()
+            HoldingBalance.objects.bulk_create([
+                HoldingBalance(user_id=k[0], asset_type=k[1], karat=k[2], currency_code=k[3], balance=v)
+                for k, v in expected.items() if v
+            ], batch_size=500)
+    return drift
 
-    # GOLD by karat
+# -----------------------------
+# الملخص الشهري (UserMonthlyFlow)
+# -----------------------------
+def _as_date(value) -> date:
+    """يقبل date/datetime أو نص YYYY-MM-DD كما يصل من الطلب."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        value = value.date()
+    return value
+
+def _month_start(value) -> date:
+    """أول يوم في شهر التاريخ."""
+    return _as_date(value).replace(day=1)
+
+def invalidate_portfolio_history(tx):
+    """معاملة بتاريخ سابق تغيّر كل القيم اليومية من تاريخها: نحذفها ليعيد build_portfolio_history حسابها."""
+    PortfolioDaily.objects.filter(user_id=tx.user_id, day__gte=_as_date(tx.date)).delete()
+
+def apply_tx_to_monthly_flow(tx, reverse: bool = False):
+    """مثل apply_tx_to_holdings لكن للملخص الشهري (الكمية موجبة دائمًا، والعملية جزء من المفتاح)."""
+    qty = tx.amount if tx.asset_type == "CASH" else tx.weight_g
+    if qty is None:
+        return
+    qty, count = Decimal(qty), 1
+    if reverse:
+        qty, count = -qty, -1
+    asset, karat, cc = _holding_key(tx.asset_type, tx.karat, tx.currency_code)
+    row, _ = UserMonthlyFlow.objects.get_or_create(
+        user_id=tx.user_id, month=_month_start(tx.date), asset_type=asset,
+        operation_type=tx.operation_type, karat=karat, currency_code=cc,
+    )
+    UserMonthlyFlow.objects.filter(pk=row.pk).update(
+        quantity=F("quantity") + qty, tx_count=F("tx_count") + count, updated_at=timezone.now()
+    )
+
+def monthly_flows_from_transactions(qs) -> dict:
+    """{(user_id, month, asset_type, operation_type, karat, currency_code): (quantity, count)} باستعلام واحد."""
+    qty_expr = Sum(
+        Case(
+            When(asset_type="CASH", then=F("amount")),
+            default=F("weight_g"),
+            output_field=DecimalField(max_digits=24, decimal_places=10),
+        )
+    )
+    rows = (qs.filter(soft_deleted_at__isnull=True)
+              .annotate(month=TruncMonth("date"))
+              .values("user_id", "month", "operation_type", "asset_type", "karat", "currency_code")
+              .annotate(quantity=qty_expr, n=Count("id"))
+              .order_by())
+    out = {}
+    for r in rows:
+        if r["quantity"] is None:
+            continue
+        asset, karat, cc = _holding_key(r["asset_type"], r["karat"], r["currency_code"])
+        key = (r["user_id"], r["month"], asset, r["operation_type"], karat, cc)
+        q, n = out.get(key, (Decimal("0"), 0))
+        out[key] = (q + r["quantity"], n + r["n"])
+    return out
+
+def rebuild_monthly_flows_for(user_ids=None) -> int:
+    """يعيد بناء UserMonthlyFlow من Transaction بالكامل (أو لمستخدمين محددين). يرجع عدد الصفوف."""
+    tx_qs = Transaction.objects.all()
+    flow_qs = UserMonthlyFlow.objects.all()
+    if user_ids is not None:
+        tx_qs = tx_qs.filter(user_id__in=user_ids)
+        flow_qs = flow_qs.filter(user_id__in=user_ids)
+
+    flows = monthly_flows_from_transactions(tx_qs)
+    with db_transaction.atomic():
+        flow_qs.delete()
+        UserMonthlyFlow.objects.bulk_create([
+            UserMonthlyFlow(user_id=k[0], month=k[1], asset_type=k[2], operation_type=k[3],
+                            karat=k[4], currency_code=k[5], quantity=q, tx_count=n)
+            for k, (q, n) in flows.items()
+        ], batch_size=500)
+    return len(flows)
+
+class BalanceAggregator:
+    """
+    يجمع كل أرصدة المستخدم (لكل أصل/عيار/عملة) في رحلة واحدة إلى قاعدة البيانات،
+    ثم يجيب عن أي رصيد من الذاكرة.
+    - source="ledger": من دفتر HoldingBalance (الافتراضي).
+    - source="transactions": تجميع مشروط واحد على Transaction (بدون الدفتر).
+    """
+    def __init__(self, user, source: str = "ledger"):
+        self.user = user
+        self.source = source
+        self._balances = None
+
+    @property
+    def balances(self) -> dict:
+        """{(asset_type, karat, currency_code): Decimal}"""
+        if self._balances is None:
+            if self.source == "transactions":
+                grouped = balances_from_transactions(Transaction.objects.filter(user=self.user))
+                self._balances = {key[1:]: bal for key, bal in grouped.items()}
+            else:
+                self._balances = {
+                    (a, k, c): b
+                    for a, k, c, b in HoldingBalance.objects.filter(user=self.user)
+                                                           .values_list("asset_type", "karat", "currency_code", "balance")
+                }
+        return self._balances
+
+    def get(self, asset_type, karat=None, currency_code="") -> Decimal:
+        return self.balances.get(_holding_key(asset_type, karat, currency_code), Decimal("0"))
+
+    def cash(self, currency_code: str) -> Decimal:
+        return self.get("CASH", currency_code=currency_code)
+
+    def gold(self, karat: int) -> Decimal:
+        return self.get("GOLD", karat=karat)
+
+    def silver(self) -> Decimal:
+        return self.get("SILVER")
+
+    def holdings(self) -> dict:
+        return _holdings_from_balances(self.balances)
+
+WEIGHT_Q = Decimal("0.000001")  # نفس دقة Transaction.weight_g
+
+def _holdings_from_balances(balances):
     gold = {}
     gold_pure = Decimal("0")
     for karat in (18, 21, 24):
-        qs = active.filter(asset_type="GOLD", karat=karat)
-        add_w = qs.filter(operation_type="ADD").aggregate(s=Sum("weight_g"))["s"]
-        out_w = qs.filter(operation_type="WITHDRAW").aggregate(s=Sum("weight_g"))["s"]
-        zak_w = qs.filter(operation_type="ZAKAT").aggregate(s=Sum("weight_g"))["s"]
-        bal = _sum_sign(add_w, out_w, zak_w)
+        bal = balances.get(("GOLD", karat, ""), Decimal("0")).quantize(WEIGHT_Q)
         if bal > 0:
             gold[karat] = bal
             gold_pure += (bal * Decimal(karat) / Decimal(24))
 
-    # SILVER
-    qs_s = active.filter(asset_type="SILVER")
-    add_s = qs_s.filter(operation_type="ADD").aggregate(s=Sum("weight_g"))["s"]
-    out_s = qs_s.filter(operation_type="WITHDRAW").aggregate(s=Sum("weight_g"))["s"]
-    zak_s = qs_s.filter(operation_type="ZAKAT").aggregate(s=Sum("weight_g"))["s"]
-    silver_g = _sum_sign(add_s, out_s, zak_s)
+    silver_g = balances.get(("SILVER", 0, ""), Decimal("0")).quantize(WEIGHT_Q)
     if silver_g < 0:
         silver_g = Decimal("0")
 
-    # CASH wallets by currency
-    # CASH wallets (grouped)
-    wallets = compute_cash_wallets(user)
-
+    wallets = []
+    for (asset, _, cc), bal in sorted(balances.items(), key=lambda kv: kv[0][2]):
+        if asset == "CASH" and cc and bal > 0:
+            wallets.append({"currency_code": cc, "balance": f"{bal:.6f}"})
 
     gold_by_karat = [{"karat": k, "weight_g": str(gold[k])} for k in (18, 21, 24) if k in gold]
 
@@ -138,8 +354,15 @@ def compute_holdings(user):
         "cash_wallets": wallets,
     }
 
+def compute_holdings(user, source: str = "ledger"):
+    """
+    يحسب أرصدة الذهب/الفضة/الأموال باستعلام واحد:
+    من دفتر الأرصدة (HoldingBalance) افتراضيًا، أو من المعاملات مباشرة (source="transactions").
+    """
+    return BalanceAggregator(user, source=source).holdings()
+
 def recent_transactions(user, limit=20):
-    qs = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True).order_by("-created_at")[:limit]
+    qs = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True).order_by("-created_at", "-id")[:limit]
     items = []
     for tx in qs:
         items.append({
@@ -160,92 +383,201 @@ def recent_transactions(user, limit=20):
 # -----------------------------
 # Snapshot + نسخة
 # -----------------------------
-def bump_snapshot_version(user):
+SNAPSHOT_CACHE_HITS_KEY = "snapshot:stats:hits"
+SNAPSHOT_CACHE_MISSES_KEY = "snapshot:stats:misses"
+
+def _snapshot_cache_key(user_id, version) -> str:
+    return f"snapshot:{user_id}:{version}"
+
+def _incr_counter(key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # المفتاح غير موجود بعد (أو أُزيل من الكاش)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+def snapshot_cache_stats() -> dict:
+    """عدّادات إصابة/إخفاق كاش اللقطات."""
+    return {
+        "hits": cache.get(SNAPSHOT_CACHE_HITS_KEY, 0),
+        "misses": cache.get(SNAPSHOT_CACHE_MISSES_KEY, 0),
+    }
+
+SNAPSHOT_SECTIONS = ("profile", "settings", "assets", "transactions", "notifications")
+
+def bump_snapshot_version(user, sections=None, removed=None):
+    """
+    يرفع نسخة اللقطة ويعلّم الأقسام المتغيرة بالنسخة الجديدة.
+    sections: أسماء الأقسام المتغيرة (None = كل الأقسام).
+    removed: {"transactions": [ids], ...} عناصر أُزيلت (تُرسل كشواهد حذف في الدلتا).
+    """
     p = user.profile
-    p.snapshot_version += 1
-    p.save(update_fields=["snapshot_version", "updated_at"])
+    old_version = p.snapshot_version
+    changed = SNAPSHOT_SECTIONS if sections is None else tuple(sections)
+    new_version = F("snapshot_version") + 1
+    # زيادة ذرّية حتى لا تتشارك كتابتان متزامنتان نفس رقم النسخة (ونفس مفتاح الكاش)
+    Profile.objects.filter(pk=p.pk).update(
+        snapshot_version=new_version,
+        updated_at=timezone.now(),
+        **{f"{name}_version": new_version for name in changed},
+    )
+    p.refresh_from_db(fields=["snapshot_version", "updated_at"] + [f"{name}_version" for name in changed])
+    cache.delete(_snapshot_cache_key(user.pk, old_version))
+    # بثّ النسخة لمشتركي notifications/stream بعد الالتزام (قبلها لن يروا الصفوف الجديدة)
+    version = p.snapshot_version
+    db_transaction.on_commit(lambda: publish_snapshot_version(user.pk, version))
+
+    if removed:
+        SyncTombstone.objects.bulk_create([
+            SyncTombstone(user=user, section=section, object_id=obj_id, version=p.snapshot_version)
+            for section, ids in removed.items() for obj_id in ids
+        ])
+
+def snapshot_etag(profile) -> str:
+    # ETag بسيط يحمل رقم النسخة (يسمح بـ If-None-Match كبديل لـ since_version)
+    base = f"{profile.snapshot_version}:{profile.updated_at.isoformat()}".encode("utf-8")
+    return f"sv-{profile.snapshot_version}-" + hashlib.sha256(base).hexdigest()[:16]
 
-def build_snapshot(user):
-    profile = user.profile
-    settings_obj = user.usersettings
+def parse_snapshot_etag(etag: str | None) -> int | None:
+    """يستخرج رقم النسخة من ETag بصيغة sv-<version>-<hash>."""
+    if not etag:
+        return None
+    parts = etag.strip().strip('"').split("-")
+    if len(parts) == 3 and parts[0] == "sv" and parts[1].isdigit():
+        return int(parts[1])
+    return None
 
-    notifications_qs = user.notifications.all()[:20]
-    assets = compute_holdings(user)
-    txs = recent_transactions(user, limit=20)
+def build_snapshot(user, ctx=None, since_version: int | None = None):
+    """
+    يرجع اللقطة الكاملة من الكاش إن وُجدت لنفس (user_id, snapshot_version)،
+    وإلا يبنيها ويخزّنها. أي كتابة تمرّ عبر bump_snapshot_version فتتغير النسخة والمفتاح.
+    مع since_version: يرجع فقط الأقسام التي تغيّرت بعد تلك النسخة + شواهد الحذف.
+    """
+    profile = user.profile
+    if since_version is not None and not (0 < since_version <= profile.snapshot_version):
+        since_version = None  # نسخة غير معروفة => لقطة كاملة
 
-    # ETag بسيط
-    base = f"{profile.snapshot_version}:{profile.updated_at.isoformat()}".encode("utf-8")
-    etag = 'sv-' + hashlib.sha256(base).hexdigest()[:16]
+    key = _snapshot_cache_key(user.pk, profile.snapshot_version)
+    snap = cache.get(key)
+    if snap is not None:
+        _incr_counter(SNAPSHOT_CACHE_HITS_KEY)
+    else:
+        _incr_counter(SNAPSHOT_CACHE_MISSES_KEY)
+        if since_version is not None:
+            # دلتا بدون لقطة في الكاش: نبني الأقسام المتغيرة فقط
+            partial = _build_snapshot(user, ctx, _changed_sections(profile, since_version))
+            return _build_delta(user, since_version, partial)
+        snap = _build_snapshot(user, ctx)
+        cache.set(key, snap, timeout=settings.SNAPSHOT_CACHE_TIMEOUT)
+
+    if since_version is not None:
+        return _build_delta(user, since_version, snap)
+    return snap
+
+def _changed_sections(profile, since_version: int):
+    return [name for name in SNAPSHOT_SECTIONS if getattr(profile, f"{name}_version") > since_version]
+
+def _build_delta(user, since_version: int, snap: dict) -> dict:
+    profile = user.profile
+    changed = _changed_sections(profile, since_version)
+    removed = {"transactions": [], "notifications": []}
+    if profile.snapshot_version > since_version:
+        for section, obj_id in (SyncTombstone.objects
+                                .filter(user=user, version__gt=since_version)
+                                .order_by("version")
+                                .values_list("section", "object_id")):
+            removed.setdefault(section, []).append(obj_id)
+
+    delta = {k: snap[k] for k in ("version", "etag", "generated_at")}
+    delta.update({
+        "delta": True,
+        "since_version": since_version,
+        "changed_sections": changed,
+        "removed": removed,
+    })
+    for name in changed:
+        delta[name] = snap[name]
+    return delta
+
+def _section_profile(user, ctx):
+    profile = user.profile
+    return {
+        "full_name": profile.full_name,
+        "phone_number": profile.phone_number,
+        "country": profile.country,
+        "city": profile.city,
+        "avatar_url": profile.avatar_url,
+        "is_complete": profile.is_complete(),
+    }
 
+def _section_settings(user, ctx):
+    settings_obj = ctx.settings if ctx else user.usersettings
     return {
+        "display_currency": settings_obj.display_currency,
+        "user_fx_overrides": settings_obj.user_fx_overrides or {},
+    }
+
+def _section_assets(user, ctx):
+    return ctx.holdings if ctx else compute_holdings(user)
+
+def _section_transactions(user, ctx):
+    return recent_transactions(user, limit=20)
+
+def _section_notifications(user, ctx):
+    return [
+        {
+            "id": n.id,
+            "type": n.type,
+            "title": n.title,
+            "body": n.body,
+            "priority": n.priority,
+            "created_at": n.created_at.isoformat(),
+            "read_at": n.read_at.isoformat() if n.read_at else None,
+        } for n in user.notifications.all()[:20]
+    ]
+
+_SNAPSHOT_SECTION_BUILDERS = {
+    "profile": _section_profile,
+    "settings": _section_settings,
+    "assets": _section_assets,
+    "transactions": _section_transactions,
+    "notifications": _section_notifications,
+}
+
+def _build_snapshot(user, ctx=None, sections=SNAPSHOT_SECTIONS):
+    profile = user.profile
+    snap = {
         "version": profile.snapshot_version,
-        "etag": etag,
+        "etag": snapshot_etag(profile),
         "generated_at": timezone.now(),
-        "profile": {
-            "full_name": profile.full_name,
-            "phone_number": profile.phone_number,
-            "country": profile.country,
-            "city": profile.city,
-            "avatar_url": profile.avatar_url,
-            "is_complete": profile.is_complete(),
-        },
-        "settings": {
-            "display_currency": settings_obj.display_currency,
-            "user_fx_overrides": settings_obj.user_fx_overrides or {},
-        },
-        "assets": assets,
-        "transactions": txs,
-        "notifications": [
-            {
-                "id": n.id,
-                "type": n.type,
-                "title": n.title,
-                "body": n.body,
-                "priority": n.priority,
-                "created_at": n.created_at.isoformat(),
-                "read_at": n.read_at.isoformat() if n.read_at else None,
-            } for n in notifications_qs
-        ],
     }
+    for name in sections:
+        snap[name] = _SNAPSHOT_SECTION_BUILDERS[name](user, ctx)
+    return snap
 
-def cash_balance_for(user, currency_code: str) -> Decimal:
+def cash_balance_for(user, currency_code: str, agg: BalanceAggregator | None = None) -> Decimal:
     """
-    يرجع رصيد المحفظة لعملة محددة من المعاملات الفعالة.
+    يرجع رصيد المحفظة لعملة محددة (عبر BalanceAggregator).
     """
     cc = (currency_code or "").upper().strip()
     if not cc:
         return Decimal("0")
-    active = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True, asset_type="CASH", currency_code=cc)
-    add_c = active.filter(operation_type="ADD").aggregate(s=Sum("amount"))["s"] or Decimal("0")
-    out_c = active.filter(operation_type="WITHDRAW").aggregate(s=Sum("amount"))["s"] or Decimal("0")
-    zak_c = active.filter(operation_type="ZAKAT").aggregate(s=Sum("amount"))["s"] or Decimal("0")
-    return add_c - out_c - zak_c
+    return (agg or BalanceAggregator(user)).cash(cc)
 
-def gold_balance_for(user, karat: int) -> Decimal:
+def gold_balance_for(user, karat: int, agg: BalanceAggregator | None = None) -> Decimal:
     """
-    يرجع رصيد الذهب (بالغرام) لعيار محدد من المعاملات الفعالة.
+    يرجع رصيد الذهب (بالغرام) لعيار محدد (عبر BalanceAggregator).
     """
     if karat not in (18, 21, 24):
         return Decimal("0")
-    active = Transaction.objects.filter(
-        user=user, soft_deleted_at__isnull=True, asset_type="GOLD", karat=karat
-    )
-    add_w = active.filter(operation_type="ADD").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    out_w = active.filter(operation_type="WITHDRAW").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    zak_w = active.filter(operation_type="ZAKAT").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    return add_w - out_w - zak_w
+    return (agg or BalanceAggregator(user)).gold(karat)
 
-def silver_balance_for(user) -> Decimal:
+def silver_balance_for(user, agg: BalanceAggregator | None = None) -> Decimal:
     """
-    يرجع رصيد الفضة (بالغرام) من المعاملات الفعالة.
+    يرجع رصيد الفضة (بالغرام) (عبر BalanceAggregator).
     """
-    active = Transaction.objects.filter(
-        user=user, soft_deleted_at__isnull=True, asset_type="SILVER"
-    )
-    add_w = active.filter(operation_type="ADD").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    out_w = active.filter(operation_type="WITHDRAW").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    zak_w = active.filter(operation_type="ZAKAT").aggregate(s=Sum("weight_g"))["s"] or Decimal("0")
-    return add_w - out_w - zak_w
+    return (agg or BalanceAggregator(user)).silver()
 
 # ----- مساهمة مناقلة نقدية/ذهب/فضة باختصار -----
 def _cash_tx_signed_amount(tx) -> Decimal:
@@ -273,24 +605,25 @@ def can_soft_delete_tx(user, tx) -> (bool, str):
     إذا كانت المناقلة تزيد الرصيد (ADD) فإزالتها تُنقص الرصيد، فيجب التأكد أن النتيجة لن تصبح سالبة.
     إذا كانت المناقلة تُنقص الرصيد (WITHDRAW/ZAKAT)، فإزالتها آمنة لأنها سترفع الرصيد.
     """
+    agg = BalanceAggregator(user)
     if tx.asset_type == "CASH":
         if tx.operation_type == "ADD":
             # حذف ADD => طرح مقدارها من الرصيد الحالي
-            bal_now = cash_balance_for(user, tx.currency_code)
+            bal_now = cash_balance_for(user, tx.currency_code, agg)
             after = bal_now - Decimal(tx.amount or 0)
             if after < 0:
                 return False, f"لا يمكن حذف هذه المناقلة لأنها ستجعل رصيد {tx.currency_code} سالبًا."
         return True, ""
     elif tx.asset_type == "GOLD":
         if tx.operation_type == "ADD":
-            bal_now = gold_balance_for(user, tx.karat or 0)
+            bal_now = gold_balance_for(user, tx.karat or 0, agg)
             after = bal_now - Decimal(tx.weight_g or 0)
             if after < 0:
                 return False, f"لا يمكن حذف هذه المناقلة لأنها ستجعل رصيد ذهب عيار {tx.karat} سالبًا."
         return True, ""
     elif tx.asset_type == "SILVER":
         if tx.operation_type == "ADD":
-            bal_now = silver_balance_for(user)
+            bal_now = silver_balance_for(user, agg)
             after = bal_now - Decimal(tx.weight_g or 0)
             if after < 0:
                 return False, "لا يمكن حذف هذه المناقلة لأنها ستجعل رصيد الفضة سالبًا."
@@ -309,6 +642,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
         return False, "نوع العملية غير صالح."
 
     asset = old_tx.asset_type
+    agg = BalanceAggregator(user)  # كل الأرصدة اللازمة باستعلام واحد
 
     if asset == "CASH":
         new_cc = (new_fields.get("currency_code", old_tx.currency_code) or "").upper()
@@ -318,7 +652,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
 
         # الرصيد الحالي حسب العملة القديمة والجديدة
         # 1) ننقص أثر القديمة من رصيدها
-        bal_old_cc = cash_balance_for(user, old_tx.currency_code)
+        bal_old_cc = cash_balance_for(user, old_tx.currency_code, agg)
         old_signed = _cash_tx_signed_amount(old_tx)
         bal_after_removal_old = bal_old_cc - old_signed
 
@@ -336,7 +670,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
                 return False, f"سيصبح رصيد {old_tx.currency_code} سالبًا بعد التعديل."
 
             # نتحقق من رصيد العملة الجديدة بإضافة الأثر الجديد
-            bal_new_cc = cash_balance_for(user, new_cc)
+            bal_new_cc = cash_balance_for(user, new_cc, agg)
             sign_new = Decimal("1") if new_op == "ADD" else Decimal("-1")
             after_new = bal_new_cc + (sign_new * new_amount)
             if after_new < 0:
@@ -353,7 +687,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
             return False, "الوزن يجب أن يكون أكبر من الصفر."
 
         # إزالة أثر القديمة من عيارها، ثم إضافة الجديدة إلى عيارها (قد يكون مختلفًا)
-        bal_old_k = gold_balance_for(user, old_tx.karat or 0)
+        bal_old_k = gold_balance_for(user, old_tx.karat or 0, agg)
         old_signed = _gold_tx_signed_weight(old_tx)
         after_old = bal_old_k - old_signed
         if old_tx.karat == new_karat:
@@ -364,7 +698,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
         else:
             if after_old < 0:
                 return False, f"سيصبح رصيد عيار {old_tx.karat} سالبًا بعد التعديل."
-            bal_new_k = gold_balance_for(user, new_karat)
+            bal_new_k = gold_balance_for(user, new_karat, agg)
             sign_new = Decimal("1") if new_op == "ADD" else Decimal("-1")
             after_new = bal_new_k + (sign_new * new_w)
             if after_new < 0:
@@ -376,7 +710,7 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
         if new_w <= 0:
             return False, "الوزن يجب أن يكون أكبر من الصفر."
 
-        bal_old = silver_balance_for(user)
+        bal_old = silver_balance_for(user, agg)
         old_signed = _silver_tx_signed_weight(old_tx)
         after_remove = bal_old - old_signed
         sign_new = Decimal("1") if new_op == "ADD" else Decimal("-1")
@@ -387,30 +721,113 @@ def can_edit_tx_without_negative(user, old_tx, new_fields: dict) -> (bool, str):
 
     return False, "نوع أصل غير مدعوم."
 
-from hijri_converter import Gregorian, Hijri
-from django.utils import timezone as djtz
+from .hijri import add_one_hijri_year, today_hijri, to_gregorian as hijri_to_date
 from .models import ZakatAnchor
 
-def today_hijri():
-    g = djtz.now().date()
-    h = Hijri.from_gregorian(g.year, g.month, g.day)
-    return h  # فيه .year, .month, .day
-
-def add_one_hijri_year(h: Hijri) -> Hijri:
-    # إضافة سنة هجرية: بساطةً نزيد year بواحد ونحافظ على اليوم/الشهر
-    return Hijri(h.year + 1, h.month, min(h.day, 30))
-
 from decimal import Decimal
+from django.utils.functional import cached_property
 
 NISAB_GOLD_G = Decimal("85")
 NISAB_SILVER_G = Decimal("595")
 
-def _get_gold_price_per_gram_in(currency_code: str, user) -> Decimal | None:
+# -----------------------------
+# سياق التقييم (لطلب/مهمة واحدة)
+# -----------------------------
+class ValuationContext:
+    """
+    يُبنى مرة واحدة لكل طلب أو مهمة، ويحمّل عند أول حاجة فقط ثم يحتفظ بـ:
+    إعدادات المستخدم و overrides، الأرصدة، أسعار المعادن، وأسعار الصرف المطلوبة.
+    ملاحظة: لا يُعاد استخدامه بعد كتابة تغيّر الأرصدة.
+    """
+    def __init__(self, user, user_settings=None, balances: dict | None = None):
+        """
+        user_settings/balances: محمّلة مسبقًا (تقييم دفعة مستخدمين باستعلامات مجمّعة)؛
+        balances بشكل {(asset_type, karat, currency_code): Decimal}.
+        """
+        self.user = user
+        if user_settings is not None:
+            self.settings = user_settings
+        if balances is not None:
+            self.holdings = _holdings_from_balances(balances)
+
+    @cached_property
+    def settings(self):
+        try:
+            return self.user.usersettings
+        except UserSettings.DoesNotExist:
+            return UserSettings(user=self.user)  # الإعدادات الافتراضية (غير محفوظة)
+
+    @cached_property
+    def display_currency(self) -> str:
+        return (self.settings.display_currency or "USD").upper()
+
+    @cached_property
+    def overrides(self) -> dict:
+        return getattr(self.settings, "user_fx_overrides", {}) or {}
+
+    @cached_property
+    def balances(self) -> BalanceAggregator:
+        return BalanceAggregator(self.user)
+
+    @cached_property
+    def holdings(self) -> dict:
+        return self.balances.holdings()
+
+    @cached_property
+    def metals(self) -> dict:
+        return latest_metal_dict()
+
+    @cached_property
+    def fx(self) -> FxMatrix:
+        """مصفوفة التحويل المشتركة لجيل الأسعار الحالي (بدون استعلامات)."""
+        return get_rate_book().matrix
+
+    def _override(self, base: str, quote: str) -> Decimal | None:
+        """override مباشر base->quote أو معكوس quote->base من إعدادات المستخدم."""
+        for key, inverse in ((f"{base}->{quote}", False), (f"{quote}->{base}", True)):
+            if key not in self.overrides:
+                continue
+            try:
+                rate = Decimal(str(self.overrides[key]))
+            except Exception:
+                continue
+            if rate > 0:
+                return (Decimal("1") / rate) if inverse else rate
+        return None
+
+    def _leg(self, base: str, quote: str) -> Decimal | None:
+        if base == quote:
+            return Decimal("1")
+        rate = self._override(base, quote)
+        return rate if rate is not None else self.fx.rate(base, quote)
+
+    def fx_rate(self, base: str, quote: str) -> Decimal | None:
+        """
+        معدّل base->quote. الأولوية: override المستخدم (مباشر/معكوس)،
+        ثم معدّل متقاطع عبر pivot إن كان أحد طرفيه override، ثم مصفوفة FxRate.
+        """
+        base, quote = (base or "USD").upper(), (quote or "USD").upper()
+        if base == quote:
+            return Decimal("1")
+        rate = self._override(base, quote)
+        if rate is not None:
+            return rate
+        pivot = self.fx.pivot
+        if base != pivot and quote != pivot and (
+            self._override(base, pivot) is not None or self._override(pivot, quote) is not None
+        ):
+            to_pivot, from_pivot = self._leg(base, pivot), self._leg(pivot, quote)
+            if to_pivot is not None and from_pivot is not None:
+                return to_pivot * from_pivot
+        return self.fx.rate(base, quote)
+
+def _get_gold_price_per_gram_in(currency_code: str, user, ctx: ValuationContext | None = None) -> Decimal | None:
     """
     نحصل على سعر غرام الذهب بعملة معينة.
     المصدر: MetalPrice (بالدولار غالباً) + Fx (USD->currency) + overrides المستخدم إذا وُجد.
     """
-    md = latest_metal_dict()
+    ctx = ctx or ValuationContext(user)
+    md = ctx.metals
     if not md["gold_g_per"]:
         return None
     usd_per_g = Decimal(md["gold_g_per"])
@@ -419,97 +836,69 @@ def _get_gold_price_per_gram_in(currency_code: str, user) -> Decimal | None:
     if target == "USD":
         return usd_per_g
 
-    # أولاً overrides
-    ov_key = f"USD->{target}"
-    rate = None
-    ov = getattr(user.usersettings, "user_fx_overrides", {}) or {}
-    if ov_key in ov:
-        try:
-            rate = Decimal(str(ov[ov_key]))
-        except Exception:
-            rate = None
-
-    # إن لم يوجد override نأخذ من FxRate
-    if rate is None:
-        fx = latest_fx_for_pairs([("USD", target)])
-        if fx:
-            rate = Decimal(str(fx[0]["rate"]))
-
+    rate = ctx.fx_rate("USD", target)
     if rate is None:
         return None
 
     return (usd_per_g * rate).quantize(Decimal("0.000001"))
 
-def total_cash_value_in(currency_code: str, user) -> Decimal:
+def total_cash_value_in(currency_code: str, user, ctx: ValuationContext | None = None) -> Decimal:
     """
     نحسب قيمة كل محافظ النقد بعملة واحدة موحدة.
     """
+    ctx = ctx or ValuationContext(user)
     target = (currency_code or "USD").upper()
     total = Decimal("0")
-    # اعتمد على compute_holdings ليرجع المحافظ الحالية
-    wallets = compute_holdings(user)["cash_wallets"]
+    wallets = ctx.holdings["cash_wallets"]
     if not wallets:
         return total
 
-    # بناء خريطة أسعار التحويل (أولوية: overrides ثم FxRate)
-    # سنحوّل base -> target
-    ov = getattr(user.usersettings, "user_fx_overrides", {}) or {}
-    fx_map = {}
-    pairs = []
+    # بحث في مصفوفة التحويل فقط (مباشر/معكوس/متقاطع، مع overrides المستخدم)
     for w in wallets:
-        base = w["currency_code"].upper()
-        if base == target:
-            continue
-        pairs.append((base, target))
-    if pairs:
-        for rec in latest_fx_for_pairs(pairs):
-            fx_map[(rec["base"], rec["quote"])] = Decimal(str(rec["rate"]))
-
-    for w in wallets:
-        base = w["currency_code"].upper()
-        amt = Decimal(w["balance"])
-        if base == target:
-            total += amt
-        else:
-            # override؟
-            ov_key = f"{base}->{target}"
-            rate = None
-            if ov_key in ov:
-                try:
-                    rate = Decimal(str(ov[ov_key]))
-                except Exception:
-                    rate = None
-            if rate is None:
-                rate = fx_map.get((base, target))
-            if rate:
-                total += (amt * rate)
-            # إذا لا يوجد معدّل، نتجاهل تلك المحفظة مؤقتًا (لن تؤذي التذكير)
+        rate = ctx.fx_rate(w["currency_code"], target)
+        if rate:
+            total += (Decimal(w["balance"]) * rate)
+        # إذا لا يوجد أي مسار تحويل، نتجاهل تلك المحفظة مؤقتًا (لن تؤذي التذكير)
     return total
 
-def meets_nisab_gold_pure(user) -> bool:
-    gold_pure = Decimal(compute_holdings(user)["gold_pure_g"])
+def meets_nisab_gold_pure(user, ctx: ValuationContext | None = None) -> bool:
+    ctx = ctx or ValuationContext(user)
+    gold_pure = Decimal(ctx.holdings["gold_pure_g"])
     return gold_pure >= NISAB_GOLD_G
 
-def meets_nisab_silver(user) -> bool:
-    silver_g = Decimal(compute_holdings(user)["silver_g"])
+def meets_nisab_silver(user, ctx: ValuationContext | None = None) -> bool:
+    ctx = ctx or ValuationContext(user)
+    silver_g = Decimal(ctx.holdings["silver_g"])
     return silver_g >= NISAB_SILVER_G
 
-def meets_nisab_cash(user) -> bool:
+def meets_nisab_cash(user, ctx: ValuationContext | None = None) -> bool:
+    return cash_nisab_position(user, ctx)[0]
+
+def cash_value_usd(cash_total: Decimal, gold_ppg: Decimal, ctx: ValuationContext) -> Decimal:
+    """
+    قيمة النقد (بعملة العرض) بالدولار بأسعار المستخدم: النقد ÷ (USD->عملة العرض).
+    تغيّر سعر الذهب وحده لا يغيّرها، فالنصاب يتحقق ما دامت >= 85g × سعر الذهب بالدولار.
+    """
+    return (cash_total * Decimal(ctx.metals["gold_g_per"]) / gold_ppg).quantize(Decimal("0.000001"))
+
+def cash_nisab_position(user, ctx: ValuationContext | None = None) -> tuple[bool, Decimal | None]:
+    """(هل يتحقق نصاب النقد، قيمة النقد بالدولار أو None بلا سعر) — تُحفظ الثانية على حول CASH_POOL."""
     # نقارن النقد بقيمة 85g ذهب
-    settings_obj = user.usersettings
-    dc = (settings_obj.display_currency or "USD").upper()
-    gold_ppg = _get_gold_price_per_gram_in(dc, user)
-    if gold_ppg is None:
-        return False  # بدون سعر لا نذكّر (آمن)
-    cash_total = total_cash_value_in(dc, user)
+    ctx = ctx or ValuationContext(user)
+    dc = ctx.display_currency
+    gold_ppg = _get_gold_price_per_gram_in(dc, user, ctx)
+    if not gold_ppg:
+        return False, None  # بدون سعر لا نذكّر (آمن)
+    cash_total = total_cash_value_in(dc, user, ctx)
     nisab_value = NISAB_GOLD_G * gold_ppg
-    return cash_total >= nisab_value
+    return cash_total >= nisab_value, cash_value_usd(cash_total, gold_ppg, ctx)
 
-def _ensure_anchor(user, group: str, meets: bool):
+def _ensure_anchor(user, group: str, meets: bool, anc: ZakatAnchor | None = None) -> ZakatAnchor:
     """
-    يثبّت/يعيد ضبط Anchor لمجموعة أصول واحدة.
+    يثبّت/يعيد ضبط Anchor لمجموعة أصول واحدة (anc: محمّل مسبقًا إن وُجد).
     """
-    anc, _ = ZakatAnchor.objects.get_or_create(user=user, asset_group=group)
+    if anc is None:
+        anc, _ = ZakatAnchor.objects.get_or_create(user=user, asset_group=group)
     if meets:
         # إذا لا يوجد start => نبدأ اليوم
         if not (anc.start_hijri_year and anc.start_hijri_month and anc.start_hijri_day):
@@ -517,21 +906,28 @@ def _ensure_anchor(user, group: str, meets: bool):
             due = add_one_hijri_year(h)
             anc.start_hijri_year, anc.start_hijri_month, anc.start_hijri_day = h.year, h.month, h.day
             anc.due_hijri_year, anc.due_hijri_month, anc.due_hijri_day = due.year, due.month, due.day
+            anc.due_date = _anchor_due_date(anc)
             anc.status = "ACTIVE"
             anc.save()
-        else:
-            # ثابت — لا شيء
-            pass
+            schedule_anchor_reminders(anc)
+        elif anc.due_date is None:
+            # حول مثبت قبل وجود due_date/جدول التذكيرات: نكمله مرة واحدة
+            anc.due_date = _anchor_due_date(anc)
+            anc.save(update_fields=["due_date", "updated_at"])
+            schedule_anchor_reminders(anc)
     else:
         # إن كان مثبتًا من قبل، نعيد ضبطه (زال النصاب)
         if anc.start_hijri_year:
             anc.status = "RESET"
             anc.start_hijri_year = anc.start_hijri_month = anc.start_hijri_day = None
             anc.due_hijri_year = anc.due_hijri_month = anc.due_hijri_day = None
+            anc.due_date = None
             anc.save()
+            anc.reminders.filter(sent_at__isnull=True).delete()
+    return anc
 
 def _hijri_to_gregorian(hy, hm, hd):
-    g = Hijri(hy, hm, hd).to_gregorian()
+    g = hijri_to_date(hy, hm, hd)
     return g.year, g.month, g.day
 
 def _time_until_due(anc: ZakatAnchor):
@@ -543,88 +939,224 @@ def _time_until_due(anc: ZakatAnchor):
     - الاختبار: "hours" بناءً على start + ZAKAT_TEST_CYCLE_DAYS
     """
     today = timezone.now()
+    due_at = _anchor_due_at(anc)
 
     if getattr(settings, "ZAKAT_TEST_MODE", False):
-        start_g = _anchor_start_gregorian(anc)
-        if not start_g:
+        if due_at is None:
             return ("hours", None)
-        due_dt = timezone.datetime.combine(
-            start_g + timedelta(days=int(getattr(settings, "ZAKAT_TEST_CYCLE_DAYS", 1))),
-            timezone.datetime.min.time(),
-            tzinfo=timezone.utc,
-        )
-        delta = due_dt - today
-        hours = int(delta.total_seconds() // 3600)
+        hours = int((due_at - today).total_seconds() // 3600)
         return ("hours", hours)
 
-    # الوضع العادي (هجري → ميلادي ثم أيام)
-    due_g = _due_gregorian(anc)
-    if not due_g:
+    # الوضع العادي: due_date محسوب مسبقًا عند التثبيت (بلا تحويل هجري هنا)
+    if due_at is None:
         return ("days", None)
-    due_dt = timezone.datetime.combine(due_g, timezone.datetime.min.time(), tzinfo=timezone.utc)
-    days = (due_dt.date() - today.date()).days
+    days = (due_at.date() - today.date()).days
     return ("days", days)
 
 
-def _notify_once(user, type_, title, body, meta_key, priority="normal"):
-    # منع التكرار بنفس meta_key
-    if Notification.objects.filter(user=user, meta_key=meta_key).exists():
-        return
-    Notification.objects.create(
-        user=user, type=type_, title=title, body=body, priority=priority, meta_key=meta_key
+def notify_bulk(notes, batch_size: int = 1000, users=()) -> int:
+    """
+    يكتب إشعارات كثيرة (Notification غير محفوظة) بعبارة INSERT لكل دفعة.
+    التكرار بنفس (user, meta_key) يمنعه القيد الفريد الجزئي: نستبعد الموجود باستعلام واحد
+    ثم ignore_conflicts يحسم أي سباق متزامن. ثم نرفع نسخة لقطة من وصلته إشعارات جديدة فقط.
+    users: كائنات User التي يحملها المُنادي (مثل request.user) فتُرفع النسخة عبرها وتبقى
+    أرقام أقسامها في الذاكرة محدّثة؛ غيرهم يُحمَّل من القاعدة (من يحمل نسخة أخرى عليه refresh_from_db).
+    يرجع عدد الإشعارات المكتوبة: بعد استبعاد الموجود والمكرر في نفس الدفعة
+    (سباق نادر مع كاتب متزامن قد يُسقط صفًا يحسبه ذلك الكاتب لا نحن).
+    """
+    from django.contrib.auth import get_user_model
+
+    fresh, seen = [], set()
+    notes = list(notes)
+    keyed = [n for n in notes if n.meta_key]
+    existing = set(Notification.objects.filter(
+        user_id__in={n.user_id for n in keyed},
+        meta_key__in={n.meta_key for n in keyed},
+    ).values_list("user_id", "meta_key")) if keyed else set()
+    for n in notes:
+        key = (n.user_id, n.meta_key)
+        if n.meta_key and (key in existing or key in seen):
+            continue
+        seen.add(key)
+        fresh.append(n)
+    if not fresh:
+        return 0
+    Notification.objects.bulk_create(fresh, batch_size=batch_size, ignore_conflicts=True)
+
+    # الإشعارات جزء من اللقطة
+    held = {u.pk: u for u in users}
+    user_ids = {n.user_id for n in fresh}
+    loaded = get_user_model().objects.filter(id__in=user_ids - set(held)).select_related("profile")
+    for user in [held[uid] for uid in user_ids if uid in held] + list(loaded):
+        bump_snapshot_version(user, sections=("notifications",))
+    return len(fresh)
+
+# -----------------------------
+# طابور إعادة تقييم الزكاة (ZakatDirtyUser)
+# -----------------------------
+REMINDER_OFFSETS_DAYS = (10, 3, 0, -3)
+
+def mark_zakat_dirty(user_ids, reason: str = "holdings") -> int:
+    """يضيف المستخدمين للطابور (أو يحدّث marked_at إن كانوا فيه) باستعلام واحد."""
+    ids = {int(uid) for uid in user_ids}
+    if not ids:
+        return 0
+    now = timezone.now()
+    ZakatDirtyUser.objects.bulk_create(
+        [ZakatDirtyUser(user_id=uid, reason=reason, marked_at=now) for uid in ids],
+        update_conflicts=True, unique_fields=["user"], update_fields=["reason", "marked_at"],
+        batch_size=1000,
     )
+    return len(ids)
 
-def update_zakat_anchors_and_reminders(user):
+def mark_zakat_dirty_for_rates(fx_currencies=(), gold_changed: bool = False) -> int:
+    """
+    حركة الأسعار تمس نصاب النقد فقط (يُقارن بقيمة 85g ذهب بعملة العرض؛ الذهب والفضة بالوزن):
+    - تغيّر صرف عملات C => من لديه نقد بإحدى C أو عملة عرضه ضمن C.
+    - تغيّر سعر الذهب => من لديه نقد وقد ينقلب نصابه: حوله المثبت لم تعد قيمة نقده
+      (cash_value_usd من آخر تقييم) تبلغ 85g بالسعر الجديد، أو غير المثبت صارت تبلغه،
+      أو لم تُحفظ له قيمة بعد. (من تغيّر نقده أو صرف عملاته يُعلَّم بسببها أصلًا.)
+    """
+    cash = HoldingBalance.objects.filter(asset_type="CASH").exclude(balance=0)
+    conds = []
+    currencies = {c.upper() for c in fx_currencies}
+    if currencies:
+        conds.append(Q(currency_code__in=currencies) | Q(user__usersettings__display_currency__in=currencies))
+    if gold_changed:
+        gold_usd = latest_metal_dict()["gold_g_per"]
+        if gold_usd:
+            nisab_usd = NISAB_GOLD_G * Decimal(gold_usd)
+            settled = ZakatAnchor.objects.filter(asset_group="CASH_POOL", cash_value_usd__isnull=False).filter(
+                Q(start_hijri_year__isnull=False, cash_value_usd__gte=nisab_usd)
+                | Q(start_hijri_year__isnull=True, cash_value_usd__lt=nisab_usd)
+            )
+            conds.append(~Q(user_id__in=settled.values("user_id")))
+        else:
+            conds.append(Q())  # بلا سعر ذهب: كل من لديه نقد (آمن)
+    if not conds:
+        return 0
+    q = conds[0]
+    for cond in conds[1:]:
+        q |= cond
+    return mark_zakat_dirty(cash.filter(q).order_by().values_list("user_id", flat=True).distinct(), reason="rates")
+
+# -----------------------------
+# جدول التذكيرات (ReminderSchedule) والمُرسِل
+# -----------------------------
+# (المرحلة، أيام قبل الاستحقاق، بادئة العنوان، النص، الأولوية)
+REMINDER_STAGES = (
+    ("T-10", 10, "تذكير", "تستحق الزكاة بعد 10 أيام.", "important"),
+    ("T-3", 3, "تذكير", "تستحق الزكاة بعد 3 أيام.", "important"),
+    ("T0", 0, "تذكير", "اليوم يوم استحقاق الزكاة.", "important"),
+    ("T+3", -3, "متابعة", "مرّ 3 أيام على استحقاق الزكاة.", "normal"),
+)
+ZAKAT_GROUP_LABELS = {"GOLD_PURE": "زكاة الذهب", "SILVER": "زكاة الفضة", "CASH_POOL": "زكاة الأموال"}
+
+def _reminder_rows(anc: ZakatAnchor, due_at):
+    """[(stage, fire_at, title, body, priority, meta_key)] لحول مثبت (بنفس meta_key التذكيرات السابقة)."""
+    label = ZAKAT_GROUP_LABELS.get(anc.asset_group, anc.asset_group)
+    if getattr(settings, "ZAKAT_TEST_MODE", False):
+        start = f"{anc.start_hijri_year}-{anc.start_hijri_month}-{anc.start_hijri_day}"
+        rows = []
+        for h in getattr(settings, "ZAKAT_TEST_REMINDERS_HOURS", [6, 1, 0, -6]):
+            tag = f"H{h:+d}"  # مثل H+0 أو H-6
+            body = ("اختبار: قرب موعد استحقاق الزكاة." if h > 0
+                    else ("اختبار: اليوم الاستحقاق." if h == 0 else "اختبار: مضى وقت على الاستحقاق."))
+            rows.append((tag, due_at - timedelta(hours=h), f"تذكير {label}", body,
+                         "important" if h >= 0 else "normal", f"ZKTEST:{anc.asset_group}:{start}:{tag}"))
+        return rows
+    due = f"{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}"
+    return [
+        (stage, due_at - timedelta(days=days), f"{prefix} {label}", body, priority, f"ZK:{anc.asset_group}:{due}:{stage}")
+        for stage, days, prefix, body, priority in REMINDER_STAGES
+    ]
+
+def reminder_schedule_for(anc: ZakatAnchor, now=None) -> list:
+    """
+    صفوف ReminderSchedule (غير محفوظة) لحول مثبت.
+    إن كانت عدة مراحل قد فاتت (حول قديم) نُبقي أحدثها فقط.
+    """
+    due_at = _anchor_due_at(anc)
+    if due_at is None:
+        return []
+    now = now or timezone.now()
+    rows = sorted(_reminder_rows(anc, due_at), key=lambda r: r[1])
+    past = [r for r in rows if r[1] <= now]
+    rows = past[-1:] + [r for r in rows if r[1] > now]
+    return [
+        ReminderSchedule(anchor=anc, user_id=anc.user_id, stage=stage, fire_at=fire_at,
+                         title=title, body=body, priority=priority, meta_key=meta_key)
+        for stage, fire_at, title, body, priority, meta_key in rows
+    ]
+
+def schedule_anchor_reminders(anc: ZakatAnchor) -> int:
+    """يحفظ جدول تذكيرات حول بدأ للتو (مرة واحدة؛ التكرار يُتجاهل بالقيد الفريد)."""
+    rows = reminder_schedule_for(anc)
+    ReminderSchedule.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+def dispatch_due_reminders(user_ids=None, now=None, batch_size: int = 500, users=()) -> int:
+    """
+    يحوّل التذكيرات المستحقة (fire_at <= now و sent_at فارغ) إلى إشعارات على دفعات:
+    استعلام نطاق على الفهرس الجزئي بدل مقارنة يوم بيوم، فالتشغيل الفائت لا يُسقط تذكيرًا.
+    إن فاتت عدة مراحل لنفس الحول نرسل أحدثها فقط. يرجع عدد الإشعارات المُنشأة.
+    الوحدة هي الحول لا الصف: نقفل دفعة أحوال (skip_locked) ثم نقرأ كل مراحلها المستحقة معًا،
+    فقرار "الأحدث يغلب" يُتخذ على مجموعة كاملة مقفلة ولا يعتمد على صفوف يحملها عامل آخر.
+    users: كائنات User لدى المُنادي (تُمرَّر إلى notify_bulk).
+    """
+    now = now or timezone.now()
+    pending = ReminderSchedule.objects.filter(fire_at__lte=now, sent_at__isnull=True)
+    if user_ids is not None:
+        pending = pending.filter(user_id__in=user_ids)
+
+    created = 0
+    busy = set()  # أحوال يقفلها عامل آخر الآن: يرسلها هو
+    while True:
+        with db_transaction.atomic():
+            candidates = list(pending.exclude(anchor_id__in=busy).order_by("anchor_id")
+                              .values_list("anchor_id", flat=True).distinct()[:batch_size])
+            if not candidates:
+                break
+            locked = list(ZakatAnchor.objects.select_for_update(skip_locked=True)
+                          .filter(id__in=candidates).values_list("id", flat=True))
+            busy.update(set(candidates) - set(locked))
+            # بعد القفل: كل المراحل المستحقة لهذه الأحوال (ما أرسله غيرنا قبلنا لم يعد معلّقًا)
+            batch = list(pending.filter(anchor_id__in=locked).order_by("fire_at", "id"))
+            latest = {}
+            for r in batch:  # مرتبة بـ fire_at: الأحدث يغلب
+                latest[r.anchor_id] = r
+            created += notify_bulk(
+                [Notification(user_id=r.user_id, type="ZAKAT_REMINDER", title=r.title, body=r.body,
+                              priority=r.priority, meta_key=r.meta_key) for r in latest.values()],
+                batch_size=batch_size, users=users,
+            )
+            ReminderSchedule.objects.filter(id__in=[r.id for r in batch]).update(sent_at=now)
+    return created
+
+def update_zakat_anchors_and_reminders(user, ctx: ValuationContext | None = None):
     """
     تُدعى عند login/heartbeat.
     1) تحدّث Anchors حسب تحقق/سقوط النصاب.
-    2) تولّد تذكيرات مراحل الاستحقاق دون تكرار.
-    """
-    # 1) تثبيت/إعادة ضبط Anchors
-    _ensure_anchor(user, "GOLD_PURE", meets_nisab_gold_pure(user))
-    _ensure_anchor(user, "SILVER", meets_nisab_silver(user))
-    _ensure_anchor(user, "CASH_POOL", meets_nisab_cash(user))
-
-    # 2) توليد التذكيرات
-    for group, title_label in (
-        ("GOLD_PURE", "زكاة الذهب"),
-        ("SILVER", "زكاة الفضة"),
-        ("CASH_POOL", "زكاة الأموال"),
+    2) ترسل تذكيرات المراحل المستحقة من ReminderSchedule (دون تكرار).
+    """
+    ctx = ctx or ValuationContext(user)
+    # 1) تثبيت/إعادة ضبط Anchors (كلها باستعلام واحد)
+    anchors = {a.asset_group: a for a in ZakatAnchor.objects.filter(user=user)}
+    for group, meets in (
+        ("GOLD_PURE", meets_nisab_gold_pure(user, ctx)),
+        ("SILVER", meets_nisab_silver(user, ctx)),
     ):
-        try:
-            anc = ZakatAnchor.objects.get(user=user, asset_group=group)
-        except ZakatAnchor.DoesNotExist:
-            continue
-        if not anc.due_hijri_year:
-            continue  # لا حول مثبت
-        mode, remaining = _time_until_due(anc)
-        if remaining is None:
-            continue
+        anchors[group] = _ensure_anchor(user, group, meets, anchors.get(group))
+    # حول النقد: نحفظ معه قيمة النقد بالدولار (لاستهداف حركة سعر الذهب)
+    meets_cash, cash_usd = cash_nisab_position(user, ctx)
+    anc = anchors["CASH_POOL"] = _ensure_anchor(user, "CASH_POOL", meets_cash, anchors.get("CASH_POOL"))
+    if anc.cash_value_usd != cash_usd:
+        ZakatAnchor.objects.filter(pk=anc.pk).update(cash_value_usd=cash_usd)
+        anc.cash_value_usd = cash_usd
+
+    # 2) إرسال ما استحق من جدول التذكيرات (المراحل وُلّدت عند تثبيت الحول)
+    dispatch_due_reminders(user_ids=[user.id], users=[user])
 
-        if mode == "days":
-            # مراحل الإنتاج (هجري): -3 / 0 / +3 وما سبق (10، 3)
-            if remaining == 10:
-                _notify_once(user, "ZAKAT_REMINDER", f"تذكير {title_label}", "تستحق الزكاة بعد 10 أيام.", f"ZK:{group}:{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}:T-10", "important")
-            elif remaining == 3:
-                _notify_once(user, "ZAKAT_REMINDER", f"تذكير {title_label}", "تستحق الزكاة بعد 3 أيام.", f"ZK:{group}:{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}:T-3", "important")
-            elif remaining == 0:
-                _notify_once(user, "ZAKAT_REMINDER", f"تذكير {title_label}", "اليوم يوم استحقاق الزكاة.", f"ZK:{group}:{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}:T0", "important")
-            elif remaining == -3:
-                _notify_once(user, "ZAKAT_REMINDER", f"متابعة {title_label}", "مرّ 3 أيام على استحقاق الزكاة.", f"ZK:{group}:{anc.due_hijri_year}-{anc.due_hijri_month}-{anc.due_hijri_day}:T+3", "normal")
-
-        else:  # mode == "hours" (وضع الاختبار)
-            checkpoints = getattr(settings, "ZAKAT_TEST_REMINDERS_HOURS", [6, 1, 0, -6])
-            # remaining = ساعات حتى الاستحقاق
-            if remaining in checkpoints:
-                tag = f"H{remaining:+d}"  # مثل H+0 أو H-6
-                _notify_once(
-                    user, "ZAKAT_REMINDER", f"تذكير {title_label}",
-                    "اختبار: قرب موعد استحقاق الزكاة." if remaining > 0 else ("اختبار: اليوم الاستحقاق." if remaining == 0 else "اختبار: مضى وقت على الاستحقاق."),
-                    f"ZKTEST:{group}:{anc.start_hijri_year}-{anc.start_hijri_month}-{anc.start_hijri_day}:{tag}",
-                    "important" if remaining >= 0 else "normal"
-                )
-
-       
 
 from django.conf import settings
 from datetime import timedelta
@@ -632,14 +1164,27 @@ from datetime import timedelta
 def _anchor_start_gregorian(anc: ZakatAnchor):
     if not (anc.start_hijri_year and anc.start_hijri_month and anc.start_hijri_day):
         return None
-    g = Hijri(anc.start_hijri_year, anc.start_hijri_month, anc.start_hijri_day).to_gregorian()
-    return timezone.datetime(g.year, g.month, g.day, tzinfo=timezone.utc).date()
+    return hijri_to_date(anc.start_hijri_year, anc.start_hijri_month, anc.start_hijri_day)
 
 def _due_gregorian(anc: ZakatAnchor):
     if not (anc.due_hijri_year and anc.due_hijri_month and anc.due_hijri_day):
         return None
-    g = Hijri(anc.due_hijri_year, anc.due_hijri_month, anc.due_hijri_day).to_gregorian()
-    return timezone.datetime(g.year, g.month, g.day, tzinfo=timezone.utc).date()
+    return hijri_to_date(anc.due_hijri_year, anc.due_hijri_month, anc.due_hijri_day)
+
+def _anchor_due_date(anc: ZakatAnchor):
+    """تاريخ الاستحقاق الميلادي المخزّن في due_date (الاختبار: start + ZAKAT_TEST_CYCLE_DAYS)."""
+    if getattr(settings, "ZAKAT_TEST_MODE", False):
+        start_g = _anchor_start_gregorian(anc)
+        if not start_g:
+            return None
+        return start_g + timedelta(days=int(getattr(settings, "ZAKAT_TEST_CYCLE_DAYS", 1)))
+    return _due_gregorian(anc)
+
+def _anchor_due_at(anc: ZakatAnchor):
+    """بداية يوم الاستحقاق (UTC كما كانت المقارنة سابقًا) أو None."""
+    if anc.due_date is None:
+        return None
+    return datetime.combine(anc.due_date, datetime.min.time(), tzinfo=dt_timezone.utc)
 
 from decimal import Decimal, ROUND_HALF_UP
 
@@ -647,7 +1192,7 @@ def _quant(v: Decimal) -> str:
     # تقريب لطيف 6 منازل للمعادن و2 للأموال عند العرض
     return str(v.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
 
-def portfolio_value_in_display(user):
+def portfolio_value_in_display(user, ctx: ValuationContext | None = None):
     """
     يحسب القيمة الحالية للمحفظة بعملة العرض:
     - قيمة الذهب (باستخدام وزن خالص × سعر غرام الذهب)
@@ -656,22 +1201,13 @@ def portfolio_value_in_display(user):
     - الإجمالي
     يرجع dict جاهز للعرض.
     """
-    dc = (user.usersettings.display_currency or "USD").upper()
-    holdings = compute_holdings(user)
+    ctx = ctx or ValuationContext(user)
+    dc = ctx.display_currency
+    holdings = ctx.holdings
 
     # أسعار الغرام
-    metals = latest_metal_dict()
-    gold_ppg_dc = _get_gold_price_per_gram_in(dc, user)     # قد تكون None
-    silver_ppg_dc = None
-    if metals.get("silver_g_per"):
-        # تحويل سعر غرام الفضة من USD إلى display_currency
-        usd_silver = Decimal(str(metals["silver_g_per"]))
-        if dc == "USD":
-            silver_ppg_dc = usd_silver
-        else:
-            fx = latest_fx_for_pairs([("USD", dc)])
-            if fx:
-                silver_ppg_dc = (usd_silver * Decimal(str(fx[0]["rate"]))).quantize(Decimal("0.000001"))
+    gold_ppg_dc = _get_gold_price_per_gram_in(dc, user, ctx)      # قد تكون None
+    silver_ppg_dc = _get_silver_price_per_gram_in(dc, user, ctx)  # قد تكون None
 
     # قيم المعادن
     gold_val = Decimal("0")
@@ -683,7 +1219,7 @@ def portfolio_value_in_display(user):
         silver_val = Decimal(str(holdings["silver_g"])) * silver_ppg_dc
 
     # قيمة النقد
-    cash_val = total_cash_value_in(dc, user)
+    cash_val = total_cash_value_in(dc, user, ctx)
 
     total_val = gold_val + silver_val + cash_val
 
@@ -708,7 +1244,7 @@ def portfolio_value_in_display(user):
         "raw_holdings": holdings,  # نفس الملخص المستخدم في الواجهة الرئيسية (للشفافية)
     }
 
-def zakat_overview_in_display(user):
+def zakat_overview_in_display(user, ctx: ValuationContext | None = None):
     """
     يقدّر الزكاة (2.5%) إذا كان اليوم هو يوم الاستحقاق (تقدير عرض فقط).
     - ذهب: 2.5% من القيمة الحالية للذهب الخالص.
@@ -717,8 +1253,9 @@ def zakat_overview_in_display(user):
     كما يعيد مواعيد الاستحقاق القادمة لكل مجموعة (إن وُجد Anchor).
     """
     from .models import ZakatAnchor
-    dc = (user.usersettings.display_currency or "USD").upper()
-    pf = portfolio_value_in_display(user)
+    ctx = ctx or ValuationContext(user)
+    dc = ctx.display_currency
+    pf = portfolio_value_in_display(user, ctx)
 
     # تقدير 2.5%
     def _pct(v):
@@ -771,40 +1308,16 @@ from .models import Transaction
 
 def compute_cash_wallets(user):
     """
-    يُرجع قائمة محافظ نقدية مُجمَّعة لكل عملة:
+    يُرجع قائمة محافظ نقدية مُجمَّعة لكل عملة:
     [{"currency_code": "USD", "balance": "123.456000"}, ...]
-    يعتمد فقط المعاملات غير المحذوفة (soft_deleted_at__isnull=True).
-    ADD = موجب | WITHDRAW/ZAKAT = سالب.
+    يقرأ من دفتر الأرصدة (HoldingBalance) المبني من المعاملات غير المحذوفة.
     """
-    qs = Transaction.objects.filter(
-        user=user,
-        asset_type="CASH",
-        soft_deleted_at__isnull=True,
-    )
-
-    balance_expr = Sum(
-        Case(
-            When(operation_type="ADD", then=F("amount")),
-            When(operation_type__in=["WITHDRAW", "ZAKAT"], then=-F("amount")),
-            default=Decimal("0"),
-            output_field=DecimalField(max_digits=24, decimal_places=10),
-        )
-    )
-
-    rows = (qs.values("currency_code")
-              .annotate(balance=balance_expr)
-              .order_by("currency_code"))
-
-    wallets = []
-    for r in rows:
-        cc = (r["currency_code"] or "").upper()
-        bal = r["balance"] or Decimal("0")
-        if cc and bal > 0:
-            wallets.append({
-                "currency_code": cc,
-                "balance": f"{bal:.6f}",
-            })
-    return wallets
+    rows = (HoldingBalance.objects
+            .filter(user=user, asset_type="CASH", balance__gt=0)
+            .exclude(currency_code="")
+            .order_by("currency_code")
+            .values_list("currency_code", "balance"))
+    return [{"currency_code": cc, "balance": f"{bal:.6f}"} for cc, bal in rows]
 
 
 
@@ -812,8 +1325,9 @@ def compute_cash_wallets(user):
 from decimal import Decimal
 from datetime import date
 
-def _get_silver_price_per_gram_in(currency_code: str, user) -> Decimal | None:
-    md = latest_metal_dict()  # USD per gram عادة
+def _get_silver_price_per_gram_in(currency_code: str, user, ctx: ValuationContext | None = None) -> Decimal | None:
+    ctx = ctx or ValuationContext(user)
+    md = ctx.metals  # USD per gram عادة
     if not md["silver_g_per"]:
         return None
     usd_per_g = Decimal(md["silver_g_per"])
@@ -822,44 +1336,19 @@ def _get_silver_price_per_gram_in(currency_code: str, user) -> Decimal | None:
         return usd_per_g
 
     # أولوية: Overrides ثم FxRate
-    rate = None
-    ov = getattr(user.usersettings, "user_fx_overrides", {}) or {}
-    ov_key = f"USD->{target}"
-    if ov_key in ov:
-        try:
-            rate = Decimal(str(ov[ov_key]))
-        except Exception:
-            rate = None
-    if rate is None:
-        fx = latest_fx_for_pairs([("USD", target)])
-        if fx:
-            rate = Decimal(str(fx[0]["rate"]))
-
+    rate = ctx.fx_rate("USD", target)
     if rate is None:
         return None
     return (usd_per_g * rate).quantize(Decimal("0.000001"))
 
 
-def _convert_money(amount: Decimal, base: str, target: str, user) -> Decimal | None:
+def _convert_money(amount: Decimal, base: str, target: str, user, ctx: ValuationContext | None = None) -> Decimal | None:
     base = (base or "USD").upper()
     target = (target or "USD").upper()
     if base == target:
         return amount
 
-    ov = getattr(user.usersettings, "user_fx_overrides", {}) or {}
-    rate = None
-    ov_key = f"{base}->{target}"
-    if ov_key in ov:
-        try:
-            rate = Decimal(str(ov[ov_key]))
-        except Exception:
-            rate = None
-
-    if rate is None:
-        fx = latest_fx_for_pairs([(base, target)])
-        if fx:
-            rate = Decimal(str(fx[0]["rate"]))
-
+    rate = (ctx or ValuationContext(user)).fx_rate(base, target)
     if rate is None:
         return None
     return (amount * rate).quantize(Decimal("0.0000001"))
@@ -895,23 +1384,78 @@ def _parse_period(preset: str | None, dfrom: str | None, dto: str | None) -> tup
     return start, today, "last_month"
 
 
-def build_reports_dashboard(user, display_currency: str, date_from: date, date_to: date) -> dict:
+def _next_month(d: date) -> date:
+    d = d.replace(day=1)
+    return d.replace(year=d.year + 1, month=1) if d.month == 12 else d.replace(month=d.month + 1)
+
+def _months_between(date_from: date, date_to: date) -> list:
+    """أوائل الأشهر التي تتقاطع مع الفترة [from, to]."""
+    out, m = [], date_from.replace(day=1)
+    while m <= date_to:
+        out.append(m)
+        m = _next_month(m)
+    return out
+
+def _dashboard_groups(user, date_from: date, date_to: date, by_date: bool = False) -> list:
+    """
+    مجموعات التقرير: [{"month", "day", "operation_type", "asset_type", "karat", "currency_code", "quantity"}].
+    - الأشهر الكاملة داخل الفترة تُقرأ من UserMonthlyFlow (صف لكل شهر/مفتاح مهما كثرت المعاملات).
+    - الأطراف الجزئية (أول/آخر شهر) تُجمَّع من Transaction باستعلام واحد.
+    - by_date=True: كل شيء من Transaction مجمّعًا بالتاريخ (للتقييم بسعر كل يوم).
+    """
+    out = []
+    qty_expr = Sum(
+        Case(
+            When(asset_type="CASH", then=F("amount")),
+            default=F("weight_g"),
+            output_field=DecimalField(max_digits=24, decimal_places=10),
+        )
+    )
+
+    def add_raw(tx_qs):
+        fields = ["operation_type", "asset_type", "karat", "currency_code"]
+        if by_date:
+            fields.append("date")
+        else:
+            tx_qs = tx_qs.annotate(month=TruncMonth("date"))
+            fields.append("month")
+        for r in tx_qs.order_by().values(*fields).annotate(quantity=qty_expr):
+            if not r["quantity"]:
+                continue
+            asset, karat, cc = _holding_key(r["asset_type"], r["karat"], r["currency_code"])
+            day = r.get("date")
+            out.append({"month": _month_start(day) if by_date else r["month"], "day": day,
+                        "operation_type": r["operation_type"], "asset_type": asset, "karat": karat,
+                        "currency_code": cc, "quantity": r["quantity"]})
+
+    tx_qs = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True)
+    first_full = date_from if date_from.day == 1 else _next_month(date_from)
+    end_full = _next_month(date_to) if _next_month(date_to) - timedelta(days=1) == date_to else date_to.replace(day=1)
+    if by_date or first_full >= end_full:
+        add_raw(tx_qs.filter(date__gte=date_from, date__lte=date_to))
+        return out
+
+    for f in UserMonthlyFlow.objects.filter(user=user, month__gte=first_full, month__lt=end_full).exclude(quantity=0):
+        out.append({"month": f.month, "day": None, "operation_type": f.operation_type, "asset_type": f.asset_type,
+                    "karat": f.karat, "currency_code": f.currency_code, "quantity": f.quantity})
+    add_raw(tx_qs.filter(Q(date__gte=date_from, date__lt=first_full) | Q(date__gte=end_full, date__lte=date_to)))
+    return out
+
+
+DASHBOARD_VALUATIONS = ("current", "transaction_date")
+
+def build_reports_dashboard(user, display_currency: str, date_from: date, date_to: date,
+                            ctx: ValuationContext | None = None, valuation: str = "current") -> dict:
     """
     يُجمّع التقارير للفترة المطلوبة بنفس شكل واجهة التقارير.
     - كل القيم المالية بعملة العرض.
     - الأوزان بالجرام (الواجهة تعرضها KG بقسمة 1000).
+    - valuation="current": بأسعار اليوم. "transaction_date": بالأسعار السارية في تاريخ كل معاملة
+      (AsOfPrices: تحميل مسبق للفترة ثم بحث ثنائي؛ وإن لم يوجد سجل لذلك التاريخ نرجع لسعر اليوم).
+    - series: قيمة كل قسم لكل شهر من الفترة (من UserMonthlyFlow للأشهر الكاملة).
     """
-    from .models import Transaction
-    from django.db.models import Q
-
     cur = display_currency.upper()
-
-    qs = Transaction.objects.filter(
-        user=user,
-        soft_deleted_at__isnull=True,
-        date__gte=date_from,
-        date__lte=date_to
-    )
+    ctx = ctx or ValuationContext(user)
 
     # محضِّرات
     zero_val = Decimal("0")
@@ -925,32 +1469,90 @@ def build_reports_dashboard(user, display_currency: str, date_from: date, date_t
     }
 
     # أسعار الغرام (ذهب/فضة) بعملة العرض
-    gold_ppg = _get_gold_price_per_gram_in(cur, user)      # موجودة سلفًا عندكم
-    silver_ppg = _get_silver_price_per_gram_in(cur, user)
+    gold_ppg = _get_gold_price_per_gram_in(cur, user, ctx)      # موجودة سلفًا عندكم
+    silver_ppg = _get_silver_price_per_gram_in(cur, user, ctx)
+
+    # مجموعات (شهر، عملية، أصل، عيار، عملة) [+ تاريخ في وضع transaction_date] ثم التحويل
+    # ونسبة العيار مرة واحدة لكل مجموعة: الكلفة O(المجموعات) لا O(المعاملات).
+    groups = _dashboard_groups(user, date_from, date_to, by_date=(valuation == "transaction_date"))
+
+    if valuation == "transaction_date":
+        currencies = {g["currency_code"] for g in groups if g["asset_type"] == "CASH"}
+        asof = AsOfPrices(date_from, date_to, currencies=currencies | {cur, "USD"})
+        memo = {}
+
+        def fx_to_cur(base: str, day) -> Decimal | None:
+            base = (base or "USD").upper()
+            if base == cur:
+                return Decimal("1")
+            rate = ctx._override(base, cur)
+            if rate is None:
+                rate = asof.fx_rate(base, cur, day)
+            return rate if rate is not None else ctx.fx_rate(base, cur)
+
+        def price_at(metal: str, day, fallback):
+            key = (metal, day)
+            if key not in memo:
+                point = asof.metal_price(metal, day)
+                rate = fx_to_cur(point[1], day) if point else None
+                memo[key] = (point[0] * rate).quantize(Decimal("0.000001")) if rate is not None else fallback
+            return memo[key]
+
+        def cash_value(amount, cc, day):
+            rate = fx_to_cur(cc, day)
+            return (amount * rate).quantize(Decimal("0.0000001")) if rate is not None else None
+
+        def gold_at(day):
+            return price_at("GOLD", day, gold_ppg)
+
+        def silver_at(day):
+            return price_at("SILVER", day, silver_ppg)
+    else:
+        def cash_value(amount, cc, day):
+            return _convert_money(amount, cc, cur, user, ctx)
 
-    # Helper: أين نضع المعاملة؟
+        def gold_at(day):
+            return gold_ppg
+
+        def silver_at(day):
+            return silver_ppg
+
+    # Helper: أين نضع المجموعة؟
     def bucket(op: str):
         return "added" if op == "ADD" else ("withdrawn" if op == "WITHDRAW" else "zakat_paid")
 
-    for tx in qs:
-        b = sections[bucket(tx.operation_type)]
+    series = {m: {"added": zero_val, "withdrawn": zero_val, "zakat_paid": zero_val}
+              for m in _months_between(date_from, date_to)}
 
-        if tx.asset_type == "CASH" and tx.amount:
-            cv = _convert_money(Decimal(tx.amount), tx.currency_code, cur, user)
-            if cv is not None:
-                b["cash_v"] += cv
+    for g in groups:
+        name = bucket(g["operation_type"])
+        b = sections[name]
+        day = g["day"]
+        qty = Decimal(g["quantity"])
+        value = None
 
-        elif tx.asset_type == "GOLD" and tx.weight_g and tx.karat in (18, 21, 24):
-            pure_g = (Decimal(tx.weight_g) * Decimal(tx.karat) / Decimal(24))
+        if g["asset_type"] == "CASH":
+            value = cash_value(qty, g["currency_code"], day)
+            if value is not None:
+                b["cash_v"] += value
+
+        elif g["asset_type"] == "GOLD" and g["karat"] in (18, 21, 24):
+            pure_g = (qty * Decimal(g["karat"]) / Decimal(24))
             b["gold_pure_g"] += pure_g
-            if gold_ppg is not None:
-                b["gold_v"] += (pure_g * gold_ppg)
+            ppg = gold_at(day)
+            if ppg is not None:
+                value = pure_g * ppg
+                b["gold_v"] += value
+
+        elif g["asset_type"] == "SILVER":
+            b["silver_g"] += qty
+            ppg = silver_at(day)
+            if ppg is not None:
+                value = qty * ppg
+                b["silver_v"] += value
 
-        elif tx.asset_type == "SILVER" and tx.weight_g:
-            wg = Decimal(tx.weight_g)
-            b["silver_g"] += wg
-            if silver_ppg is not None:
-                b["silver_v"] += (wg * silver_ppg)
+        if value is not None and g["month"] in series:
+            series[g["month"]][name] += value
 
     def pack(sec):
         # نجمع الإجمالي ونُنسّق النصوص
@@ -971,6 +1573,11 @@ def build_reports_dashboard(user, display_currency: str, date_from: date, date_t
             "added": pack(sections["added"]),
             "withdrawn": pack(sections["withdrawn"]),
             "zakat_paid": pack(sections["zakat_paid"]),
-        }
+        },
+        "series": [
+            {"month": m.strftime("%Y-%m"),
+             **{name: f"{v.quantize(Decimal('0.01'))}" for name, v in vals.items()}}
+            for m, vals in sorted(series.items())
+        ],
     }
 
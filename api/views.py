@@ -16,6 +16,7 @@ import hashlib, json
 from .serializers import PortfolioReportSerializer, ZakatOverviewSerializer, TransactionsReportSerializer
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.db import transaction as db_transaction
 # api/views.py
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
@@ -27,15 +28,60 @@ import requests
 
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
+from django.db.models import Max, Count
+from django.conf import settings
+from .conditional import conditional_etag, make_etag
+from .portfolio_history import portfolio_history_in_display
+from .zakat_refresh import evaluate_now, schedule_evaluation
+from .pagination import capped_count, keyset_page
+from .stream import StreamTicket
 
 
 User = get_user_model()
 
+def _client_since_version(request):
+    """
+    نسخة اللقطة الموجودة لدى العميل: ?since_version=N أو If-None-Match: sv-N-...
+    (None => لقطة كاملة)
+    """
+    raw = request.query_params.get("since_version")
+    if raw and raw.isdigit():
+        return int(raw)
+    return parse_snapshot_etag(request.headers.get("If-None-Match"))
+
+# ----- مُحقِّقات GET الشرطية (رخيصة: لا تشغّل كود التقييم) -----
+def _snapshot_validator(request):
+    return snapshot_etag(request.user.profile)
+
+def _rates_validator(request):
+    s = request.user.usersettings
+    return make_etag("rates", s.display_currency, json.dumps(s.user_fx_overrides or {}, sort_keys=True),
+                     latest_rates_stamp())
+
+def _report_validator(prefix, daily=False, anchors=False):
+    def validator(request):
+        user = request.user
+        parts = [user.pk, user.profile.snapshot_version, latest_rates_stamp(), request.GET.urlencode()]
+        if daily:
+            # الفترات الجاهزة والأيام المتبقية تتغير مع اليوم (والساعة في وضع الاختبار)
+            now = timezone.localtime()
+            parts.append(now.strftime("%Y-%m-%dT%H") if settings.ZAKAT_TEST_MODE else now.date().isoformat())
+        if anchors:
+            parts.append(ZakatAnchor.objects.filter(user=user).aggregate(m=Max("updated_at"))["m"])
+        return make_etag(prefix, *parts)
+    return validator
+
+def _portfolio_history_validator(request):
+    user = request.user
+    stamp = PortfolioDaily.objects.filter(user=user).aggregate(m=Max("computed_at"), n=Count("id"))
+    return make_etag("pfh", user.pk, user.profile.snapshot_version, stamp["m"], stamp["n"],
+                     latest_rates_stamp(), request.GET.urlencode())
+
 @extend_schema(tags=["Health"])
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def health(request):
-    return Response({"status": "ok", "service": "zakati-api"})
+    return Response({"status": "ok", "service": "zakati-api", "snapshot_cache": snapshot_cache_stats()})
 
 # ========== Auth ==========
 
@@ -61,9 +107,10 @@ def login(request):
     access_token = str(refresh.access_token)
     refresh_token = str(refresh)
 
-    # نعيد Snapshot كامل مباشرة بعد الدخول
-    update_zakat_anchors_and_reminders(user)
-    snap = build_snapshot(user)
+    # نعيد Snapshot كامل مباشرة بعد الدخول (سياق تقييم واحد للطلب كله)
+    ctx = ValuationContext(user)
+    evaluate_now(user, ctx)  # فقط إن تغيّر ختم التقييم منذ آخر مرة
+    snap = build_snapshot(user, ctx, since_version=_client_since_version(request))
     body = {
         "access": access_token,
         "refresh": refresh_token,
@@ -79,8 +126,8 @@ def profile_update(request):
     serializer = ProfileSerializer(instance=profile, data=request.data, partial=True)
     serializer.is_valid(raise_exception=True)
     serializer.save()
-    bump_snapshot_version(request.user)  # أي تعديل = نسخة جديدة
-    snap = build_snapshot(request.user)
+    bump_snapshot_version(request.user, sections=("profile",))  # أي تعديل = نسخة جديدة
+    snap = build_snapshot(request.user, since_version=_client_since_version(request))
     return Response({"result": "success", "snapshot": snap})
 
 # ========== Notifications ==========
@@ -93,7 +140,7 @@ def heartbeat(request):
     الآن نفحص الإشعارات فقط (مبسّط).
     """
     user = request.user
-    update_zakat_anchors_and_reminders(user)
+    schedule_evaluation(user)  # في الخلفية، وفقط إن تغيّر ختم التقييم
     since_id = request.query_params.get("after_id")  # اختياري
     changed = {"notifications": False}
 
@@ -115,17 +162,41 @@ def heartbeat(request):
 @api_view(["GET"])
 def notifications_delta(request):
     """
-    يرجع الإشعارات الجديدة فقط بعد after_id (إن وُجد).
+    يرجع الإشعارات الجديدة فقط بعد after_id (إن وُجد)، 50 في كل مرة (has_more => أعد الطلب بـ last_id).
+    ?cursor= (فارغ للصفحة الأولى): تصفّح السجل الأحدث أولًا بمؤشر (created_at, id) مع next/previous،
+    و count محدود بـ PAGINATION_COUNT_CAP (count_exact=False إن بلغه).
     """
     user = request.user
-    after_id = request.query_params.get("after_id")
     qs = Notification.objects.filter(user=user)
+    if "cursor" in request.query_params:
+        page_size = int(request.query_params.get("page_size", 50))
+        try:
+            page = keyset_page(qs, request.query_params.get("cursor"), max(1, min(page_size, 100)))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+        count, exact = capped_count(qs)
+        return Response({
+            "count": count,
+            "count_exact": exact,
+            "items": NotificationSerializer(page["items"], many=True).data,
+            "next": page["next"],
+            "previous": page["previous"],
+        })
+
+    after_id = request.query_params.get("after_id")
     if after_id:
         qs = qs.filter(id__gt=after_id)
-    qs = qs.order_by("id")[:50]
-    items = NotificationSerializer(qs, many=True).data
+    rows = list(qs.order_by("id")[:51])
+    items = NotificationSerializer(rows[:50], many=True).data
     last_id = items[-1]["id"] if items else after_id or None
-    return Response({"items": items, "last_id": last_id})
+    return Response({"items": items, "last_id": last_id, "has_more": len(rows) > 50})
+
+@extend_schema(tags=["Notifications"], responses={200: dict})
+@api_view(["POST"])
+def notifications_stream_ticket(request):
+    """تذكرة قصيرة العمر لـ notifications/stream?ticket= (للمتصفح: EventSource لا يرسل Authorization)."""
+    ticket = StreamTicket.for_user(request.user)
+    return Response({"ticket": str(ticket), "expires_in": int(StreamTicket.lifetime.total_seconds())})
 
 @extend_schema(tags=["Notifications"], responses={200: BootstrapSnapshotSerializer})
 @api_view(["POST"])
@@ -136,14 +207,32 @@ def notification_mark_read(request, pk: int = None):
     except Notification.DoesNotExist:
         return Response({"detail": "غير موجود."}, status=404)
     n.mark_read()
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("notifications",))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "snapshot": snap})
 
+# ========== Snapshot (GET شرطي) ==========
+@extend_schema(
+    tags=["Sync"],
+    parameters=[OpenApiParameter(name="since_version", required=False, type=int,
+                                 description="نسخة العميل الحالية: تُرسل الأقسام المتغيرة فقط")],
+    responses={200: BootstrapSnapshotSerializer, 304: None},
+)
+@api_view(["GET"])
+@conditional_etag(_snapshot_validator)
+def snapshot(request):
+    """
+    اللقطة الحالية. If-None-Match بنفس ETag => 304،
+    وبـ ETag أقدم (أو since_version) => الأقسام المتغيرة فقط.
+    """
+    snap = build_snapshot(request.user, since_version=_client_since_version(request))
+    return Response(snap, status=200)
+
 
 # ========== Rates ==========
-@extend_schema(tags=["Rates"], responses={200: RatesResponseSerializer})
+@extend_schema(tags=["Rates"], responses={200: RatesResponseSerializer, 304: None})
 @api_view(["GET"])
+@conditional_etag(_rates_validator)
 def get_rates(request):
     user = request.user
     settings_obj = user.usersettings
@@ -165,19 +254,8 @@ def get_rates(request):
 
     fx = latest_fx_for_pairs(pairs)
 
-    # ETag بسيط
-    etag_src = json.dumps({
-        "dc": settings_obj.display_currency,
-        "metals": metals,
-        "fx": fx,
-        "ov": overrides,
-    }, sort_keys=True).encode("utf-8")
-    etag = "rates-" + hashlib.sha256(etag_src).hexdigest()[:16]
-
-    # If-None-Match
-    inm = request.headers.get("If-None-Match")
-    if inm and inm == etag:
-        return Response(status=204)
+    # ETag (حُسب مسبقًا في conditional_etag؛ وإن طابق If-None-Match رجع 304 قبل الوصول هنا)
+    etag = request.etag
 
     data = {
         "display_currency": settings_obj.display_currency,
@@ -226,8 +304,8 @@ def patch_user_rates(request):
     serializer.save()
 
     # نحدّث نسخة اللقطة لأن الإعدادات تغيّرت
-    bump_snapshot_version(request.user)
-    snap = build_snapshot(request.user)
+    bump_snapshot_version(request.user, sections=("settings",))
+    snap = build_snapshot(request.user, since_version=_client_since_version(request))
     return Response({"result": "success", "snapshot": snap}, status=200)
 
 # ========== Assets: CASH (ADD) ==========
@@ -270,7 +348,7 @@ def cash_add(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="CASH",
         operation_type="ADD",
@@ -281,9 +359,9 @@ def cash_add(request):
         invoice_image_url=invoice_url,
     )
 
-    # كل عملية كتابة ناجحة => bump + snapshot جديد
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    # كل عملية كتابة ناجحة => bump + snapshot جديد (أو الأقسام المتغيرة فقط مع since_version)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "cash_add", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -330,7 +408,7 @@ def cash_withdraw(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="CASH",
         operation_type="WITHDRAW",
@@ -341,8 +419,8 @@ def cash_withdraw(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "cash_withdraw", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -389,7 +467,7 @@ def cash_zakat(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="CASH",
         operation_type="ZAKAT",
@@ -400,8 +478,8 @@ def cash_zakat(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "cash_zakat", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -433,7 +511,7 @@ def gold_add(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="GOLD",
         operation_type="ADD",
@@ -444,8 +522,8 @@ def gold_add(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "gold_add", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -486,7 +564,7 @@ def gold_withdraw(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="GOLD",
         operation_type="WITHDRAW",
@@ -497,8 +575,8 @@ def gold_withdraw(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "gold_withdraw", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -534,7 +612,7 @@ def gold_zakat(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="GOLD",
         operation_type="ZAKAT",
@@ -545,8 +623,8 @@ def gold_zakat(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "gold_zakat", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 # ========== Assets: SILVER (ADD) ==========
@@ -577,7 +655,7 @@ def silver_add(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="SILVER",
         operation_type="ADD",
@@ -587,8 +665,8 @@ def silver_add(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "silver_add", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -624,7 +702,7 @@ def silver_withdraw(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="SILVER",
         operation_type="WITHDRAW",
@@ -634,8 +712,8 @@ def silver_withdraw(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "silver_withdraw", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 
@@ -671,7 +749,7 @@ def silver_zakat(request):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    tx = Transaction.objects.create(
+    tx = record_transaction(
         user=user,
         asset_type="SILVER",
         operation_type="ZAKAT",
@@ -681,8 +759,8 @@ def silver_zakat(request):
         invoice_image_url=invoice_url,
     )
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"))
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({"result": "success", "operation": "silver_zakat", "operation_id": tx.id, "snapshot": snap}, status=201)
 
 # ========== Transactions: Edit with Versioning ==========
@@ -731,33 +809,30 @@ def transaction_edit(request, pk: int):
             }
             return Response({"detail": msg_map.get(code, "فشل حفظ الفاتورة.")}, status=400)
 
-    # أنشئ نسخة جديدة
-    new_tx = Transaction.objects.create(
-        user=user,
-        asset_type=old.asset_type,
-        operation_type=new_fields["operation_type"],
-        karat=new_fields["karat"],
-        weight_g=new_fields["weight_g"],
-        currency_code=new_fields["currency_code"] or "",
-        amount=new_fields["amount"],
-        date=new_fields["date"],
-        notes=new_fields["notes"],
-        invoice_image_url=invoice_url,
-        previous_version=old,
-        is_edited=True,
-        edit_reason=data["edit_reason"],
-    )
+    with db_transaction.atomic():
+        # أنشئ نسخة جديدة
+        new_tx = record_transaction(
+            user=user,
+            asset_type=old.asset_type,
+            operation_type=new_fields["operation_type"],
+            karat=new_fields["karat"],
+            weight_g=new_fields["weight_g"],
+            currency_code=new_fields["currency_code"] or "",
+            amount=new_fields["amount"],
+            date=new_fields["date"],
+            notes=new_fields["notes"],
+            invoice_image_url=invoice_url,
+            previous_version=old,
+            is_edited=True,
+            edit_reason=data["edit_reason"],
+        )
 
-    # أرشفة القديمة (لا تُحسب)
-    from django.utils import timezone as djtz
-    old.is_edited = True
-    old.edit_reason = data["edit_reason"]
-    old.soft_deleted_at = djtz.now()
-    old.save(update_fields=["is_edited", "edit_reason", "soft_deleted_at"])
+        # أرشفة القديمة (لا تُحسب) + إزالة أثرها من الدفتر
+        archive_transaction(old, data["edit_reason"])
 
     # bump + snapshot
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"), removed={"transactions": [old.id]})
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({
         "result": "success",
         "operation": "transaction_edit",
@@ -784,14 +859,10 @@ def transaction_delete(request, pk: int):
     if not ok:
         return Response({"detail": msg}, status=400)
 
-    from django.utils import timezone as djtz
-    tx.is_edited = True  # نعلم أنها تغيرت (حُذفت)
-    tx.edit_reason = reason
-    tx.soft_deleted_at = djtz.now()
-    tx.save(update_fields=["is_edited", "edit_reason", "soft_deleted_at"])
+    archive_transaction(tx, reason)  # نعلم أنها تغيرت (حُذفت) ونزيل أثرها من الدفتر
 
-    bump_snapshot_version(user)
-    snap = build_snapshot(user)
+    bump_snapshot_version(user, sections=("assets", "transactions"), removed={"transactions": [tx.id]})
+    snap = build_snapshot(user, since_version=_client_since_version(request))
     return Response({
         "result": "success",
         "operation": "transaction_delete",
@@ -803,8 +874,9 @@ def transaction_delete(request, pk: int):
 
 
 # ========== Reports: Portfolio ==========
-@extend_schema(tags=["Reports"], responses={200: PortfolioReportSerializer})
+@extend_schema(tags=["Reports"], responses={200: PortfolioReportSerializer, 304: None})
 @api_view(["GET"])
+@conditional_etag(_report_validator("pf"))
 def report_portfolio(request):
     """
     ملخص المحفظة بعملة العرض:
@@ -815,9 +887,38 @@ def report_portfolio(request):
     return Response(data, status=200)
 
 
+# ========== Reports: Portfolio history ==========
+@extend_schema(
+    tags=["Reports"],
+    parameters=[
+        OpenApiParameter(name="display_currency", required=False, type=str, description="عملة العرض (إن لم تُرسل نستخدم عملة المستخدم)"),
+        OpenApiParameter(name="date_from", required=False, type=str, description="YYYY-MM-DD (افتراضيًا قبل 365 يومًا)"),
+        OpenApiParameter(name="date_to", required=False, type=str, description="YYYY-MM-DD (افتراضيًا اليوم)"),
+    ],
+    responses={200: dict, 304: None},
+)
+@api_view(["GET"])
+@conditional_etag(_portfolio_history_validator)
+def report_portfolio_history(request):
+    """
+    قيمة المحفظة اليومية المخزّنة (يملؤها أمر build_portfolio_history) بعملة العرض.
+    """
+    try:
+        dto = date.fromisoformat(request.query_params["date_to"]) if request.query_params.get("date_to") else timezone.localdate()
+        dfrom = date.fromisoformat(request.query_params["date_from"]) if request.query_params.get("date_from") else dto - timedelta(days=365)
+    except ValueError:
+        return Response({"detail": "صيغة التاريخ غير صحيحة. استخدم YYYY-MM-DD."}, status=400)
+    if dto < dfrom:
+        return Response({"detail": "date_to يجب أن يكون >= date_from."}, status=400)
+
+    data = portfolio_history_in_display(request.user, dfrom, dto, request.query_params.get("display_currency"))
+    return Response(data, status=200)
+
+
 # ========== Reports: Zakat Overview ==========
-@extend_schema(tags=["Reports"], responses={200: ZakatOverviewSerializer})
+@extend_schema(tags=["Reports"], responses={200: ZakatOverviewSerializer, 304: None})
 @api_view(["GET"])
+@conditional_etag(_report_validator("zk", daily=True, anchors=True))
 def report_zakat_overview(request):
     """
     نظرة الزكاة:
@@ -840,13 +941,15 @@ def report_zakat_overview(request):
     - karat: 18 | 21 | 24 للذهب
     - date_from, date_to: YYYY-MM-DD
     - search: نص في الملاحظات
-    - page: رقم الصفحة (افتراضي 1), page_size: افتراضي 20
+    - page, page_size: الترقيم بالإزاحة (الافتراضي، كما كان)
+    - cursor: ترقيم بالمؤشر (اختياري؛ فارغ للصفحة الأولى): next/previous مؤشرات معتمة (الأحدث أولًا)،
+      page_size حتى 100، و count محدود بـ PAGINATION_COUNT_CAP مع count_exact
     """
 )
 @api_view(["GET"])
 def report_transactions(request):
     user = request.user
-    qs = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True).order_by("-created_at")
+    qs = Transaction.objects.filter(user=user, soft_deleted_at__isnull=True).order_by("-created_at", "-id")
 
     # فلاتر
     asset_type = request.query_params.get("asset_type")
@@ -882,15 +985,27 @@ def report_transactions(request):
     if search:
         qs = qs.filter(Q(notes__icontains=search))
 
-    # ترقيم الصفحات
-    page = int(request.query_params.get("page", 1))
+    # ترقيم الصفحات: بالإزاحة كما كان، وبالمؤشر فقط إن أرسل العميل cursor (مثل notifications/delta)
     page_size = int(request.query_params.get("page_size", 20))
-    paginator = Paginator(qs, page_size)
-    page_obj = paginator.get_page(page)
+    extra = {}
+    if "cursor" in request.query_params:
+        try:
+            page = keyset_page(qs, request.query_params.get("cursor"), max(1, min(page_size, 100)))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+        rows, next_, previous = page["items"], page["next"], page["previous"]
+        count, extra["count_exact"] = capped_count(qs)
+    else:
+        paginator = Paginator(qs, page_size)
+        page_obj = paginator.get_page(int(request.query_params.get("page", 1)))
+        rows = page_obj.object_list
+        count = paginator.count
+        next_ = page_obj.next_page_number() if page_obj.has_next() else None
+        previous = page_obj.previous_page_number() if page_obj.has_previous() else None
 
     # نفس شكل عناصر recent_transactions
     results = []
-    for tx in page_obj.object_list:
+    for tx in rows:
         results.append({
             "id": tx.id,
             "asset_type": tx.asset_type,
@@ -906,9 +1021,10 @@ def report_transactions(request):
         })
 
     data = {
-        "count": paginator.count,
-        "next": page_obj.next_page_number() if page_obj.has_next() else None,
-        "previous": page_obj.previous_page_number() if page_obj.has_previous() else None,
+        "count": count,
+        **extra,
+        "next": next_,
+        "previous": previous,
         "results": results,
     }
     return Response(data, status=200)
@@ -933,10 +1049,12 @@ from .utils import build_reports_dashboard  # تأكد أن الدالة موج
         OpenApiParameter(name="preset", required=False, type=str, description="last_month | last_6_months | last_year"),
         OpenApiParameter(name="date_from", required=False, type=str, description="YYYY-MM-DD (للتخصيص)"),
         OpenApiParameter(name="date_to", required=False, type=str, description="YYYY-MM-DD (للتخصيص)"),
+        OpenApiParameter(name="valuation", required=False, type=str, description="current (افتراضي) | transaction_date: التقييم بأسعار تاريخ كل معاملة"),
     ],
-    responses={200: dict},
+    responses={200: dict, 304: None},
 )
 @api_view(["GET"])
+@conditional_etag(_report_validator("dash", daily=True))
 def report_dashboard(request):
     user = request.user
 
@@ -950,6 +1068,9 @@ def report_dashboard(request):
     preset = request.query_params.get("preset") or None
     dfrom  = request.query_params.get("date_from") or None
     dto    = request.query_params.get("date_to") or None
+    valuation = request.query_params.get("valuation") or "current"
+    if valuation not in DASHBOARD_VALUATIONS:
+        return Response({"detail": "valuation يجب أن تكون current أو transaction_date."}, status=400)
 
     # 3) تحليل الفترة محلياً (آمن)
     today = date.today()
@@ -981,7 +1102,7 @@ def report_dashboard(request):
         return Response({"detail": "صيغة التاريخ غير صحيحة. استخدم YYYY-MM-DD."}, status=400)
 
     # 4) بناء التقرير
-    ui = build_reports_dashboard(user, disp, start, end)  # تأكد أن هذه الدالة موجودة فعليًا في utils.py (انظر الخطوة 2)
+    ui = build_reports_dashboard(user, disp, start, end, valuation=valuation)  # تأكد أن هذه الدالة موجودة فعليًا في utils.py (انظر الخطوة 2)
     # عنوان البطاقات
     ui.setdefault("sections", {})
     ui["sections"].setdefault("added", {}).setdefault("title", "الأصول المضافة")
@@ -995,11 +1116,13 @@ def report_dashboard(request):
             "from": start.isoformat(),
             "to":   end.isoformat(),
         },
+        "valuation": valuation,
         "sections": {
             "added": ui["sections"].get("added", {}),
             "withdrawn": ui["sections"].get("withdrawn", {}),
             "zakat_paid": ui["sections"].get("zakat_paid", {}),
         },
+        "series": ui.get("series", []),
         "generated_at": timezone.now().isoformat(),
     }
     return Response(payload, status=200)
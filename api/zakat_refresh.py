@@ -0,0 +1,92 @@
+# api/zakat_refresh.py
+"""
+إعادة تقييم الزكاة على مسارات heartbeat/login بدون تكلفة في كل نداء:
+- ختم تقييم لكل مستخدم = (snapshot_version، جيل الأسعار، اليوم المحلي أو الساعة في وضع الاختبار).
+  إن لم يتغير منذ آخر تقييم فلا شيء تغيّر يمس الأحوال أو التذكيرات => نتخطى.
+  الختم في Profile.zakat_eval_stamp لا في الكاش: كاش locmem خاص بكل عملية، فكان كل عامل gunicorn
+  يعيد التقييم لنفسه؛ وprofile محمّل أصلًا في هذه المسارات فالقراءة بلا استعلام إضافي.
+- heartbeat يرسل التقييم لمنفّذ خلفي صغير داخل العملية (مستخدم واحد في الطابور مرة واحدة)؛
+  login يقيّم مباشرة عند الحاجة لأنه يعيد لقطة كاملة.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Profile
+from .rates import rates_generation
+from .utils import update_zakat_anchors_and_reminders
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def evaluation_stamp(profile) -> str:
+    now = timezone.localtime()
+    period = now.strftime("%Y-%m-%dT%H") if getattr(settings, "ZAKAT_TEST_MODE", False) else now.date().isoformat()
+    return f"{profile.snapshot_version}:{rates_generation()}:{period}"
+
+
+def needs_evaluation(user) -> bool:
+    """قراءة profile (محمّل غالبًا) + جيل الأسعار؛ بلا استعلامات تقييم."""
+    return user.profile.zakat_eval_stamp != evaluation_stamp(user.profile)
+
+
+def evaluate_now(user, ctx=None) -> bool:
+    """يقيّم إن تغيّر الختم ثم يحفظ الختم الجديد (بعد التقييم: قد يرفع إشعارٌ نسخةَ اللقطة)."""
+    if not needs_evaluation(user):
+        return False
+    update_zakat_anchors_and_reminders(user, ctx)
+    # كل الحقول لا snapshot_version وحدها: أرقام الأقسام و updated_at تبني الدلتا و ETag في نفس الطلب
+    user.profile.refresh_from_db()
+    stamp = evaluation_stamp(user.profile)
+    Profile.objects.filter(pk=user.profile.pk).update(zakat_eval_stamp=stamp)
+    user.profile.zakat_eval_stamp = stamp
+    return True
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, "ZAKAT_EVAL_WORKERS", 2),
+                                           thread_name_prefix="zakat-eval")
+        return _executor
+
+
+def _run(user_id):
+    from django.contrib.auth import get_user_model
+
+    close_old_connections()
+    try:
+        user = get_user_model().objects.select_related("profile", "usersettings").get(pk=user_id)
+        evaluate_now(user)
+    except Exception:
+        logger.exception("zakat evaluation failed for user %s", user_id)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(user_id)
+        close_old_connections()
+
+
+def schedule_evaluation(user) -> bool:
+    """
+    يرسل التقييم للخلفية إن كان الختم قديمًا (ولم يكن المستخدم في الطابور).
+    ZAKAT_EVAL_ASYNC=False: تقييم مباشر في نفس الطلب (الاختبارات/عامل واحد).
+    """
+    if not needs_evaluation(user):
+        return False
+    if not getattr(settings, "ZAKAT_EVAL_ASYNC", True):
+        return evaluate_now(user)
+    with _executor_lock:
+        if user.pk in _in_flight:
+            return False
+        _in_flight.add(user.pk)
+    _get_executor().submit(_run, user.pk)
+    return True
@@ -0,0 +1,51 @@
+# api/zakat_sync.py
+"""
+عمل أمر sync_zakat على دفعات من المستخدمين، داخل العملية نفسها أو في عمليات منفصلة (--workers).
+ملاحظة: الاستيرادات داخل الدوال عمدًا؛ عمليات spawn تستورد هذا الملف قبل django.setup().
+"""
+
+
+def init_worker():
+    """مُهيّئ كل عملية في الـ pool (spawn): تجهيز Django مرة واحدة."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def sync_users(user_ids, dirty_before=None) -> dict:
+    """
+    يحدّث نقاط الحول وجدول التذكيرات لدفعة مستخدمين: تقييم نصاب مجمّع (nisab_batch)
+    وكتابة مجمّعة؛ إن فشلت الدفعة نعود لمستخدم-مستخدم لعزل الخطأ.
+    dirty_before: إن أُعطي نحذف من طابور ZakatDirtyUser من نجحت معالجته وعُلِّم قبل هذا الوقت
+    (من عُلِّم أثناء التشغيل يبقى للتشغيل التالي، ومن فشل يبقى لإعادة المحاولة).
+    يرجع {"last_id", "processed", "failed", "errors": [(user_id, message)]}.
+    """
+    from django.contrib.auth import get_user_model
+    from .models import ZakatDirtyUser
+    from .nisab_batch import apply_nisab_results, evaluate_nisab_batch
+    from .utils import update_zakat_anchors_and_reminders
+
+    User = get_user_model()
+    processed = failed = 0
+    errors = []
+    done = []
+    try:
+        results = evaluate_nisab_batch(user_ids)
+        apply_nisab_results(results)
+        done = sorted(results)
+        processed = len(done)
+    except Exception:
+        users = User.objects.filter(id__in=user_ids).select_related("usersettings", "profile").order_by("id")
+        for user in users:
+            try:
+                update_zakat_anchors_and_reminders(user)
+                processed += 1
+                done.append(user.id)
+            except Exception as e:
+                failed += 1
+                errors.append((user.id, str(e)))
+    if dirty_before is not None and done:
+        ZakatDirtyUser.objects.filter(user_id__in=done, marked_at__lte=dirty_before).delete()
+    return {"last_id": max(user_ids) if user_ids else 0, "processed": processed, "failed": failed, "errors": errors}
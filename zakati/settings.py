@@ -128,6 +128,32 @@ STORAGES = {
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# === الكاش (بدون خدمات خارجية) ===
+# locmem: ذاكرة كل عامل على حدة | file: مجلد مشترك بين عمّال gunicorn على نفس الجهاز
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem").lower()
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_LOCATION", os.path.join(BASE_DIR, ".cache")),
+            "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "zakati",
+            "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))},
+        }
+    }
+
+# مدة بقاء لقطة bootstrap في الكاش (ثواني). المفتاح يتضمن snapshot_version فلا تُقدَّم لقطة قديمة.
+SNAPSHOT_CACHE_TIMEOUT = int(os.getenv("SNAPSHOT_CACHE_TIMEOUT", "3600"))
+
+# حد العدّ في الترقيم بالمؤشر (?cursor=): COUNT على أول N صف فقط (count_exact=False إن بلغه)
+PAGINATION_COUNT_CAP = int(os.getenv("PAGINATION_COUNT_CAP", "1000"))
+
 # === CORS للتطوير ===
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -137,6 +163,17 @@ ZAKAT_TEST_MODE = False          # إذا True: الحَول = عدد أيام 
 ZAKAT_TEST_CYCLE_DAYS = 1        # مدة "الحَول" في الاختبار (مثلاً: 1 يوم)
 ZAKAT_TEST_REMINDERS_HOURS = [6, 1, 0, -6]  
 # نقاط التذكير في الاختبار (بالساعات): قبل 6 ساعات، قبل ساعة، وقت الاستحقاق، بعد 6 ساعات
+# heartbeat يعيد تقييم الزكاة في خيوط خلفية (False = داخل الطلب) فقط عند تغيّر اللقطة/الأسعار/اليوم
+ZAKAT_EVAL_ASYNC = os.getenv("ZAKAT_EVAL_ASYNC", "1") == "1"
+ZAKAT_EVAL_WORKERS = int(os.getenv("ZAKAT_EVAL_WORKERS", "2"))
+
+# ===== notifications/stream (SSE / long-poll عبر ASGI) =====
+# كل كم ثانية يقرأ مستطلع العامل snapshot_version لكل المشتركين (كتابات العمليات الأخرى)
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "5"))
+STREAM_LONGPOLL_SECONDS = float(os.getenv("STREAM_LONGPOLL_SECONDS", "25"))
+STREAM_PING_SECONDS = float(os.getenv("STREAM_PING_SECONDS", "15"))
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "300"))  # ثم يعيد العميل الاتصال
+STREAM_TICKET_SECONDS = int(os.getenv("STREAM_TICKET_SECONDS", "60"))  # عمر تذكرة ?ticket= (تُطلب من جديد عند انتهائها)
 
 # ===== قيود حجم/ذاكرة افتراضية معقولة =====
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024    # 5MB للـ JSON
@@ -146,6 +183,17 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
 # === عام ===
 RATES_HTTP_TIMEOUT = int(os.getenv("RATES_HTTP_TIMEOUT", "8"))  # ثواني
 RATES_HTTP_RETRIES = int(os.getenv("RATES_HTTP_RETRIES", "2"))
+# مدة صلاحية دفتر الأسعار في ذاكرة العامل (ثواني)؛ يُعاد التحميل فورًا عند رفع جيل الأسعار
+RATES_CACHE_TTL = int(os.getenv("RATES_CACHE_TTL", "300"))
+# كل كم ثانية يقرأ العامل جيل الأسعار من قاعدة البيانات (رفعٌ من عملية أخرى يصل خلالها)
+RATES_GENERATION_POLL_SECONDS = float(os.getenv("RATES_GENERATION_POLL_SECONDS", "5"))
+# عدد طلبات المزوّدين المتوازية في fetch_rates (1 = تسلسلي) وحجم تجمّع اتصالات HTTP
+RATES_FETCH_CONCURRENCY = int(os.getenv("RATES_FETCH_CONCURRENCY", "4"))
+RATES_HTTP_POOL_SIZE = int(os.getenv("RATES_HTTP_POOL_SIZE", "10"))
+# تسامح نسبي لاعتبار السعر "لم يتغير" (0 = تطابق تام): لا يُدرج صف جديد بل يُحدَّث last_confirmed_at
+RATES_CHANGE_TOLERANCE = os.getenv("RATES_CHANGE_TOLERANCE", "0")
+# الاحتفاظ بصفوف الأسعار الخام (أيام)؛ الأقدم يُدمج في ملخصات يومية عبر prune_rates
+RATES_RAW_RETENTION_DAYS = int(os.getenv("RATES_RAW_RETENTION_DAYS", "90"))
 
 # === تفعيل/تعطيل مزوّدين (افتراضيًا معطّل) ===
 ENABLE_FX_PROVIDER = os.getenv("ENABLE_FX_PROVIDER", "0") == "1"
@@ -153,6 +201,7 @@ ENABLE_METALS_PROVIDER = os.getenv("ENABLE_METALS_PROVIDER", "0") == "1"
 
 # === FX Provider (مثال: exchangerate.host - مجاني) ===
 FX_PROVIDER_NAME = os.getenv("FX_PROVIDER_NAME", "exchangerate_host")
+FX_API_URL = os.getenv("FX_API_URL", "https://api.exchangerate.host")
 FX_BASE_CURRENCY = os.getenv("FX_BASE_CURRENCY", "USD")
 # أزواج مهمة مسبقًا (يمكن توسيعها)
 FX_TARGETS = os.getenv("FX_TARGETS", "SYP,MYR,USD").split(",")
@@ -161,9 +210,11 @@ FX_TARGETS = os.getenv("FX_TARGETS", "SYP,MYR,USD").split(",")
 METALS_PROVIDER_NAME = os.getenv("METALS_PROVIDER_NAME", "none")
 # مثال GoldAPI:
 GOLDAPI_API_KEY = os.getenv("GOLDAPI_API_KEY", "")
+GOLDAPI_URL = os.getenv("GOLDAPI_URL", "https://www.goldapi.io")
 # أو metals-api.com:
 METALSAPI_ACCESS_KEY = os.getenv("METALSAPI_ACCESS_KEY", "")
 METALSAPI_BASE = os.getenv("METALSAPI_BASE", "USD")
+METALSAPI_URL = os.getenv("METALSAPI_URL", "https://metals-api.com")
 
 
 